@@ -0,0 +1,166 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import struct
+import numpy
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+class AudioFileError(Exception):
+    """Raised when an audio file cannot be read."""
+
+class WaveFile(object):
+    """Memory-mapped reader for the PCM data chunk of a RIFF/WAVE file.
+
+    Samples are never loaded as a whole: every read maps only the requested
+    range of frames, so memory usage is bounded by the size of the range."""
+
+    def __init__(self, filename):
+        """Constructor."""
+
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._parseHeader()
+        except Exception:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the underlying file."""
+
+        self._file.close()
+
+    def _parseHeader(self):
+        """Locate the fmt and data chunks and read the sample format."""
+
+        riff, unused_size, wave = struct.unpack("<4sI4s", self._file.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise AudioFileError("%s is not a RIFF/WAVE file" % self.filename)
+
+        fileSize = os.fstat(self._file.fileno()).st_size
+        formatChunk = None
+        while True:
+            header = self._file.read(8)
+            if len(header) < 8:
+                raise AudioFileError("%s has no data chunk" % self.filename)
+            chunkId, chunkSize = struct.unpack("<4sI", header)
+            if chunkId == b"fmt ":
+                formatChunk = self._file.read(chunkSize)
+                self._file.seek(chunkSize % 2, os.SEEK_CUR)
+            elif chunkId == b"data":
+                if formatChunk is None:
+                    raise AudioFileError("%s has no fmt chunk before its data" % self.filename)
+                self.offset = self._file.tell()
+                # Streamed files may leave the size unset, trust the file length instead
+                dataSize = min(chunkSize, fileSize - self.offset)
+                break
+            else:
+                self._file.seek(chunkSize + chunkSize % 2, os.SEEK_CUR)
+
+        (audioFormat, self.channels, self.srate,
+         unused_byteRate, blockAlign, bits) = struct.unpack("<HHIIHH", formatChunk[:16])
+        if audioFormat == WAVE_FORMAT_EXTENSIBLE and len(formatChunk) >= 26:
+            audioFormat, = struct.unpack("<H", formatChunk[24:26])
+
+        self.sampwidth = blockAlign // self.channels
+        if audioFormat == WAVE_FORMAT_PCM and self.sampwidth in (1, 2, 3, 4):
+            self.dtype = {1: "u1", 2: "<i2", 3: "u1", 4: "<i4"}[self.sampwidth]
+        elif audioFormat == WAVE_FORMAT_IEEE_FLOAT and self.sampwidth in (4, 8):
+            self.dtype = {4: "<f4", 8: "<f8"}[self.sampwidth]
+        else:
+            raise AudioFileError("Unsupported WAVE format %#06x with %i bits per sample"
+                                 % (audioFormat, bits))
+
+        self.format = audioFormat
+        self.frameBytes = blockAlign
+        self.nframes = dataSize // blockAlign
+
+    def _map(self, start, count):
+        """Map a range of frames as an array of shape (count, channels)."""
+
+        shape = (count, self.channels, 3) if self.sampwidth == 3 else (count, self.channels)
+        return numpy.memmap(self._file, dtype=self.dtype, mode='r', shape=shape,
+                            offset=self.offset + start * self.frameBytes)
+
+    def _decode(self, data):
+        """Convert raw samples that have no native NumPy representation."""
+
+        if self.format != WAVE_FORMAT_PCM:
+            return data
+        if self.sampwidth == 1:
+            # 8-bit PCM is unsigned, center it around zero
+            return data.astype(numpy.int16) - 128
+        if self.sampwidth == 3:
+            data = data.astype(numpy.int32)
+            data = data[..., 0] | (data[..., 1] << 8) | (data[..., 2] << 16)
+            return data - ((data & 0x800000) << 1)
+        return data
+
+    def frames(self, start=0, count=None, channel=None, dtype=None):
+        """Return a one-dimensional array of samples for a range of frames.
+
+        When channel is None, every channel is mixed down to mono. Otherwise,
+        only the given channel is returned. Mono and single-channel reads of
+        16-bit, 32-bit and float files are zero-copy views of the mapping,
+        unless a sample type to convert to is given."""
+
+        if count is None:
+            count = self.nframes - start
+        count = max(0, min(count, self.nframes - start))
+        if count == 0:
+            return numpy.zeros(0, dtype=dtype)
+
+        data = self._map(start, count)
+        if self.channels == 1 or channel is not None:
+            samples = self._decode(data[:, channel or 0])
+            return samples if dtype is None else samples.astype(dtype, copy=False)
+        # Mixing down only copies the requested range
+        return self._decode(data).mean(axis=1, dtype=dtype)
+
+    def fullScale(self):
+        """Return the largest amplitude a decoded sample can have."""
+
+        if self.format != WAVE_FORMAT_PCM:
+            return 1.0
+        return float(2 ** (8 * self.sampwidth - 1))
+
+    def blocks(self, blocksize, maxBlocks, channel=None, dtype=None, first=0, count=None):
+        """Yield arrays of shape (n, blocksize) with n <= maxBlocks covering
+        count complete blocks from block first, or every complete block from
+        it if count is None. Incomplete trailing blocks are dropped."""
+
+        total = self.nframes // blocksize
+        end = total if count is None else min(total, first + count)
+        for start in range(first, end, maxBlocks):
+            n = min(maxBlocks, end - start)
+            samples = self.frames(start * blocksize, n * blocksize, channel, dtype)
+            yield samples.reshape(n, blocksize)
@@ -0,0 +1,354 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import json
+import math
+import time
+import bisect
+import shutil
+import argparse
+import tempfile
+import itertools
+import numpy
+import benchmark
+import presets
+import transcribe
+from rhythm import STANDARD_LENGTHS, DOTTED_LENGTHS, TRIPLET_LENGTHS
+
+SAMPLE_RATE = benchmark.SAMPLE_RATE
+ONSET_TOLERANCE = 0.1 # Seconds between the onsets of a transcribed note and of the note it matches
+DEFAULT_PITCHES = (48, 84) # MIDI pitches of the melodies when no instrument is given
+
+# Values of every swept parameter
+DEFAULT_GRID = {
+    "blocksize": [256, 512, 1024],
+    "smoothLevels": [3, 5, 7, 9],
+    "minNoteFrames": [3, 6, 9],
+    "minRestFrames": [5, 10, 15],
+    "durations": ["standard", "dotted", "triplets", "all"],
+}
+
+# Accuracy metrics: notes must match the pitch and onset of reference notes,
+# and also their duration once quantized with the duration metric
+METRICS = {"note": "noteF1", "duration": "durationF1"}
+
+def melodyLengths(durations):
+    """Return the quarter lengths melodies are written with, given the name
+    of a duration table."""
+
+    (dotted, triplets) = transcribe.DURATION_TABLES[durations]
+    return STANDARD_LENGTHS + (DOTTED_LENGTHS if dotted else ()) + (TRIPLET_LENGTHS if triplets else ())
+
+def instrumentPitches(instrument):
+    """Return the range of MIDI pitches of the melodies of an instrument."""
+
+    if instrument is None:
+        return DEFAULT_PITCHES
+    (fmin, fmax) = transcribe.INSTRUMENT_PRESETS[instrument]
+    low = int(math.ceil(69 + 12 * math.log(fmin / 440.0, 2)))
+    high = int(math.floor(69 + 12 * math.log(fmax / 440.0, 2)))
+    return low, high
+
+def randomMelody(seconds, lengths, pitches, restProbability=0.15, seed=0):
+    """Return the tempo in quarter notes per minute and a list of (MIDI pitch
+    or None for rests, quarter length) tuples of a random melody lasting at
+    least the given number of seconds. Consecutive notes have different
+    pitches, so that every note has an onset the transcription can find."""
+
+    rng = numpy.random.RandomState(seed)
+    tempo = float(rng.randint(80, 141))
+    notes = []
+    previous = None
+    elapsed = 0.0
+    while elapsed < seconds:
+        quarterLength = float(rng.choice(lengths))
+        midi = None
+        if not notes or rng.rand() >= restProbability:
+            midi = previous
+            while midi == previous:
+                midi = int(rng.randint(pitches[0], pitches[1] + 1))
+        notes.append((midi, quarterLength))
+        previous = midi
+        elapsed += quarterLength * 60.0 / tempo
+    return tempo, notes
+
+def renderMelody(tempo, notes, harmonics=4, seed=0):
+    """Synthesize a melody as 16-bit samples. Return a tuple of the samples
+    and the list of (MIDI pitch, onset in seconds, quarter length) tuples of
+    its notes."""
+
+    rng = numpy.random.RandomState(seed)
+    chunks = []
+    reference = []
+    position = 0
+    for midi, quarterLength in notes:
+        length = int(round(quarterLength * 60.0 / tempo * SAMPLE_RATE))
+        chunk = numpy.zeros(length)
+        if midi is not None:
+            frequency = 440.0 * 2 ** ((midi - 69) / 12.0)
+            t = numpy.arange(length) / float(SAMPLE_RATE)
+            envelope = numpy.minimum(1.0, numpy.minimum(t, t[::-1]) * 200)
+            for harmonic in range(1, harmonics + 1):
+                if frequency * harmonic < SAMPLE_RATE / 2:
+                    chunk += envelope / harmonic * numpy.sin(2 * numpy.pi * frequency * harmonic * t)
+            reference.append((midi, position / float(SAMPLE_RATE), quarterLength))
+        chunks.append(chunk)
+        position += length
+
+    samples = numpy.concatenate(chunks)
+    samples += rng.randn(len(samples)) * 0.001
+    samples *= 0.5 / max(1.0, numpy.abs(samples).max())
+    return (samples * 32767).astype(numpy.int16), reference
+
+def createFixtures(directory, count, seconds, durations="standard", instrument=None):
+    """Synthesize melodies and return a list of (path, reference notes,
+    duration in seconds) tuples."""
+
+    fixtures = []
+    for index in range(count):
+        (tempo, notes) = randomMelody(seconds, melodyLengths(durations), instrumentPitches(instrument), seed=index)
+        (samples, reference) = renderMelody(tempo, notes, seed=index)
+        filename = os.path.join(directory, "melody-%i.wav" % index)
+        benchmark.writeWave(filename, samples)
+        fixtures.append((filename, reference, len(samples) / float(SAMPLE_RATE)))
+    return fixtures
+
+def matchNotes(quantized, reference, frameDuration, tolerance=ONSET_TOLERANCE):
+    """Match transcribed notes, given as (event, quarter length) tuples, to
+    reference notes with the same pitch and an onset within tolerance
+    seconds. Return a tuple of the number of transcribed notes, the number
+    of matches and the number of matches whose quantized duration is right,
+    up to a power of two common to the whole melody, since the tempo of a
+    transcription is only known up to one."""
+
+    notes = [(int(round(event.midi)), event.start * frameDuration, quarterLength)
+             for event, quarterLength in quantized if event.name is not None]
+    onsets = [note[1] for note in notes]
+    used = [False] * len(notes)
+
+    pairs = []
+    for midi, onset, quarterLength in reference:
+        best = None
+        first = bisect.bisect_left(onsets, onset - tolerance)
+        last = bisect.bisect_right(onsets, onset + tolerance)
+        for j in range(first, last):
+            if not used[j] and notes[j][0] == midi:
+                if best is None or abs(onsets[j] - onset) < abs(onsets[best] - onset):
+                    best = j
+        if best is not None:
+            used[best] = True
+            pairs.append((quarterLength, notes[best][2]))
+
+    durations = 0
+    if pairs:
+        scale = 2 ** round(math.log(numpy.median([expected / found for expected, found in pairs]), 2))
+        durations = sum(1 for expected, found in pairs if abs(found * scale - expected) < 1e-6)
+    return len(notes), len(pairs), durations
+
+def fMeasure(matches, found, expected):
+    """Return the harmonic mean of the precision and the recall."""
+
+    if matches == 0:
+        return 0.0
+    precision = float(matches) / found
+    recall = float(matches) / expected
+    return 2 * precision * recall / (precision + recall)
+
+def timed(function, args, repeat):
+    """Call a function repeatedly and return a tuple of its result and its
+    best wall time."""
+
+    best = None
+    for i in range(max(1, repeat)):
+        start = time.time()
+        result = function(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def sweep(fixtures, grid, settings=None, repeat=2, tolerance=ONSET_TOLERANCE, out=None):
+    """Transcribe the fixtures with every combination of the parameters of
+    the grid and return a list of results, one per configuration.
+
+    Frames are only analyzed once per block size, since the other parameters
+    only change the cheaper stages that follow, which are timed for every
+    configuration. The speed of a configuration is the number of seconds of
+    audio transcribed per second, frames per second depending on the block
+    size. settings are the other transcription options."""
+
+    settings = settings or {}
+    expected = sum(len(reference) for unused_filename, reference, unused_seconds in fixtures)
+    audioSeconds = sum(seconds for unused_filename, unused_reference, seconds in fixtures)
+
+    results = []
+    for blocksize in grid["blocksize"]:
+        options = transcribe.TranscriptionOptions(blocksize=blocksize, **settings)
+        tracks = []
+        analysisSeconds = 0.0
+        for filename, unused_reference, unused_seconds in fixtures:
+            (track, elapsed) = timed(transcribe.analyzeAudioFile, (filename, options), repeat)
+            tracks.append(track)
+            analysisSeconds += elapsed
+        frames = sum(len(track) for track in tracks)
+        if out is not None:
+            out.write("block size %i: %i frames analyzed in %.2f s\n" % (blocksize, frames, analysisSeconds))
+
+        for smoothLevels, minNoteFrames, minRestFrames in itertools.product(grid["smoothLevels"],
+                                                                              grid["minNoteFrames"],
+                                                                              grid["minRestFrames"]):
+            options = transcribe.TranscriptionOptions(blocksize=blocksize, smoothLevels=smoothLevels,
+                                                      minNoteFrames=minNoteFrames, minRestFrames=minRestFrames,
+                                                      **settings)
+            fileEvents = []
+            seconds = analysisSeconds
+            for track in tracks:
+                (events, elapsed) = timed(transcribe.eventsFromTrack, (track, options), repeat)
+                fileEvents.append(events)
+                seconds += elapsed
+
+            for durations in grid["durations"]:
+                table = transcribe.getDurationTable(*transcribe.DURATION_TABLES[durations])
+                (found, matches, durationMatches) = (0, 0, 0)
+                for (unused_filename, reference, unused_seconds), track, events in zip(fixtures, tracks, fileEvents):
+                    quantized = transcribe.quantizeEvents(events, durationTable=table)
+                    counts = matchNotes(quantized, reference, track.frameDuration(), tolerance)
+                    found += counts[0]
+                    matches += counts[1]
+                    durationMatches += counts[2]
+
+                results.append({
+                    "options": {"blocksize": blocksize, "smoothLevels": smoothLevels, "minNoteFrames": minNoteFrames,
+                                "minRestFrames": minRestFrames, "durations": durations},
+                    "noteF1": fMeasure(matches, found, expected),
+                    "durationF1": fMeasure(durationMatches, found, expected),
+                    "framesPerSecond": frames / seconds if seconds else None,
+                    "realtime": audioSeconds / seconds if seconds else None,
+                })
+    return results
+
+def paretoFront(results, metric="note"):
+    """Return the results no other result is at least as accurate and as fast
+    as, and better at one of them, from the fastest to the most accurate."""
+
+    key = METRICS[metric]
+    front = []
+    for result in results:
+        dominated = False
+        for other in results:
+            if (other[key] >= result[key] and other["realtime"] >= result["realtime"] and
+                    (other[key] > result[key] or other["realtime"] > result["realtime"])):
+                dominated = True
+                break
+        if not dominated:
+            front.append(result)
+    return sorted(front, key=lambda result: (-result["realtime"], -result[key]))
+
+def choose(front, metric="note", minAccuracy=0.0):
+    """Return the fastest result of a Pareto front that is accurate enough,
+    or the most accurate one if none is."""
+
+    key = METRICS[metric]
+    accurate = [result for result in front if result[key] >= minAccuracy]
+    if accurate:
+        return max(accurate, key=lambda result: (result["realtime"], result[key]))
+    return max(front, key=lambda result: (result[key], result["realtime"]))
+
+def printResults(results, metric="note", out=None):
+    """Print a table of results."""
+
+    out = out or sys.stdout
+    out.write("%9s %6s %8s %8s %-9s %8s %8s %12s %9s\n" % ("blocksize", "smooth", "minNote", "minRest", "durations",
+                                                          "noteF1", "durF1", "frames/s", "realtime"))
+    for result in results:
+        options = result["options"]
+        out.write("%9i %6i %8i %8i %-9s %8.3f %8.3f %12.0f %8.1fx\n"
+                  % (options["blocksize"], options["smoothLevels"], options["minNoteFrames"],
+                     options["minRestFrames"], options["durations"], result["noteF1"], result["durationF1"],
+                     result["framesPerSecond"], result["realtime"]))
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="sweep transcription parameters on synthetic melodies and save the "
+                                                 "fastest configuration meeting an accuracy bar as a preset")
+    parser.add_argument("--instrument", choices=sorted(transcribe.INSTRUMENT_PRESETS),
+                        help="tune for the range of an instrument, whose preset limits the pitch search")
+    parser.add_argument("--name", type=str, help="name of the preset (the instrument or \"tuned\" by default)")
+    parser.add_argument("--output", type=str, help="preset file path (in the preset directory by default)")
+    parser.add_argument("--no-preset", action="store_true", help="only report the results")
+    parser.add_argument("--metric", choices=sorted(METRICS), default="note",
+                        help="accuracy of pitches and onsets only, or of quantized durations as well")
+    parser.add_argument("--min-accuracy", type=float, default=0.9, help="accuracy bar of the preset, from 0 to 1")
+    parser.add_argument("--fixtures", type=int, default=4, help="number of synthetic melodies")
+    parser.add_argument("--seconds", type=float, default=20, help="duration of every melody")
+    parser.add_argument("--melody-durations", choices=sorted(transcribe.DURATION_TABLES), default="standard",
+                        help="note lengths the melodies are written with")
+    parser.add_argument("--blocksizes", type=int, nargs="+", default=DEFAULT_GRID["blocksize"])
+    parser.add_argument("--smooth-levels", type=int, nargs="+", default=DEFAULT_GRID["smoothLevels"])
+    parser.add_argument("--min-note-frames", type=int, nargs="+", default=DEFAULT_GRID["minNoteFrames"])
+    parser.add_argument("--min-rest-frames", type=int, nargs="+", default=DEFAULT_GRID["minRestFrames"])
+    parser.add_argument("--durations", choices=sorted(transcribe.DURATION_TABLES), nargs="+",
+                        default=DEFAULT_GRID["durations"], help="duration tables to quantize with")
+    parser.add_argument("--tolerance", type=float, default=ONSET_TOLERANCE,
+                        help="seconds between matching onsets")
+    parser.add_argument("--repeat", type=int, default=2, help="number of timed runs of every stage")
+    parser.add_argument("--results", type=str, help="write every result as JSON to this file")
+    args = parser.parse_args(argv)
+
+    grid = {"blocksize": args.blocksizes, "smoothLevels": args.smooth_levels,
+            "minNoteFrames": args.min_note_frames, "minRestFrames": args.min_rest_frames,
+            "durations": args.durations}
+    settings = {"instrument": args.instrument} if args.instrument else {}
+
+    directory = tempfile.mkdtemp(prefix="polyscribe-autotune-")
+    try:
+        fixtures = createFixtures(directory, args.fixtures, args.seconds, args.melody_durations, args.instrument)
+        results = sweep(fixtures, grid, settings, args.repeat, args.tolerance, sys.stderr)
+    finally:
+        shutil.rmtree(directory)
+
+    front = paretoFront(results, args.metric)
+    print("Pareto front of %i configurations:" % len(results))
+    printResults(front, args.metric)
+    if args.results:
+        with open(args.results, 'w') as f:
+            json.dump({"results": results, "front": front}, f, indent=2, sort_keys=True)
+
+    best = choose(front, args.metric, args.min_accuracy)
+    accuracy = best[METRICS[args.metric]]
+    if accuracy < args.min_accuracy:
+        print("No configuration reaches an accuracy of %.3f, the most accurate one reaches %.3f"
+              % (args.min_accuracy, accuracy))
+    if args.no_preset:
+        return 0
+
+    settings = dict(settings, **best["options"])
+    details = {"metric": args.metric, "accuracy": accuracy, "minAccuracy": args.min_accuracy,
+               "realtime": best["realtime"], "framesPerSecond": best["framesPerSecond"]}
+    name = args.name or args.instrument or "tuned"
+    path = presets.savePreset(name, settings, details, args.output)
+    print("Preset %s (%.1fx real time, %s accuracy %.3f) written to %s"
+          % (name, best["realtime"], args.metric, accuracy, path))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,282 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import csv
+import json
+import time
+import multiprocessing
+import render
+import convert
+import transcribe
+
+# Manifest keys overriding the transcription options of a job or of an input
+OPTION_KEYS = ("instrument", "fmin", "fmax", "decimate", "channel", "estimator", "minConfidence", "precision",
+               "silenceGate", "durations")
+
+class BatchJob(object):
+    """A score to convert from its stems, written to a destination path
+    (without extension) in a given format. The transcription options of
+    each stem can be given as a list, otherwise those of the batch are used."""
+
+    def __init__(self, inputs, output, format="pdf", options=None):
+        """Constructor."""
+
+        if format not in convert.OUTPUT_EXTENSIONS:
+            raise ValueError("Unknown output format: %s" % format)
+
+        self.inputs = [os.path.abspath(filename) for filename in inputs]
+        self.output = os.path.abspath(output)
+        self.format = format
+        self.options = options
+
+    def outputPath(self):
+        """Return the path of the file written by the job."""
+
+        return self.output + convert.OUTPUT_EXTENSIONS[self.format]
+
+    def missingInputs(self):
+        """Return the list of input files that do not exist."""
+
+        return [filename for filename in self.inputs if not os.path.isfile(filename)]
+
+def loadManifest(filename, format="pdf", options=None):
+    """Return the list of jobs described by a JSON or CSV manifest. Relative
+    paths are relative to the directory of the manifest.
+
+    A JSON manifest is a list of objects (or an object with a jobs list) with
+    an inputs list, an output path and an optional format. A CSV manifest has
+    a header row with output, inputs (separated by semicolons) and optional
+    format columns. Jobs without a format use the given one.
+
+    Jobs may also have instrument, fmin, fmax, decimate, channel, estimator,
+    minConfidence, precision, silenceGate and durations values overriding the
+    given transcription options. In JSON manifests, an input
+    can be an object with a path and its own values of these keys."""
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    with open(filename, 'r') as f:
+        if filename.lower().endswith(".csv"):
+            entries = []
+            for row in csv.DictReader(f):
+                inputs = [path.strip() for path in (row.get("inputs") or "").split(";") if path.strip()]
+                entry = {"inputs": inputs, "output": row.get("output"), "format": row.get("format")}
+                for key in OPTION_KEYS:
+                    if row.get(key):
+                        entry[key] = _csvValue(key, row[key])
+                entries.append(entry)
+        else:
+            entries = json.load(f)
+            if isinstance(entries, dict):
+                entries = entries.get("jobs", [])
+
+    jobs = []
+    for number, entry in enumerate(entries, 1):
+        if not entry.get("output") or not entry.get("inputs"):
+            raise ValueError("Job %i of %s needs an output path and at least one input" % (number, filename))
+        inputs = []
+        inputOptions = []
+        for item in entry["inputs"]:
+            if not isinstance(item, dict):
+                item = {"path": item}
+            settings = dict((key, entry[key]) for key in OPTION_KEYS if key in entry)
+            settings.update((key, item[key]) for key in OPTION_KEYS if key in item)
+            inputs.append(os.path.join(directory, item["path"]))
+            inputOptions.append(_overrideOptions(options, settings) if settings else options)
+        if all(inputOption is options for inputOption in inputOptions):
+            inputOptions = None
+        jobs.append(BatchJob(inputs, os.path.join(directory, entry["output"]), entry.get("format") or format,
+                             inputOptions))
+    return jobs
+
+def _csvValue(key, value):
+    """Convert the cell of a CSV manifest to the type of an option."""
+
+    value = value.strip()
+    if key in ("instrument", "estimator", "precision", "durations"):
+        return value
+    if key == "silenceGate" and value.lower() == "auto":
+        return "auto"
+    if key == "decimate":
+        if value.lower() in ("true", "yes", "1"):
+            return True
+        if value.lower() in ("false", "no", "0"):
+            return False
+        raise ValueError("decimate must be true or false: %s" % value)
+    return float(value)
+
+def _overrideOptions(options, settings):
+    """Return a copy of transcription options with some values replaced. An
+    instrument preset replaces the pitch range unless it is also given."""
+
+    values = dict(vars(options or transcribe.TranscriptionOptions()))
+    if "instrument" in settings:
+        values.pop("fmin")
+        values.pop("fmax")
+    values.update(settings)
+    if values.get("channel") is not None:
+        values["channel"] = int(values["channel"])
+    return transcribe.TranscriptionOptions(**values)
+
+class BatchJournal(object):
+    """Append-only log of finished jobs, one JSON object per line, used to
+    resume an interrupted batch."""
+
+    def __init__(self, filename):
+        """Constructor."""
+
+        self.filename = filename
+
+    def completed(self):
+        """Return a dictionary of the output paths of the jobs that succeeded,
+        mapped to their journal record."""
+
+        completed = {}
+        if not os.path.exists(self.filename):
+            return completed
+        with open(self.filename, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line is truncated if the batch was killed while writing it
+                    continue
+                if record.get("status") == "done":
+                    completed[record["output"]] = record
+                else:
+                    completed.pop(record.get("output"), None)
+        return completed
+
+    def record(self, result):
+        """Append the result of a job and flush it to disk."""
+
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def runBatch(jobs, journal=None, workers=1, useCache=True, options=None, resume=True, callback=None,
+             renderTimeout=render.DEFAULT_TIMEOUT):
+    """Convert every job across a pool of worker processes and return the
+    list of their results, in the order of the jobs. Every worker typesets
+    its own pdf files, so at most workers lilypond processes run at once,
+    each stopped after renderTimeout seconds.
+
+    Each result is a dictionary with the output path, a status (done, skipped
+    or failed), the conversion time in seconds and an error message. Jobs
+    recorded as done in the journal whose output still exists are skipped
+    when resuming. The callback, if any, is called with every result as soon
+    as it is known."""
+
+    completed = journal.completed() if journal is not None and resume else {}
+
+    results = [None] * len(jobs)
+    pending = []
+    for index, job in enumerate(jobs):
+        result = None
+        if job.outputPath() in completed and os.path.exists(job.outputPath()):
+            result = _result(job, "skipped", completed[job.outputPath()].get("seconds", 0.0))
+        elif job.missingInputs():
+            result = _result(job, "failed", 0.0, "missing input(s): %s" % ", ".join(job.missingInputs()))
+        if result is None:
+            pending.append((index, job))
+            continue
+        results[index] = result
+        if result["status"] == "failed" and journal is not None:
+            journal.record(result)
+        if callback is not None:
+            callback(result)
+
+    for index, result in _runPending(pending, workers, useCache, options, renderTimeout):
+        results[index] = result
+        if journal is not None:
+            journal.record(result)
+        if callback is not None:
+            callback(result)
+    return results
+
+def _result(job, status, seconds, error=None):
+    return {"output": job.outputPath(), "status": status, "seconds": seconds, "error": error}
+
+def _runPending(pending, workers, useCache, options, renderTimeout):
+    """Run (index, job) tuples, in parallel if needed."""
+
+    if workers is None or workers < 1:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(pending))
+
+    if workers <= 1:
+        _initWorker(useCache, options, renderTimeout)
+        for args in pending:
+            yield _runJob(args)
+        return
+
+    # Every worker process converts whole jobs, reusing its imports and its
+    # converter from one job to the next
+    pool = multiprocessing.Pool(workers, _initWorker, (useCache, options, renderTimeout))
+    try:
+        for result in pool.imap_unordered(_runJob, pending):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+_converter = None
+
+def _initWorker(useCache, options, renderTimeout):
+    """Create the converter of a worker process."""
+
+    global _converter
+    renderer = render.LilyPondRenderer(timeout=renderTimeout, cache=render.RenderCache() if useCache else None)
+    _converter = convert.AudioToSheetMusicConverter(workers=1, useCache=useCache, options=options,
+                                                    renderer=renderer)
+
+def _runJob(args):
+    """Worker entry point of runBatch."""
+
+    (index, job) = args
+    start = time.time()
+    try:
+        directory = os.path.dirname(job.output)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        for progress in _converter.convert(job.inputs, job.output, job.format, job.options): continue
+    except Exception as e:
+        return index, _result(job, "failed", time.time() - start, "%s: %s" % (type(e).__name__, e))
+    return index, _result(job, "done", time.time() - start)
+
+def printReport(results, out=None):
+    """Print the status and the conversion time of every job, followed by the
+    number of jobs of each status."""
+
+    out = out or sys.stdout
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+        out.write("%-8s %9.2f s  %s\n" % (result["status"], result["seconds"], result["output"]))
+        if result["error"]:
+            out.write("         %s\n" % result["error"])
+    total = sum(result["seconds"] for result in results if result["status"] != "skipped")
+    out.write("%i done, %i skipped, %i failed, %.2f s of conversion\n"
+              % (counts.get("done", 0), counts.get("skipped", 0), counts.get("failed", 0), total))
@@ -0,0 +1,330 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import argparse
+import tempfile
+import numpy
+import transcribe
+import convert
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None # Peak memory falls back to the maximum resident set size
+
+SAMPLE_RATE = 44100
+BLOCKSIZE = 256
+
+# Stages of the transcription of a single file, in pipeline order
+STAGES = ["analyzeAudioFile", "detectPitchFrequencies", "smoothFrequencies", "assignPitches", "trackToEvents",
+          "eventsToStream"]
+
+# Stages of the score builder benchmark, building the same parts one element
+# at a time and in bulk
+SCORE_STAGES = ["appendOneByOne", "appendElements"]
+SCORE_NOTES = 5000
+
+# Fixture name: (seconds, number of stems, harmonics, rest probability, random seed)
+FIXTURES = {
+    "sine": (30, 1, 1, 0.0, 1),
+    "harmonic": (30, 1, 5, 0.15, 2),
+    "long": (300, 1, 5, 0.1, 3),
+    "session": (20, 16, 3, 0.1, 4),
+}
+QUICK_SECONDS = {"long": 60}
+
+def synthesizeMelody(seconds, harmonics=1, restProbability=0.0, seed=0):
+    """Return deterministic 16-bit samples of a random melody with the given
+    number of harmonics, interrupted by rests."""
+
+    rng = numpy.random.RandomState(seed)
+    total = int(seconds * SAMPLE_RATE)
+    samples = numpy.zeros(total)
+    position = 0
+    while position < total:
+        length = min(int(rng.choice([0.125, 0.25, 0.5, 1.0]) * SAMPLE_RATE), total - position)
+        if rng.rand() >= restProbability:
+            frequency = 440.0 * 2 ** ((rng.randint(48, 84) - 69) / 12.0)
+            t = numpy.arange(length) / float(SAMPLE_RATE)
+            envelope = numpy.minimum(1.0, numpy.minimum(t, t[::-1]) * 200)
+            for harmonic in range(1, harmonics + 1):
+                samples[position:position + length] += (envelope / harmonic
+                                                        * numpy.sin(2 * numpy.pi * frequency * harmonic * t))
+        position += length
+    samples += rng.randn(total) * 0.001
+    samples *= 0.5 / max(1.0, numpy.abs(samples).max())
+    return (samples * 32767).astype(numpy.int16)
+
+def writeWave(filename, samples):
+    """Write mono 16-bit samples to a wav file."""
+
+    wv = wave.open(filename, 'w')
+    wv.setnchannels(1)
+    wv.setsampwidth(2)
+    wv.setframerate(SAMPLE_RATE)
+    wv.writeframes(samples.tobytes())
+    wv.close()
+
+def createFixtures(directory, names, quick=False):
+    """Synthesize the wav files of the given fixtures and return a dictionary
+    of their paths."""
+
+    fixtures = {}
+    for name in names:
+        (seconds, stems, harmonics, restProbability, seed) = FIXTURES[name]
+        if quick:
+            seconds = QUICK_SECONDS.get(name, seconds)
+        fixtures[name] = []
+        for stem in range(stems):
+            filename = os.path.join(directory, "%s-%i-%i.wav" % (name, seconds, stem))
+            if not os.path.exists(filename):
+                writeWave(filename, synthesizeMelody(seconds, harmonics, restProbability, seed * 100 + stem))
+            fixtures[name].append(filename)
+    return fixtures
+
+def measure(function, args, repeat):
+    """Call a function repeatedly and return a tuple of its result, the best
+    wall time and the peak memory allocated. Memory is traced during an
+    untimed first call, which also absorbs one-time costs such as imports."""
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        import resource
+        function(*args)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = function(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best, peak
+
+def benchmarkFile(filename, repeat):
+    """Time every transcription stage of a single file."""
+
+    results = {}
+
+    def stage(name, function, *args):
+        (result, seconds, peak) = measure(function, args, max(1, repeat))
+        results[name] = {"seconds": seconds, "peakMemory": peak}
+        return result
+
+    options = transcribe.TranscriptionOptions(blocksize=BLOCKSIZE)
+    track = stage("analyzeAudioFile", transcribe.analyzeAudioFile, filename, options)
+    detected = stage("detectPitchFrequencies", transcribe.detectPitchFrequencies, track.frequency)
+    smoothed = stage("smoothFrequencies", lambda f: transcribe.smoothFrequencies(f, inPlace=False), detected)
+    stage("assignPitches", transcribe.assignPitches, track, smoothed)
+    events = stage("trackToEvents", transcribe.trackToEvents, track)
+    stage("eventsToStream", transcribe.eventsToStream, events)
+
+    frames = len(track)
+    for name in results:
+        results[name]["framesPerSecond"] = frames / results[name]["seconds"] if results[name]["seconds"] else None
+    return frames, results
+
+def benchmarkConvert(filenames, directory, outputFormat, repeat):
+    """Time a whole conversion, transcription and rendering included."""
+
+    converter = convert.AudioToSheetMusicConverter(useCache=False)
+    destination = os.path.join(directory, "benchmark")
+
+    def run():
+        for progress in converter.convert(filenames, destination, outputFormat):
+            pass
+
+    (unused_result, seconds, peak) = measure(run, (), max(1, repeat))
+    return {"seconds": seconds, "peakMemory": peak, "format": outputFormat}
+
+def synthesizeEvents(count, seed=0):
+    """Return deterministic note events of a random melody interrupted by rests."""
+
+    rng = numpy.random.RandomState(seed)
+    names = transcribe.CHROMATIC_NAMES
+    events = []
+    start = 0
+    for i in range(count):
+        length = int(rng.choice([4, 8, 16, 24, 32]))
+        if rng.rand() < 0.1:
+            events.append(transcribe.NoteEvent(None, None, None, start, length))
+        else:
+            midi = int(rng.randint(48, 84))
+            events.append(transcribe.NoteEvent(names[midi % 12], midi // 12 - 1, midi, start, length))
+        start += length
+    return events
+
+def appendOneByOne(parts):
+    """Build a score the way notesAndDurationsToStream and convert used to,
+    appending every element separately."""
+
+    from music21 import stream
+
+    score = stream.Score()
+    for events in parts:
+        (notesList, durationList) = transcribe.eventsToNotes(events)
+        quarterLengths = transcribe.quantizeDurations(durationList,
+                                                      transcribe.quarterLengthEstimation(durationList))
+        part = stream.Part()
+        removeRestsAtBeginning = True
+        for i in range(len(durationList)):
+            notesList[i].quarterLength = float(quarterLengths[i])
+            if not (removeRestsAtBeginning and notesList[i].name == "rest"):
+                part.append(notesList[i])
+                removeRestsAtBeginning = False
+        score.append(part)
+    return score
+
+def appendElements(parts):
+    """Build a score with the bulk score builder."""
+
+    from music21 import stream
+
+    return transcribe.appendElements(stream.Score(), [transcribe.eventsToStream(events) for events in parts])
+
+def benchmarkScore(notes, repeat, parts=4):
+    """Time the construction of a score of a few parts holding the given
+    number of notes each, element by element and in bulk."""
+
+    events = [synthesizeEvents(notes, seed) for seed in range(parts)]
+    results = {}
+    for name, function in (("appendOneByOne", appendOneByOne), ("appendElements", appendElements)):
+        (unused_score, seconds, peak) = measure(function, (events,), max(1, repeat))
+        results[name] = {"seconds": seconds, "peakMemory": peak}
+    return results
+
+def runBenchmarks(fixtures, directory, outputFormat, repeat):
+    """Run the benchmarks of every fixture and return the results."""
+
+    results = {}
+    for name in sorted(fixtures):
+        filenames = fixtures[name]
+        entry = {"files": len(filenames)}
+        if len(filenames) == 1:
+            (entry["frames"], entry["stages"]) = benchmarkFile(filenames[0], repeat)
+        else:
+            entry["stages"] = {}
+        try:
+            entry["stages"]["convert"] = benchmarkConvert(filenames, directory, outputFormat, repeat)
+        except Exception as e:
+            entry["stages"]["convert"] = {"error": str(e)}
+        results[name] = entry
+    return results
+
+def orderedStages(stages):
+    """Return the names of stages in pipeline order."""
+
+    order = STAGES + SCORE_STAGES
+    return sorted(stages, key=lambda stage: order.index(stage) if stage in order else len(order))
+
+def compareResults(baseline, results, tolerance):
+    """Print the relative change of every stage present in both results and
+    return a list of the stages slower than the baseline by more than the
+    tolerance."""
+
+    regressions = []
+    for name in sorted(results):
+        for stage in orderedStages(results[name]["stages"]):
+            new = results[name]["stages"][stage].get("seconds")
+            old = baseline.get(name, {}).get("stages", {}).get(stage, {}).get("seconds")
+            if not new or not old:
+                continue
+            ratio = new / old
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "REGRESSION"
+                regressions.append((name, stage, ratio))
+            print("%-10s %-34s %9.4fs %9.4fs %7.2fx %s" % (name, stage, old, new, ratio, flag))
+    return regressions
+
+def printResults(results):
+    """Print a summary table of the results."""
+
+    for name in sorted(results):
+        for stage in orderedStages(results[name]["stages"]):
+            values = results[name]["stages"][stage]
+            if "error" in values:
+                print("%-10s %-34s failed: %s" % (name, stage, values["error"]))
+                continue
+            fps = values.get("framesPerSecond")
+            print("%-10s %-34s %9.4fs %14s %10.1f MB" % (name, stage, values["seconds"],
+                                                          "%.0f frames/s" % fps if fps else "",
+                                                          values["peakMemory"] / 1048576.0))
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="benchmark the transcription pipeline on synthetic recordings")
+    parser.add_argument("--fixtures", nargs="+", choices=sorted(FIXTURES), default=sorted(FIXTURES),
+                        help="fixtures to run")
+    parser.add_argument("--directory", type=str, help="directory where fixtures are kept between runs")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each stage")
+    parser.add_argument("--quick", action="store_true", help="use a shorter long take")
+    parser.add_argument("--format", choices=sorted(convert.OUTPUT_EXTENSIONS), default="musicxml",
+                        help="output format of the convert stage")
+    parser.add_argument("--score-notes", type=int, default=SCORE_NOTES,
+                        help="number of notes of every part of the score builder benchmark (0 to skip it)")
+    parser.add_argument("--output", type=str, help="write the results as JSON to this file")
+    parser.add_argument("--compare", type=str, help="compare with the results saved in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown tolerated by --compare before failing")
+    args = parser.parse_args(argv)
+
+    directory = args.directory or tempfile.mkdtemp(prefix="polyscribe-benchmark-")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        fixtures = createFixtures(directory, args.fixtures, args.quick)
+        results = runBenchmarks(fixtures, directory, args.format, args.repeat)
+        if args.score_notes > 0:
+            results["score"] = {"notes": args.score_notes,
+                                "stages": benchmarkScore(args.score_notes, args.repeat)}
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory)
+
+    report = {"python": sys.version.split()[0], "numpy": numpy.__version__,
+              "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+    printResults(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compareResults(baseline, results, args.tolerance)
+        if regressions:
+            print("%i stage(s) slower than the baseline" % len(regressions))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,163 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import errno
+import pickle
+import hashlib
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Eviction is not serialized between processes on Windows
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024 # Bytes
+ENTRY_EXTENSION = ".pickle"
+
+def defaultCacheDirectory():
+    """Return the cache directory used when none is specified."""
+
+    if os.environ.get("POLYSCRIBE_CACHE_DIR"):
+        return os.environ["POLYSCRIBE_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "polyscribe")
+
+class TranscriptionCache(object):
+    """Persistent content-addressed cache of per-file transcription results.
+
+    Entries are keyed by the hash of the audio content and of the analysis
+    parameters. They are written atomically, so several processes can share
+    the same directory, and the least recently used entries are evicted when
+    the total size exceeds maxSize."""
+
+    def __init__(self, directory=None, maxSize=DEFAULT_MAX_SIZE):
+        """Constructor."""
+
+        self.directory = directory or defaultCacheDirectory()
+        self.maxSize = maxSize
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def key(self, filename, signature):
+        """Return the key of the results of a file analyzed with parameters
+        described by a signature string."""
+
+        digest = hashlib.sha1(signature.encode("utf-8"))
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_EXTENSION)
+
+    def get(self, key):
+        """Return the cached value of a key or None if there is none."""
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path, None) # Mark the entry as recently used
+        except Exception:
+            return None
+        return value
+
+    def put(self, key, value):
+        """Store a value and evict old entries if the cache is full."""
+
+        (fd, temporaryPath) = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            if os.name == "nt" and os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+            os.rename(temporaryPath, self._path(key))
+        except Exception:
+            if os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
+            raise
+        self.evict()
+
+    def entries(self):
+        """Return a list of (path, size, last use time) tuples of every entry."""
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_EXTENSION):
+                path = os.path.join(self.directory, name)
+                try:
+                    stats = os.stat(path)
+                except OSError:
+                    continue # Removed by another process
+                entries.append((path, stats.st_size, stats.st_mtime))
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in
+        maxSize."""
+
+        with self._lock():
+            entries = sorted(self.entries(), key=lambda entry: entry[2])
+            total = sum(entry[1] for entry in entries)
+            for path, size, unused_time in entries:
+                if total <= self.maxSize:
+                    break
+                self._remove(path)
+                total -= size
+
+    def clear(self):
+        """Remove every entry."""
+
+        with self._lock():
+            for path, unused_size, unused_time in self.entries():
+                self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _lock(self):
+        return _FileLock(os.path.join(self.directory, "lock"))
+
+class _FileLock(object):
+    """Exclusive advisory lock on a file, held within a with statement."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
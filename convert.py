@@ -20,43 +20,131 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
 import sys
+import cache
+import render
+import writers
+import presets
+import profiling
 import transcribe
-from music21 import environment, stream, metadata
+
+# File extension of each output format
+OUTPUT_EXTENSIONS = {"pdf": ".pdf", "ly": ".ly", "musicxml": ".musicxml", "midi": ".mid"}
 
 class AudioToSheetMusicConverter:
     """Convert audio files to sheet music."""
 
-    def __init__(self):
-        """Constructor."""
+    def __init__(self, workers=1, useCache=True, options=None, profiler=None, renderer=None, preset=None):
+        """Constructor. Input files are transcribed by the given number of
+        worker processes, or by one process per CPU core if workers is 0.
+        Transcriptions and rendered documents are reused from the on-disk
+        caches if useCache is set. The stages of every conversion are
+        measured by the profiler, if any. pdf files are typeset by the
+        renderer, a render.LilyPondRenderer. Without options, those of the
+        preset of the given name or path are used, if any."""
+
+        self.workers = workers
+        self.profiler = profiler or profiling.NULL_PROFILER
+        if options is None and preset is not None:
+            options = presets.presetOptions(preset)
+        self.options = options or transcribe.TranscriptionOptions()
+        self.cache = cache.TranscriptionCache() if useCache else None
+        self.renderer = renderer or render.LilyPondRenderer(cache=render.RenderCache() if useCache else None)
 
         if sys.platform == "darwin":
-            import os
+            from music21 import environment
 
             LILYPOND_EXEC_PATH = "/Applications/LilyPond.app/Contents/Resources/bin/lilypond"
             if os.path.exists(LILYPOND_EXEC_PATH):
                 environment.set("lilypondPath", LILYPOND_EXEC_PATH)
 
-    def convert(self, filenames, destination):
-        """Convert wav files into pdf using lilypond as renderer."""
+    def convert(self, filenames, destination, format="pdf", options=None, progress=None, cancel=None):
+        """Convert wav files into sheet music written to the destination path
+        with the extension of the format. ly files are generated by music21
+        and pdf files are then typeset by lilypond, while midi and musicxml
+        files are written directly from the transcribed notes without
+        building a score. The
+        options of the converter can be overridden by options for every file,
+        or by a list with the options of each file.
+
+        Yield the percentage of the conversion done after every step. For
+        finer reports, progress is called with the percentage done and a
+        description of the current step while files are transcribed. Setting
+        the cancel event raises transcribe.TranscriptionCancelled, even in
+        the middle of a file."""
+
+        if format not in OUTPUT_EXTENSIONS:
+            raise ValueError("Unknown output format: %s" % format)
 
         max_progress = len(filenames) + 2
-        progress = 0
-
-        parts = []
-        for filename in filenames:
-            parts.append(transcribe.monophonicStreamFromFile(filename))
-            progress += 1
-            yield int(float(progress) / float(max_progress) * 100)
-
-        score = stream.Score()
-        score.metadata = metadata.Metadata()
-        score.metadata.composer = "Polyscribe"
-        for part in parts:
-            score.append(part)
-        progress += 1
-        yield int(float(progress) / float(max_progress) * 100)
-
-        score.write("lily.pdf", destination)
-        progress += 1
-        yield int(float(progress) / float(max_progress) * 100)
+        fractions = [0.0] * len(filenames)
+
+        def reportFile(index, fraction):
+            fractions[index] = fraction
+            if progress is not None:
+                progress(int(sum(fractions) / max_progress * 100),
+                         "Transcribing %s" % os.path.basename(filenames[index]))
+
+        def step(done, description):
+            if cancel is not None and cancel.is_set():
+                raise transcribe.TranscriptionCancelled()
+            if progress is not None:
+                progress(int(float(done) / max_progress * 100), description)
+            return int(float(done) / max_progress * 100)
+
+        events = [None] * len(filenames)
+        fileOptions = options if isinstance(options, list) else [options or self.options] * len(filenames)
+        results = transcribe.transcribeFiles(filenames, self.workers, fileOptions, self.cache,
+                                             self.profiler, reportFile, cancel)
+        for index, fileEvents in results:
+            events[index] = fileEvents
+            yield int(sum(fractions) / max_progress * 100)
+        done = len(filenames)
+        outputPath = destination + OUTPUT_EXTENSIONS[format]
+
+        if format in ("midi", "musicxml"):
+            step(done, "Quantizing durations")
+            with self.profiler.stage("quantization") as stage:
+                parts = [transcribe.quantizeEvents(fileEvents, durationTable=fileOptions[index].durationTable())
+                         for index, fileEvents in enumerate(events)]
+                stage.notes = sum(len(part) for part in parts)
+            yield step(done + 1, "Writing %s" % os.path.basename(outputPath))
+
+            writer = writers.writeMidi if format == "midi" else writers.writeMusicXml
+            with self.profiler.stage("output", outputPath):
+                writer(parts, outputPath)
+        else:
+            step(done, "Building the score")
+            with self.profiler.stage("score") as stage:
+                from music21 import stream, metadata
+
+                score = stream.Score()
+                score.metadata = metadata.Metadata()
+                score.metadata.composer = "Polyscribe"
+                with transcribe.collectorPaused():
+                    transcribe.appendElements(score, [transcribe.eventsToStream(fileEvents,
+                                                                                fileOptions[index].durationTable())
+                                                      for index, fileEvents in enumerate(events)])
+                source = render.lilypondSource(score, format)
+                stage.notes = sum(len(fileEvents) for fileEvents in events)
+            yield step(done + 1, "Rendering with LilyPond")
+
+            with self.profiler.stage("output", outputPath):
+                if format == "ly":
+                    with open(outputPath, 'wb') as f:
+                        f.write(source.encode("utf-8"))
+                else:
+                    # Renders from other threads share the renderer's bounded
+                    # pool, while this one stays cancellable
+                    result = self.renderer.submit(source, outputPath, format, cancel)
+                    while not result.ready():
+                        result.wait(render.POLL_INTERVAL)
+                    try:
+                        result.get()
+                    except render.RenderCancelled:
+                        raise transcribe.TranscriptionCancelled()
+
+        if progress is not None:
+            progress(100, "Done")
+        yield 100
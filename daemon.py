@@ -0,0 +1,863 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import hmac
+import json
+import time
+import heapq
+import signal
+import socket
+import binascii
+import argparse
+import threading
+import collections
+import multiprocessing
+
+try:
+    import http.client as httplib
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+except ImportError:
+    import httplib
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+
+# The conversion modules are only imported by the daemon and its workers, so
+# that clients start quickly
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+HISTORY_SIZE = 1000 # Finished jobs kept for status requests
+METRICS_WINDOW = 300 # Seconds of finished jobs the throughput is measured on
+KEEPALIVE_INTERVAL = 15 # Seconds between progress events of a job that does not change
+WATCH_INTERVAL = 1.0 # Seconds between checks of the worker processes of running jobs
+KILL_GRACE = 10 # Seconds a timed out job has to stop before its worker process is killed
+LOOPBACK_HOSTS = ("localhost", "127.0.0.1")
+
+STATUSES = ("queued", "running", "done", "failed", "cancelled")
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+class DaemonError(Exception):
+    """A request to the daemon failed."""
+
+def isLoopback(host):
+    """Return whether a host name or IPv4 address is a loopback address."""
+
+    return host in LOOPBACK_HOSTS or host.startswith("127.")
+
+def parseAddress(address=None):
+    """Return ("unix", path) for the path of a Unix socket, or ("tcp", (host,
+    port)) for a [HOST:]PORT address, localhost by default."""
+
+    address = address or os.environ.get("POLYSCRIBE_DAEMON") or DEFAULT_ADDRESS
+    if os.sep in address or address.endswith(".sock"):
+        return "unix", address
+    (host, unused_separator, port) = address.rpartition(":")
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError("Invalid daemon address: %s" % address)
+    # Jobs write files with the privileges of the daemon, so its interface
+    # must not be reachable from the network
+    host = host or "127.0.0.1"
+    if not isLoopback(host):
+        raise ValueError("The daemon only listens on loopback addresses, not %s" % host)
+    return "tcp", (host, port)
+
+def tokenPath(port):
+    """Return the path of the file holding the access token of the daemon
+    listening at a loopback port."""
+
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(base, "polyscribe", "daemon-%i.token" % port)
+
+def createToken(port):
+    """Write a new random access token for the daemon listening at a
+    loopback port to a file only its owner can read, and return it."""
+
+    path = tokenPath(port)
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+    if os.path.lexists(path):
+        os.remove(path)
+    token = binascii.hexlify(os.urandom(16)).decode("ascii")
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as f:
+        f.write(token)
+    return token
+
+def readToken(port):
+    """Return the access token of the daemon listening at a loopback port,
+    or None if it cannot be read."""
+
+    try:
+        with open(tokenPath(port)) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+class Job(object):
+    """A conversion queued by the daemon."""
+
+    def __init__(self, id, number, inputs, output, format, options, priority=0):
+        """Constructor. Jobs are numbered in submission order."""
+
+        self.id = id
+        self.number = number
+        self.inputs = inputs
+        self.output = output
+        self.format = format
+        self.options = options
+        self.priority = priority
+        self.status = "queued"
+        self.progress = 0
+        self.message = "Queued"
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.slot = None
+        self.pid = None # Worker process running the job
+        self.timedOut = False
+        self.version = 0 # Incremented on every change, for progress streams
+
+    def snapshot(self):
+        """Return the state of the job as a dictionary."""
+
+        return {"id": self.id, "inputs": self.inputs, "output": self.output, "format": self.format,
+                "priority": self.priority, "status": self.status, "progress": self.progress,
+                "message": self.message, "error": self.error, "submitted": self.submitted,
+                "started": self.started, "finished": self.finished}
+
+class ConversionDaemon(object):
+    """Queue of conversions run by a pool of worker processes, which keep
+    their imports and their converter from one job to the next. Queued jobs
+    are started by decreasing priority, then in the order they were
+    submitted, as soon as a worker is idle."""
+
+    def __init__(self, workers=1, useCache=True, renderTimeout=None, historySize=HISTORY_SIZE, jobTimeout=None):
+        """Constructor. Jobs are run by the given number of worker processes,
+        or by one process per CPU core if workers is 0. Jobs running for
+        more than jobTimeout seconds, if given, are cancelled and fail.
+
+        Jobs whose worker process dies, such as when it runs out of memory,
+        fail as well, and the pool replaces the worker. The timeout also
+        fails jobs that never reported their start, which a worker dying
+        right after taking them would leave running otherwise."""
+
+        import render
+
+        if workers is None or workers < 1:
+            workers = multiprocessing.cpu_count()
+        if renderTimeout is None:
+            renderTimeout = render.DEFAULT_TIMEOUT
+        self.workers = workers
+        self.historySize = historySize
+        self.jobTimeout = jobTimeout or None
+        self.started = time.time()
+
+        # Every running job has a slot, whose flag is set to cancel it and
+        # which holds the number of the job, so that a worker taking a job
+        # after it failed leaves it alone
+        self.progressQueue = multiprocessing.Queue()
+        self.cancelFlags = multiprocessing.RawArray('b', workers)
+        self.slotJobs = multiprocessing.RawArray('i', workers)
+        self.pool = multiprocessing.Pool(workers, _initWorker, (useCache, renderTimeout, self.progressQueue,
+                                                                self.cancelFlags, self.slotJobs))
+
+        self.changed = threading.Condition()
+        self.jobs = {}
+        self.queue = []
+        self.freeSlots = list(range(workers))
+        self.finishedIds = collections.deque()
+        self.recent = collections.deque() # (finished, wait seconds, run seconds) tuples
+        self.totals = dict((status, 0) for status in FINISHED_STATUSES)
+        self.submitted = 0
+        self.stopping = False
+
+        self.threads = [threading.Thread(target=self._schedule), threading.Thread(target=self._receiveProgress),
+                        threading.Thread(target=self._watchWorkers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, inputs, output, format="pdf", options=None, preset=None, priority=0):
+        """Queue the conversion of input files to an output path (without
+        extension) and return the snapshot of its job. The transcription
+        options are those of the preset, if any, overridden by the options
+        dictionary. Raise ValueError for invalid jobs."""
+
+        import convert
+        import presets
+        import transcribe
+
+        if format not in convert.OUTPUT_EXTENSIONS:
+            raise ValueError("Unknown output format: %s" % format)
+        if not inputs or not output:
+            raise ValueError("A job needs an output path and at least one input")
+        if not all(os.path.isabs(path) for path in list(inputs) + [output]):
+            raise ValueError("Input and output paths must be absolute")
+        missing = [filename for filename in inputs if not os.path.isfile(filename)]
+        if missing:
+            raise ValueError("Input file(s) not found: %s" % ", ".join(missing))
+
+        settings = presets.loadPreset(preset) if preset else {}
+        unknown = sorted(set(options or {}) - set(presets.OPTION_KEYS + ("channel", "fftWorkers")))
+        if unknown:
+            raise ValueError("Unknown option(s): %s" % ", ".join(unknown))
+        settings.update(options or {})
+        transcriptionOptions = transcribe.TranscriptionOptions(**settings)
+
+        with self.changed:
+            self.submitted += 1
+            job = Job("%i-%i" % (int(self.started), self.submitted), self.submitted, list(inputs), output, format,
+                      transcriptionOptions, int(priority))
+            self.jobs[job.id] = job
+            heapq.heappush(self.queue, (-job.priority, self.submitted, job))
+            self.changed.notify_all()
+            return job.snapshot()
+
+    def job(self, id):
+        """Return the snapshot of a job, or None if it is unknown."""
+
+        with self.changed:
+            job = self.jobs.get(id)
+            return None if job is None else job.snapshot()
+
+    def snapshots(self):
+        """Return the snapshots of every known job, in submission order."""
+
+        with self.changed:
+            return [job.snapshot() for job in sorted(self.jobs.values(), key=lambda job: job.submitted)]
+
+    def cancel(self, id):
+        """Cancel a job, which is dropped from the queue or stopped within a
+        tenth of a second if it is running. Return its snapshot, or None if
+        it is unknown."""
+
+        with self.changed:
+            job = self.jobs.get(id)
+            if job is None:
+                return None
+            if job.status == "queued":
+                # The job is skipped when it reaches the top of the queue
+                self._finish(job, "cancelled")
+            elif job.status == "running":
+                self.cancelFlags[job.slot] = 1
+                job.message = "Cancelling"
+                job.version += 1
+                self.changed.notify_all()
+            return job.snapshot()
+
+    def waitForChange(self, id, version=None, timeout=KEEPALIVE_INTERVAL):
+        """Wait until a job differs from the given version, is finished or
+        the timeout expires. Return a tuple of its snapshot and its version,
+        or (None, None) if it is unknown."""
+
+        deadline = time.time() + timeout
+        with self.changed:
+            job = self.jobs.get(id)
+            while (job is not None and job.version == version and job.status not in FINISHED_STATUSES
+                   and time.time() < deadline):
+                self.changed.wait(deadline - time.time())
+                job = self.jobs.get(id)
+            if job is None:
+                return None, None
+            return job.snapshot(), job.version
+
+    def metrics(self):
+        """Return a dictionary of the queue depth, the state of the workers
+        and the throughput of the daemon."""
+
+        with self.changed:
+            now = time.time()
+            counts = dict((status, 0) for status in STATUSES)
+            for job in self.jobs.values():
+                counts[job.status] += 1
+            while self.recent and self.recent[0][0] < now - METRICS_WINDOW:
+                self.recent.popleft()
+            window = min(METRICS_WINDOW, now - self.started) or 1.0
+            completed = [record for record in self.recent if record[2] is not None]
+            return {
+                "queueDepth": counts["queued"],
+                "running": counts["running"],
+                "workers": self.workers,
+                "idleWorkers": len(self.freeSlots),
+                "submitted": self.submitted,
+                "totals": dict(self.totals),
+                "uptime": now - self.started,
+                "jobsPerMinute": len(completed) * 60.0 / window,
+                "meanWaitSeconds": sum(record[1] for record in completed) / len(completed) if completed else None,
+                "meanRunSeconds": sum(record[2] for record in completed) / len(completed) if completed else None,
+            }
+
+    def close(self):
+        """Stop the workers, cancelling the running jobs."""
+
+        with self.changed:
+            self.stopping = True
+            self.changed.notify_all()
+        self.progressQueue.put(None)
+        self.pool.terminate()
+        self.pool.join()
+        for thread in self.threads:
+            thread.join()
+
+    def _schedule(self):
+        """Start queued jobs on idle workers."""
+
+        while True:
+            with self.changed:
+                job = None
+                while job is None:
+                    while not self.stopping and not (self.queue and self.freeSlots):
+                        self.changed.wait()
+                    if self.stopping:
+                        return
+                    job = heapq.heappop(self.queue)[2]
+                    if job.status != "queued":
+                        job = None
+                job.slot = self.freeSlots.pop()
+                self.cancelFlags[job.slot] = 0
+                self.slotJobs[job.slot] = job.number
+                job.status = "running"
+                job.message = "Starting"
+                job.started = time.time()
+                job.version += 1
+                self.changed.notify_all()
+            # _runJob reports its own errors, since Python 2 pools have no
+            # error callback
+            self.pool.apply_async(_runJob, ((job.slot, job.number, job.id, job.inputs, job.output, job.format,
+                                             job.options),), callback=self._jobDone)
+
+    def _receiveProgress(self):
+        """Update running jobs with the progress reported by the workers."""
+
+        while True:
+            item = self.progressQueue.get()
+            if item is None:
+                return
+            (id, percent, message, pid) = item
+            with self.changed:
+                job = self.jobs.get(id)
+                # Reports may arrive after the job is finished
+                if job is not None and job.status == "running":
+                    job.pid = pid
+                    if percent is not None:
+                        job.progress = percent
+                    if message is not None and job.message != "Cancelling":
+                        job.message = message
+                    job.version += 1
+                    self.changed.notify_all()
+
+    def _watchWorkers(self):
+        """Fail the running jobs whose worker process died, and stop those
+        running for longer than the job timeout."""
+
+        while True:
+            with self.changed:
+                if self.stopping:
+                    return
+                self.changed.wait(WATCH_INTERVAL)
+                if self.stopping:
+                    return
+                # active_children also reaps the worker processes that died
+                alive = set(process.pid for process in multiprocessing.active_children())
+                now = time.time()
+                for job in list(self.jobs.values()):
+                    if job.status != "running":
+                        continue
+                    if job.pid is not None and job.pid not in alive:
+                        self.freeSlots.append(job.slot)
+                        error = ("Timed out after %g seconds" % self.jobTimeout if job.timedOut
+                                 else "The worker process converting the job died")
+                        self._finish(job, "failed", error)
+                    elif self.jobTimeout is not None and now - job.started > self.jobTimeout:
+                        if not job.timedOut:
+                            job.timedOut = True
+                            self.cancelFlags[job.slot] = 1
+                            job.message = "Cancelling"
+                            job.version += 1
+                            self.changed.notify_all()
+                        elif now - job.started > self.jobTimeout + KILL_GRACE and job.pid is None:
+                            # No worker started the job, or its worker died
+                            # before reporting it
+                            self.freeSlots.append(job.slot)
+                            self._finish(job, "failed", "Timed out after %g seconds without starting"
+                                         % self.jobTimeout)
+                        elif now - job.started > self.jobTimeout + KILL_GRACE:
+                            # The job does not respond to cancellation
+                            try:
+                                os.kill(job.pid, signal.SIGKILL)
+                            except OSError:
+                                pass
+
+    def _jobDone(self, result):
+        """Pool callback of a finished job."""
+
+        (id, status, error) = result
+        with self.changed:
+            job = self.jobs.get(id)
+            # Jobs whose worker died are already finished
+            if job is None or job.status != "running":
+                return
+            self.freeSlots.append(job.slot)
+            if job.timedOut and status == "cancelled":
+                (status, error) = ("failed", "Timed out after %g seconds" % self.jobTimeout)
+            self._finish(job, status, error)
+
+    def _finish(self, job, status, error=None):
+        """Record the end of a job, with the lock held."""
+
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        if status == "done":
+            job.progress = 100
+        job.message = {"done": "Done", "failed": "Failed", "cancelled": "Cancelled"}[status]
+        job.version += 1
+        self.totals[status] += 1
+        if job.started is not None:
+            self.recent.append((job.finished, job.started - job.submitted, job.finished - job.started))
+
+        self.finishedIds.append(job.id)
+        while len(self.finishedIds) > self.historySize:
+            del self.jobs[self.finishedIds.popleft()]
+        self.changed.notify_all()
+
+class _SlotEvent(object):
+    """Cancel event of a worker process, set through the shared flag of the
+    slot of its job, or when the slot was given to another job."""
+
+    def __init__(self, flags, slotJobs, slot, number):
+        """Constructor."""
+
+        self.flags = flags
+        self.slotJobs = slotJobs
+        self.slot = slot
+        self.number = number
+
+    def is_set(self):
+        return bool(self.flags[self.slot]) or self.slotJobs[self.slot] != self.number
+
+_converter = None
+_progressQueue = None
+_cancelFlags = None
+_slotJobs = None
+
+def _initWorker(useCache, renderTimeout, progressQueue, cancelFlags, slotJobs):
+    """Create the converter of a worker process and import the modules of
+    every stage, so that the first job does not wait for them."""
+
+    global _converter, _progressQueue, _cancelFlags, _slotJobs
+    import render
+    import convert
+    from music21 import stream, metadata
+
+    # The daemon handles interruptions and stops its workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    renderer = render.LilyPondRenderer(timeout=renderTimeout, cache=render.RenderCache() if useCache else None)
+    _converter = convert.AudioToSheetMusicConverter(workers=1, useCache=useCache, renderer=renderer)
+    _progressQueue = progressQueue
+    _cancelFlags = cancelFlags
+    _slotJobs = slotJobs
+
+def _runJob(args):
+    """Worker entry point of ConversionDaemon."""
+
+    import transcribe
+
+    (slot, number, id, inputs, output, format, options) = args
+    cancel = _SlotEvent(_cancelFlags, _slotJobs, slot, number)
+    if cancel.is_set():
+        return id, "cancelled", None
+    reported = [None]
+    # The daemon watches the process running the job from its first report
+    _progressQueue.put((id, None, None, os.getpid()))
+
+    def progress(percent, message):
+        # Only changes are sent to the daemon
+        if (percent, message) != reported[0]:
+            reported[0] = (percent, message)
+            _progressQueue.put((id, percent, message, os.getpid()))
+
+    try:
+        directory = os.path.dirname(output)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        for percent in _converter.convert(inputs, output, format, options, progress, cancel):
+            continue
+    except transcribe.TranscriptionCancelled:
+        return id, "cancelled", None
+    except Exception as e:
+        return id, "failed", "%s: %s" % (type(e).__name__, e)
+    return id, "done", None
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """HTTP interface of a ConversionDaemon.
+
+    POST /jobs queues a job given as a JSON object with inputs, output,
+    format, options, preset and priority keys. GET /jobs lists the jobs,
+    GET /jobs/ID returns one and DELETE /jobs/ID cancels it. GET
+    /jobs/ID/events streams the state of a job, one JSON object per line,
+    whenever its progress changes and until it is finished. GET /metrics
+    returns the queue depth and throughput metrics.
+
+    Requests to a loopback port must carry the token of the daemon in an
+    "Authorization: Bearer TOKEN" header and name a loopback Host, so that
+    web pages open in a local browser cannot reach the daemon, and POST
+    bodies must be of type application/json."""
+
+    server_version = "polyscribe"
+
+    def do_GET(self):
+        if not self._authorize():
+            return
+        parts = self._pathParts()
+        conversions = self.server.conversions
+        if parts == ["metrics"]:
+            self._sendJson(200, conversions.metrics())
+        elif parts == ["jobs"]:
+            self._sendJson(200, {"jobs": conversions.snapshots()})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            self._sendJob(conversions.job(parts[1]))
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            self._streamEvents(parts[1])
+        else:
+            self._sendJson(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if not self._authorize():
+            return
+        if self.headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+            self._sendJson(415, {"error": "Jobs must be submitted as application/json"})
+            return
+        if self._pathParts() != ["jobs"]:
+            self._sendJson(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            snapshot = self.server.conversions.submit(request.get("inputs"), request.get("output"),
+                                                      request.get("format", "pdf"), request.get("options"),
+                                                      request.get("preset"), request.get("priority", 0))
+        except (IOError, OSError, ValueError, TypeError, AttributeError) as e:
+            self._sendJson(400, {"error": str(e)})
+            return
+        self._sendJson(202, snapshot)
+
+    def do_DELETE(self):
+        if not self._authorize():
+            return
+        parts = self._pathParts()
+        if len(parts) == 2 and parts[0] == "jobs":
+            self._sendJob(self.server.conversions.cancel(parts[1]))
+        else:
+            self._sendJson(404, {"error": "Not found"})
+
+    def address_string(self):
+        # Clients of Unix sockets have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _authorize(self):
+        # Unix sockets are protected by their permissions
+        if self.server.token is None:
+            return True
+        host = self.headers.get("Host", "")
+        host = host[1:].partition("]")[0] if host.startswith("[") else host.partition(":")[0]
+        if not isLoopback(host):
+            self._sendJson(403, {"error": "Requests must be addressed to a loopback host"})
+            return False
+        (scheme, unused_separator, token) = self.headers.get("Authorization", "").partition(" ")
+        if scheme != "Bearer" or not hmac.compare_digest(token.strip().encode("utf-8"),
+                                                          self.server.token.encode("utf-8")):
+            self._sendJson(401, {"error": "Missing or invalid token, which the daemon writes to %s"
+                                 % tokenPath(self.server.server_address[1])})
+            return False
+        return True
+
+    def _pathParts(self):
+        return [part for part in self.path.split("?")[0].split("/") if part]
+
+    def _sendJob(self, snapshot):
+        if snapshot is None:
+            self._sendJson(404, {"error": "Unknown job"})
+        else:
+            self._sendJson(200, snapshot)
+
+    def _sendJson(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _streamEvents(self, id):
+        (snapshot, version) = self.server.conversions.waitForChange(id, timeout=0)
+        if snapshot is None:
+            self._sendJson(404, {"error": "Unknown job"})
+            return
+
+        # The stream ends when the connection is closed
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            while snapshot is not None:
+                self.wfile.write((json.dumps(snapshot) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                if snapshot["status"] in FINISHED_STATUSES:
+                    break
+                (snapshot, version) = self.server.conversions.waitForChange(id, version)
+        except socket.error:
+            # The client went away
+            pass
+
+class _TCPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _UnixServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def createServer(conversions, address=None, verbose=False):
+    """Return an HTTP server of a ConversionDaemon listening at an address
+    parsed by parseAddress. Unix sockets are only accessible by their owner,
+    and a new access token is written to the tokenPath of loopback ports."""
+
+    (family, location) = parseAddress(address)
+    if family == "unix":
+        if os.path.exists(location):
+            # Remove the socket of a daemon that did not exit cleanly
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(location)
+            except socket.error:
+                os.remove(location)
+            else:
+                raise ValueError("A daemon is already listening at %s" % location)
+            finally:
+                probe.close()
+        # The socket is created accessible by its owner only
+        umask = os.umask(0o177)
+        try:
+            server = _UnixServer(location, DaemonRequestHandler)
+        finally:
+            os.umask(umask)
+        server.token = None
+    else:
+        server = _TCPServer(location, DaemonRequestHandler)
+        try:
+            server.token = createToken(server.server_address[1])
+        except Exception:
+            server.server_close()
+            raise
+    server.conversions = conversions
+    server.verbose = verbose
+    return server
+
+def serve(address=None, workers=1, useCache=True, renderTimeout=None, verbose=False, out=None, jobTimeout=None):
+    """Run a conversion daemon until it is interrupted or terminated."""
+
+    out = out or sys.stderr
+    conversions = ConversionDaemon(workers, useCache, renderTimeout, jobTimeout=jobTimeout)
+    try:
+        server = createServer(conversions, address, verbose)
+    except Exception:
+        conversions.close()
+        raise
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, terminate)
+
+    out.write("Polyscribe daemon listening at %s with %i worker(s)\n"
+              % (address or os.environ.get("POLYSCRIBE_DAEMON") or DEFAULT_ADDRESS, conversions.workers))
+    try:
+        server.serve_forever(poll_interval=0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # A second signal would interrupt the workers while they stop
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        server.server_close()
+        conversions.close()
+        (family, location) = parseAddress(address)
+        if family == "unix" and os.path.exists(location):
+            os.remove(location)
+        if server.token is not None and readToken(server.server_address[1]) == server.token:
+            os.remove(tokenPath(server.server_address[1]))
+
+class _UnixHTTPConnection(httplib.HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, path, timeout=None):
+        """Constructor."""
+
+        httplib.HTTPConnection.__init__(self, "localhost")
+        self.path = path
+        self.socketTimeout = timeout
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.socketTimeout is not None:
+            self.sock.settimeout(self.socketTimeout)
+        self.sock.connect(self.path)
+
+class DaemonClient(object):
+    """Client of a conversion daemon. Requests raise DaemonError when the
+    daemon cannot be reached or rejects them. Requests to a loopback port
+    carry the token the daemon wrote for its user."""
+
+    def __init__(self, address=None, timeout=None):
+        """Constructor. The address is parsed by parseAddress."""
+
+        (self.family, self.location) = parseAddress(address)
+        self.timeout = timeout
+
+    def submit(self, inputs, output, format="pdf", options=None, preset=None, priority=0):
+        """Queue a conversion and return the snapshot of its job. Paths are
+        made absolute, since the daemon has its own working directory."""
+
+        request = {"inputs": [os.path.abspath(filename) for filename in inputs], "output": os.path.abspath(output),
+                   "format": format, "options": options or {}, "preset": preset, "priority": priority}
+        return self._request("POST", "/jobs", request)
+
+    def job(self, id):
+        """Return the snapshot of a job."""
+
+        return self._request("GET", "/jobs/%s" % id)
+
+    def jobs(self):
+        """Return the snapshots of every job known to the daemon."""
+
+        return self._request("GET", "/jobs")["jobs"]
+
+    def cancel(self, id):
+        """Cancel a job and return its snapshot."""
+
+        return self._request("DELETE", "/jobs/%s" % id)
+
+    def metrics(self):
+        """Return the metrics of the daemon."""
+
+        return self._request("GET", "/metrics")
+
+    def follow(self, id):
+        """Yield the snapshot of a job whenever its progress changes, until
+        it is finished."""
+
+        connection = self._connection()
+        try:
+            response = self._send(connection, "GET", "/jobs/%s/events" % id)
+            if response.status != 200:
+                self._raise(response)
+            while True:
+                try:
+                    line = response.readline()
+                except (socket.error, httplib.HTTPException) as e:
+                    raise DaemonError("Lost the connection to the daemon: %s" % e)
+                if not line:
+                    raise DaemonError("The daemon stopped before job %s was finished" % id)
+                snapshot = json.loads(line.decode("utf-8"))
+                yield snapshot
+                if snapshot["status"] in FINISHED_STATUSES:
+                    return
+        finally:
+            connection.close()
+
+    def _connection(self):
+        if self.family == "unix":
+            return _UnixHTTPConnection(self.location, self.timeout)
+        return httplib.HTTPConnection(self.location[0], self.location[1], timeout=self.timeout)
+
+    def _send(self, connection, method, path, data=None):
+        body = None if data is None else json.dumps(data).encode("utf-8")
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        token = readToken(self.location[1]) if self.family == "tcp" else None
+        if token:
+            headers["Authorization"] = "Bearer %s" % token
+        try:
+            connection.request(method, path, body, headers)
+            return connection.getresponse()
+        except (socket.error, httplib.HTTPException) as e:
+            raise DaemonError("Cannot reach the daemon at %s: %s" % (self._describe(), e))
+
+    def _request(self, method, path, data=None):
+        connection = self._connection()
+        try:
+            response = self._send(connection, method, path, data)
+            if response.status >= 300:
+                self._raise(response)
+            return json.loads(response.read().decode("utf-8"))
+        finally:
+            connection.close()
+
+    def _raise(self, response):
+        try:
+            message = json.loads(response.read().decode("utf-8"))["error"]
+        except (ValueError, KeyError):
+            message = response.reason
+        raise DaemonError(message)
+
+    def _describe(self):
+        return self.location if self.family == "unix" else "%s:%i" % self.location
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="keep converters warm and run the conversions submitted by "
+                                                 "polyscribe.py --daemon, or other HTTP clients, from a queue")
+    parser.add_argument("--address", type=str,
+                        help="Unix socket path or localhost [HOST:]PORT to listen at "
+                             "($POLYSCRIBE_DAEMON or %s by default)" % DEFAULT_ADDRESS)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes converting jobs in parallel (0 for one per CPU core)")
+    parser.add_argument("--render-timeout", type=float, default=600,
+                        help="seconds lilypond may take to typeset a pdf before it is stopped (0 for no limit)")
+    parser.add_argument("--job-timeout", type=float, default=0,
+                        help="seconds a job may run before it is stopped and fails (0 for no limit)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="transcribe every input file and typeset every pdf from scratch")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    if args.workers < 0:
+        parser.error("the number of workers cannot be negative")
+    if args.render_timeout < 0 or args.job_timeout < 0:
+        parser.error("timeouts cannot be negative")
+    try:
+        parseAddress(args.address)
+    except ValueError as e:
+        parser.error(str(e))
+
+    serve(args.address, args.workers, not args.no_cache, args.render_timeout, args.verbose,
+          jobTimeout=args.job_timeout)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
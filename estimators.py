@@ -0,0 +1,285 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy
+
+REST_FREQUENCY = 10 # Frequency given to frames in which no pitch is found
+
+# The fundamental found by the harmonic product spectrum is a peak of the
+# spectrum at least HARMONIC_LEVEL times as high as the strongest partial,
+# well above the sidelobes of the Hann window (31 dB down). The strongest
+# partial deviates from one of its harmonics by HARMONIC_TOLERANCE at most
+HARMONIC_LEVEL = 0.1
+HARMONIC_TOLERANCE = 2 ** (1 / 24.0) - 1 # A quarter tone
+
+# Pitch estimators by name. Every estimator takes a two-dimensional array of
+# frames (one per row), their sample rate, an optional range of frequencies
+# and the number of threads its FFTs may use, and returns a tuple of two
+# arrays consisting of the frequency of each frame (REST_FREQUENCY when
+# unvoiced) and a confidence between 0 and 1 that the frame is voiced with
+# that pitch. Single precision frames are analyzed in single precision.
+_estimators = {}
+
+_scipyFft = None
+
+def registerEstimator(name, estimator):
+    """Make a pitch estimator selectable by name."""
+
+    _estimators[name] = estimator
+
+def getEstimator(name):
+    """Return the pitch estimator registered under a name."""
+
+    if name not in _estimators:
+        raise ValueError("Unknown pitch estimator: %s (available: %s)" % (name, ", ".join(estimatorNames())))
+    return _estimators[name]
+
+def estimatorNames():
+    """Return the sorted list of the names of the registered estimators."""
+
+    return sorted(_estimators)
+
+def floatFrames(frames):
+    """Return frames as an array of floats, keeping single precision."""
+
+    frames = numpy.asarray(frames)
+    if frames.dtype not in (numpy.float32, numpy.float64):
+        frames = frames.astype(numpy.float64)
+    return frames
+
+def fftBackend(dtype, workers=1):
+    """Return the FFT module to transform arrays of a type with. scipy.fft is
+    used when it is available and the transforms need several threads or
+    single precision, which numpy.fft does not offer; numpy.fft is used
+    otherwise."""
+
+    global _scipyFft
+
+    if (workers is None or workers == 1) and dtype in (numpy.float64, numpy.complex128):
+        return numpy.fft
+    if _scipyFft is None:
+        try:
+            import scipy.fft
+            _scipyFft = scipy.fft
+        except ImportError:
+            _scipyFft = False
+    return _scipyFft or numpy.fft
+
+def rfft(frames, size, workers=1):
+    """Real FFT of every row of an array of frames zero-padded to size."""
+
+    backend = fftBackend(frames.dtype, workers)
+    if backend is numpy.fft:
+        return numpy.fft.rfft(frames, size, axis=1)
+    # scipy.fft counts all the CPU cores as -1 threads
+    return backend.rfft(frames, size, axis=1, workers=workers or -1)
+
+def irfft(spectrum, size, workers=1):
+    """Inverse of rfft."""
+
+    backend = fftBackend(spectrum.dtype, workers)
+    if backend is numpy.fft:
+        return numpy.fft.irfft(spectrum, size, axis=1)
+    return backend.irfft(spectrum, size, axis=1, workers=workers or -1)
+
+def lagBounds(length, srate, fmin=None, fmax=None):
+    """Return the range of lags, in samples, of the periods of fmax and fmin
+    within a frame of a given length."""
+
+    minLag = int(srate / fmax) if fmax else 0
+    maxLag = min(length - 1, int(numpy.ceil(srate / fmin))) if fmin else length - 1
+    return minLag, maxLag
+
+def linearAutocorrelation(frames, lags, workers=1):
+    """Return the linear autocorrelation of every row of an array of frames
+    for lags 0 through lags - 1, using a single real FFT pass."""
+
+    length = frames.shape[1]
+
+    # Zero-pad to avoid circular aliasing: the power spectrum of the padded
+    # frame is the Fourier transform of its linear autocorrelation up to the
+    # padding length, so only the lags needed have to be padded for.
+    size = 1 << (length + lags - 2).bit_length()
+    spectrum = rfft(frames, size, workers)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    return irfft(power, size, workers)[:, :lags]
+
+def interpolatePeaks(values, peak):
+    """Return the position of the vertex of the parabola through the value at
+    the index peak of every row and its two neighbours."""
+
+    (count, length) = values.shape
+    rows = numpy.arange(count)
+    curr = values[rows, peak]
+    prev = numpy.where(peak > 0, values[rows, numpy.maximum(peak - 1, 0)], curr)
+    next = numpy.where(peak < length - 1, values[rows, numpy.minimum(peak + 1, length - 1)], curr)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        # The indices are cast so that single precision values stay single
+        return (prev - next) / (prev - 2.0 * curr + next) * 0.5 + peak.astype(values.dtype)
+
+def autocorrelation(frames, srate, fmin=None, fmax=None, workers=1):
+    """Pick the highest peak of the autocorrelation after its first rise. The
+    confidence is the height of the peak relative to the energy of the
+    frame."""
+
+    frames = floatFrames(frames)
+    (minLag, maxLag) = lagBounds(frames.shape[1], srate, fmin, fmax)
+
+    # The neighbour of the last lag is needed by the interpolation
+    correlation = linearAutocorrelation(frames, min(frames.shape[1], maxLag + 2), workers)
+
+    # Skip the central lobe, then look for the highest peak after the first rise
+    rising = numpy.diff(correlation, axis=1) > 0
+    voiced = rising.any(axis=1)
+    beginning = numpy.maximum(rising.argmax(axis=1), minLag)
+    lags = numpy.arange(correlation.shape[1])
+    candidates = correlation.copy()
+    candidates[(lags < beginning[:, numpy.newaxis]) | (lags > maxLag)] = -numpy.inf
+    voiced &= beginning <= maxLag
+    peak = candidates.argmax(axis=1)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        freqs = srate / interpolatePeaks(correlation, peak)
+        confidence = correlation[numpy.arange(len(peak)), peak] / correlation[:, 0]
+    freqs[~voiced] = REST_FREQUENCY
+    confidence = numpy.where(voiced & numpy.isfinite(confidence), numpy.clip(confidence, 0.0, 1.0), 0.0)
+    return freqs, confidence
+
+def yin(frames, srate, fmin=None, fmax=None, workers=1, threshold=0.1):
+    """YIN estimator (de Cheveigne and Kawahara, 2002). The difference
+    function is derived from the FFT autocorrelation and cumulative energies,
+    then normalized by its cumulative mean. The first dip below the threshold
+    is the period, and frames without such a dip are unvoiced. The confidence
+    is one minus the normalized difference at the period. Periods are at most
+    half the frame long, so that at least half of it is compared."""
+
+    frames = floatFrames(frames)
+    (count, length) = frames.shape
+    (minLag, maxLag) = lagBounds(length, srate, fmin, fmax)
+    minLag = max(minLag, 1)
+    maxLag = min(maxLag, length // 2)
+    lags = min(length, maxLag + 2)
+
+    # d(tau) = sum of (x[j] - x[j + tau]) ** 2 for j < length - tau
+    correlation = linearAutocorrelation(frames, lags, workers)
+    energy = numpy.concatenate((numpy.zeros((count, 1), dtype=frames.dtype), numpy.cumsum(frames ** 2, axis=1)),
+                               axis=1)
+    taus = numpy.arange(lags)
+    difference = energy[:, length - taus] + (energy[:, length:length + 1] - energy[:, taus]) - 2.0 * correlation
+
+    # Cumulative mean normalized difference, silent frames never dip
+    cumulative = numpy.cumsum(difference[:, 1:], axis=1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        normalized = difference[:, 1:] * taus[1:].astype(frames.dtype) / cumulative
+    normalized = numpy.concatenate((numpy.ones((count, 1), dtype=normalized.dtype), normalized), axis=1)
+    normalized[~numpy.isfinite(normalized)] = 1.0
+
+    # First lag below the threshold, followed down to its local minimum
+    inRange = (taus >= minLag) & (taus <= maxLag)
+    below = (normalized < threshold) & inRange
+    voiced = below.any(axis=1)
+    first = below.argmax(axis=1)
+    rising = numpy.append(numpy.diff(normalized, axis=1) >= 0, numpy.ones((count, 1), dtype=bool), axis=1)
+    period = (rising & (taus >= first[:, numpy.newaxis])).argmax(axis=1)
+    period = numpy.minimum(period, maxLag)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        freqs = srate / interpolatePeaks(normalized, period)
+    confidence = 1.0 - normalized[numpy.arange(count), period]
+    voiced &= numpy.isfinite(freqs) & (freqs > 0)
+    freqs[~voiced] = REST_FREQUENCY
+    confidence = numpy.where(voiced, numpy.clip(confidence, 0.0, 1.0), 0.0)
+    return freqs, confidence
+
+def harmonicProductSpectrum(frames, srate, fmin=None, fmax=None, workers=1, harmonics=4, padding=4):
+    """Harmonic product spectrum: the magnitude spectrum is multiplied by
+    its copies downsampled by 2 through harmonics, so the fundamental stands
+    out even when a harmonic is louder. Only peaks of the spectrum of which
+    the strongest partial is a harmonic can be the fundamental, so that the
+    leakage of a partial into the bins below it never passes for a
+    subharmonic. The confidence
+    is the share of the energy of the frame lying within the main lobes of
+    the harmonics of the fundamental found. Frequency resolution is the
+    sample rate over padding times the frame length, so this estimator suits
+    short frames of high-register instruments best."""
+
+    frames = floatFrames(frames)
+    (count, length) = frames.shape
+    size = 1 << (padding * length - 1).bit_length()
+    magnitude = numpy.abs(rfft(frames * numpy.hanning(length).astype(frames.dtype), size, workers))
+
+    bins = magnitude.shape[1] // harmonics
+    # Missing harmonics are floored, so that a single one does not cancel out
+    # the product at the fundamental
+    floor = 0.01 * magnitude.max(axis=1)[:, numpy.newaxis] + 1e-12
+    logMagnitude = numpy.log(magnitude + floor)
+    product = logMagnitude[:, :bins].copy()
+    for harmonic in range(2, harmonics + 1):
+        product += logMagnitude[:, :bins * harmonic:harmonic]
+
+    binWidth = float(srate) / size
+    lowest = max(1, int(numpy.ceil(fmin / binWidth))) if fmin else 1
+    highest = min(bins - 1, int(fmax / binWidth)) if fmax else bins - 1
+    spectrumBins = numpy.arange(magnitude.shape[1])
+    rows = numpy.arange(count)
+
+    # Interpolated position, in bins, of the vertex of the parabola through
+    # every inner bin of the log spectrum and its two neighbours
+    (prev, curr, next) = (logMagnitude[:, :-2], logMagnitude[:, 1:-1], logMagnitude[:, 2:])
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        positions = (prev - next) / (prev - 2.0 * curr + next) * 0.5 + spectrumBins[1:-1].astype(curr.dtype)
+    strongest = positions[rows, magnitude[:, 1:-1].argmax(axis=1)]
+
+    # Peaks of which the strongest partial is a harmonic
+    inner = magnitude[:, 1:bins - 1]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ratio = strongest[:, numpy.newaxis] / positions[:, :bins - 2]
+        peaks = ((inner >= magnitude[:, :bins - 2]) & (inner >= magnitude[:, 2:bins]) &
+                 (inner > HARMONIC_LEVEL * magnitude.max(axis=1)[:, numpy.newaxis]) &
+                 (numpy.abs(ratio / numpy.maximum(numpy.round(ratio), 1) - 1) < HARMONIC_TOLERANCE))
+    candidates = numpy.full(product.shape, -numpy.inf, dtype=product.dtype)
+    candidates[:, 1:bins - 1][peaks] = product[:, 1:bins - 1][peaks]
+    candidates[:, :lowest] = -numpy.inf
+    candidates[:, highest + 1:] = -numpy.inf
+    peak = candidates.argmax(axis=1)
+    found = numpy.isfinite(candidates[rows, peak])
+
+    freqs = positions[rows, numpy.maximum(peak - 1, 0)] * binWidth
+    # The main lobe of the Hann window spans two bins of the unpadded
+    # spectrum on either side of a partial
+    lobe = 2.0 * size / length
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        partials = freqs[:, numpy.newaxis] / binWidth
+        harmonic = numpy.round(spectrumBins / partials)
+        harmonicBins = ((harmonic >= 1) & (harmonic <= harmonics) &
+                        (numpy.abs(spectrumBins - harmonic * partials) <= lobe))
+        power = magnitude * magnitude
+        confidence = (power * harmonicBins).sum(axis=1) / power.sum(axis=1)
+    voiced = found & (lowest <= highest) & numpy.isfinite(freqs) & (freqs > 0)
+    freqs[~voiced] = REST_FREQUENCY
+    confidence = numpy.where(voiced & numpy.isfinite(confidence), numpy.clip(confidence, 0.0, 1.0), 0.0)
+    return freqs, confidence.astype(freqs.dtype)
+
+registerEstimator("autocorrelation", autocorrelation)
+registerEstimator("yin", yin)
+registerEstimator("hps", harmonicProductSpectrum)
@@ -23,7 +23,11 @@
 import os
 import stat
 import time
+import threading
 import wx
+import cache
+import render
+import transcribe
 
 from wx.lib.delayedresult import startWorker
 from ObjectListView import ObjectListView, ColumnDefn
@@ -40,20 +44,99 @@ class MyFileDropTarget(wx.FileDropTarget):
     def OnDropFiles(self, x, y, filenames):
         """Files dropped event handler."""
 
-        # Expand folders recursively
-        expanded_filenames = []
-        for file in filenames:
-            if os.path.isdir(file):
-                for root, dirnames, filenames in os.walk(file):
-                    expanded_filenames.extend([os.path.join(root, file) for file in filenames])
-            else:
-                expanded_filenames.append(file)
+        # Folders are expanded in the background so large libraries do not
+        # freeze the window
+        self.window.scanFiles(filenames)
+        return True
+
+class FileScanner(threading.Thread):
+    """Background thread expanding dropped paths into the wav files they
+    contain, recursively. Files are reported to the callback on the UI
+    thread in batches, as soon as they are found, until cancelled is set."""
+
+    BATCH_SIZE = 200
+
+    def __init__(self, paths, callback):
+        """Constructor."""
 
-        # Filter out unsupported extensions
-        expanded_filenames = [file for file in expanded_filenames
-                              if os.path.splitext(file)[-1].lower() == ".wav"]
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.paths = paths
+        self.callback = callback
+        self.cancelled = threading.Event()
+
+    def run(self):
+        """Scan the paths and report the files found."""
+
+        batch = []
+        for path, stats in self.scan():
+            if self.cancelled.is_set():
+                return
+            batch.append(FileInfo.fromStat(path, stats))
+            if len(batch) >= self.BATCH_SIZE:
+                wx.CallAfter(self.report, batch)
+                batch = []
+        if batch and not self.cancelled.is_set():
+            wx.CallAfter(self.report, batch)
+
+    def report(self, batch):
+        """Pass a batch of files to the callback, on the UI thread."""
+
+        # Batches still pending when the scan is cancelled are dropped
+        if not self.cancelled.is_set():
+            self.callback(batch)
+
+    def scan(self):
+        """Yield a tuple of the path and the stat result of every wav file."""
+
+        folders = []
+        for path in self.paths:
+            if os.path.isdir(path):
+                folders.append(path)
+            elif isWaveFile(path):
+                yield path, os.stat(path)
+
+        while folders and not self.cancelled.is_set():
+            folder = folders.pop()
+            try:
+                entries = list(scandir(folder))
+            except OSError:
+                continue
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                # Symbolic links to folders are not followed, like os.walk
+                # does, since links to a parent folder would loop
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif isWaveFile(entry.name):
+                    # scandir entries cache their stat result where the OS allows it
+                    yield entry.path, entry.stat()
+
+def isWaveFile(path):
+    """Return whether a path has a supported extension."""
+
+    return os.path.splitext(path)[-1].lower() == ".wav"
+
+try:
+    scandir = os.scandir
+except AttributeError:
+    def scandir(folder):
+        """Fallback for Python versions without os.scandir."""
+
+        for name in os.listdir(folder):
+            yield _DirEntry(os.path.join(folder, name))
+
+    class _DirEntry(object):
+        def __init__(self, path):
+            self.path = path
+            self.name = os.path.basename(path)
+
+        def is_dir(self, follow_symlinks=True):
+            if not follow_symlinks and os.path.islink(self.path):
+                return False
+            return os.path.isdir(self.path)
 
-        self.window.updateDisplay(expanded_filenames)
+        def stat(self):
+            return os.stat(self.path)
 
 class FileInfo(object):
     """File information model."""
@@ -67,15 +150,43 @@ class FileInfo(object):
         self.date_modified = date_modified
         self.size = size
 
+    @classmethod
+    def fromStat(cls, path, file_stats):
+        """Create the information model of a file from its stat result."""
+
+        creation_time = time.strftime("%m/%d/%Y %I:%M %p",
+                                      time.localtime(file_stats[stat.ST_CTIME]))
+        modified_time = time.strftime("%m/%d/%Y %I:%M %p",
+                                      time.localtime(file_stats[stat.ST_MTIME]))
+        file_size = file_stats[stat.ST_SIZE]
+        if file_size > 1024:
+            file_size = file_size / 1024.0
+            if file_size > 1024:
+                file_size = file_size / 1024.0
+                file_size = "%.2f MB" % file_size
+            else:
+                file_size = "%.2f KB" % file_size
+        else:
+            file_size = "%i bytes" % file_size
+
+        return cls(path, creation_time, modified_time, file_size)
+
 class MainPanel(wx.Panel):
     """Polyscribe main panel."""
 
+    PROGRESS_POLL_INTERVAL = 100 # Milliseconds
+
     def __init__(self, parent, converter):
         """Constructor."""
 
         wx.Panel.__init__(self, parent=parent)
         self.converter = converter
         self.file_list = []
+        self.scanners = []
+        self.progressDialog = None
+        self.progress = (0, "Starting...")
+        self.progressTimer = wx.Timer(self)
+        self.cancelEvent = threading.Event()
 
         # Element creation
         file_drop_target = MyFileDropTarget(self)
@@ -91,6 +202,8 @@ class MainPanel(wx.Panel):
         # Event bindings
         self.Bind(wx.EVT_BUTTON, self.OnConvert, self.btn)
         self.Bind(wx.EVT_CHAR_HOOK, self.OnKeyUp)
+        self.Bind(wx.EVT_TIMER, self.OnProgressTimer, self.progressTimer)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.OnDestroy, self)
 
         # Element positioning
         sizer = wx.BoxSizer(wx.VERTICAL)
@@ -108,27 +221,26 @@ class MainPanel(wx.Panel):
                                         style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
 
             if saveDialog.ShowModal() == wx.ID_OK:
+                # The dialog is updated by the conversion worker, while the
+                # event loop keeps the window responsive
+                self.cancelEvent = threading.Event()
+                self.progressDialog = wx.ProgressDialog("Converting to sheet music",
+                                                        "Starting...",
+                                                        maximum=100,
+                                                        parent=self,
+                                                        style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT |
+                                                              wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME)
+                # The dialog is also polled between progress reports, which
+                # stop while LilyPond runs or files are transcribed by other
+                # processes, so that cancelling is noticed at once
+                self.progress = (0, "Starting...")
+                self.progressTimer.Start(self.PROGRESS_POLL_INTERVAL)
+
                 # Start the conversion process in a different thread
                 outputPath = saveDialog.GetPath().replace(".pdf", "")
                 startWorker(self.OnConversionCompleted, self.convertWorker,
                             wargs=([file.path for file in self.file_list], outputPath))
 
-                # Show an indeterminate progress bar while the conversion is happening in the background.
-                self.progressComplete = False
-                self.keepGoing = True
-                progressDialog = wx.ProgressDialog("Converting to sheet music",
-                                                   "This may take a while...",
-                                                   parent=self,
-                                                   style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT)
-
-                while self.keepGoing and not self.progressComplete:
-                    self.keepGoing = progressDialog.Pulse()[0]
-                    wx.MilliSleep(30)
-                progressDialog.Destroy()
-
-                if os.path.exists(outputPath):
-                    os.remove(outputPath)
-
     def OnKeyUp(self, evt):
         """Keyboard keyup event handler."""
 
@@ -140,53 +252,93 @@ class MainPanel(wx.Panel):
 
         evt.Skip()
 
+    def OnDestroy(self, evt):
+        """Panel destruction event handler."""
+
+        self.cancelScans()
+        evt.Skip()
+
     def OnConversionCompleted(self, result):
         """Conversion worker event handler."""
 
-        if result.get():
-            self.progressComplete = True
+        self.progressTimer.Stop()
+        self.progressDialog.Destroy()
+        self.progressDialog = None
+        try:
+            result.get()
+        except transcribe.TranscriptionCancelled:
+            pass
+        except Exception as e:
+            wx.MessageBox("The conversion failed: %s" % e, "Polyscribe", wx.OK | wx.ICON_ERROR, self)
+
+    def OnConversionProgress(self, percent, message):
+        """Conversion progress event handler, called on the UI thread."""
+
+        self.progress = (percent, message)
+        self.updateProgress()
+
+    def OnProgressTimer(self, evt):
+        """Progress dialog polling timer event handler."""
+
+        self.updateProgress()
+
+    def updateProgress(self):
+        """Show the last progress report and cancel the conversion if the
+        user asked to."""
+
+        if self.progressDialog is None or self.cancelEvent.is_set():
+            return
+        # Keep the dialog open at 100% until the worker is done
+        (percent, message) = self.progress
+        if not self.progressDialog.Update(min(percent, 99), message)[0]:
+            self.cancelEvent.set()
+            self.progressDialog.Update(min(percent, 99), "Cancelling...")
 
     def convertWorker(self, filenames, destination):
         """Conversion worker."""
 
-        for progress in self.converter.convert(filenames, destination):
-            if not self.keepGoing:
-                return False
+        def progress(percent, message):
+            wx.CallAfter(self.OnConversionProgress, percent, message)
+
+        for unused_percent in self.converter.convert(filenames, destination,
+                                                     progress=progress, cancel=self.cancelEvent):
+            pass
         return True
 
-    def updateDisplay(self, file_list):
-        """Format and diplay file information inside the ObjectListView."""
+    def scanFiles(self, paths):
+        """Add the wav files found in paths, recursively, without blocking the
+        UI thread."""
 
-        for path in file_list:
-            file_stats = os.stat(path)
-            creation_time = time.strftime("%m/%d/%Y %I:%M %p",
-                                          time.localtime(file_stats[stat.ST_CTIME]))
-            modified_time = time.strftime("%m/%d/%Y %I:%M %p",
-                                          time.localtime(file_stats[stat.ST_MTIME]))
-            file_size = file_stats[stat.ST_SIZE]
-            if file_size > 1024:
-                file_size = file_size / 1024.0
-                if file_size > 1024:
-                    file_size = file_size / 1024.0
-                    file_size = "%.2f MB" % file_size
-                else:
-                    file_size = "%.2f KB" % file_size
-            else:
-                file_size = "%i bytes" % file_size
+        scanner = FileScanner(paths, self.addFiles)
+        self.scanners.append(scanner)
+        scanner.start()
 
-            self.file_list.append(FileInfo(path,
-                                           creation_time,
-                                           modified_time,
-                                           file_size))
+    def cancelScans(self):
+        """Stop the folder scans in progress, dropping the files they have
+        not reported yet."""
 
-        self.olv.SetObjects(self.file_list)
+        for scanner in self.scanners:
+            scanner.cancelled.set()
+        self.scanners = []
+
+    def addFiles(self, file_infos):
+        """Append file information models to the ObjectListView."""
+
+        self.file_list.extend(file_infos)
+        self.olv.AddObjects(file_infos)
+        self.scanners = [scanner for scanner in self.scanners if scanner.is_alive()]
+
+    def updateDisplay(self, file_list):
+        """Format and diplay file information inside the ObjectListView."""
+
+        self.addFiles([FileInfo.fromStat(path, os.stat(path)) for path in file_list])
 
     def removeFiles(self, file_list):
         """Remove files and update the ObjectListView."""
 
         for file in file_list:
             self.file_list.remove(file)
-        self.olv.SetObjects(self.file_list)
+        self.olv.RemoveObjects(file_list)
 
     def setFiles(self):
         """Initialize the ObjectListView."""
@@ -204,13 +356,39 @@ class MainFrame(wx.Frame):
         """Constructor."""
 
         wx.Frame.__init__(self, None, title="Polyscribe", size=(650,500))
+        self.converter = converter
         panel = MainPanel(self, converter)
 
         menu = wx.MenuBar()
+        optionsMenu = wx.Menu()
+        self.cacheItem = optionsMenu.AppendCheckItem(wx.ID_ANY, "Use transcription and render caches")
+        self.cacheItem.Check(converter is not None and converter.cache is not None)
+        clearCacheItem = optionsMenu.Append(wx.ID_ANY, "Clear transcription and render caches")
+        menu.Append(optionsMenu, "&Options")
         self.SetMenuBar(menu)
 
+        # Event bindings
+        self.Bind(wx.EVT_MENU, self.OnToggleCache, self.cacheItem)
+        self.Bind(wx.EVT_MENU, self.OnClearCache, clearCacheItem)
+
         self.Show()
 
+    def OnToggleCache(self, evt):
+        """Use transcription cache menu item event handler."""
+
+        if self.converter:
+            self.converter.cache = cache.TranscriptionCache() if self.cacheItem.IsChecked() else None
+            self.converter.renderer.cache = render.RenderCache() if self.cacheItem.IsChecked() else None
+
+    def OnClearCache(self, evt):
+        """Clear transcription cache menu item event handler."""
+
+        if self.converter and self.converter.cache:
+            self.converter.cache.clear()
+        else:
+            cache.TranscriptionCache().clear()
+        render.RenderCache().clear()
+
 if __name__ == "__main__":
     # Test code
     app = wx.App(False)
@@ -20,36 +20,245 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+# Modules loaded by a conversion, in import order
+PIPELINE_MODULES = ["numpy", "scipy.ndimage", "music21", "audiofile", "estimators", "rhythm", "cache", "render", "writers", "transcribe", "presets", "convert"]
+
+def reportImportTimes(modules):
+    """Print how long importing each module takes, including the time spent
+    importing its dependencies that were not loaded yet."""
+
+    import time
+
+    total = 0.0
+    for name in modules:
+        start = time.time()
+        __import__(name)
+        elapsed = time.time() - start
+        total += elapsed
+        print("%-16s %8.1f ms" % (name, elapsed * 1000))
+    print("%-16s %8.1f ms" % ("total", total * 1000))
+
+def submitToDaemon(parser, args, overrides):
+    """Submit the conversion of the command line to a daemon, show its
+    progress while it runs and return the exit status."""
+
+    import os
+    import sys
+    import daemon
+
+    if not args.input:
+        parser.error("at least one input file is required")
+    missing = [filename for filename in args.input if not os.path.isfile(filename)]
+    if missing:
+        parser.error("input file(s) not found: %s" % ", ".join(missing))
+    output = args.output[0] if args.output else "output"
+    # Preset paths are resolved by the daemon, from its own working directory
+    preset = os.path.abspath(args.preset) if args.preset and os.path.exists(args.preset) else args.preset
+
+    client = daemon.DaemonClient(args.daemon)
+    job = None
+    try:
+        job = client.submit(args.input, output, args.format, overrides, preset, args.priority)
+        for job in client.follow(job["id"]):
+            if sys.stderr.isatty():
+                sys.stderr.write("\r%3i%% %-60s" % (job["progress"], job["message"][:60]))
+    except daemon.DaemonError as e:
+        sys.stderr.write("polyscribe.py: %s\n" % e)
+        return 1
+    except KeyboardInterrupt:
+        if job is not None:
+            try:
+                client.cancel(job["id"])
+            except daemon.DaemonError:
+                pass
+        return 1
+    if sys.stderr.isatty():
+        sys.stderr.write("\n")
+
+    if job["status"] == "failed":
+        sys.stderr.write("polyscribe.py: the conversion failed: %s\n" % job["error"])
+    elif job["status"] == "cancelled":
+        sys.stderr.write("polyscribe.py: the conversion was cancelled\n")
+    return 0 if job["status"] == "done" else 1
+
 if __name__ == "__main__":
     import sys
-    import convert
+    import multiprocessing
 
-    converter = convert.AudioToSheetMusicConverter()
+    # Required by worker processes of bundled applications on Windows
+    multiprocessing.freeze_support()
 
     if len(sys.argv) < 2:
         import wx
         import gui
+        import convert
 
         # Launch the graphic user interface if no command-line arguments are supplied
         app = wx.App(False)
-        frame = gui.MainFrame(converter)
+        frame = gui.MainFrame(convert.AudioToSheetMusicConverter())
         app.MainLoop()
     else:
         import os
         import argparse
 
-        # Parse command-line arguments
+        # Parse command-line arguments, the conversion modules are only
+        # imported once they are known to be needed
         parser = argparse.ArgumentParser(description="convert polyphonic multi-track audio to sheet music")
-        parser.add_argument("input", metavar="INPUT", type=str, nargs="+", help="input file(s) path(s)")
+        parser.add_argument("input", metavar="INPUT", type=str, nargs="*", help="input file(s) path(s)")
         parser.add_argument("--output", type=str, nargs=1, help="output file path (without extension)")
+        parser.add_argument("--format", choices=["pdf", "ly", "musicxml", "midi"], default="pdf",
+                            help="output file format, musicxml and midi files are written without lilypond")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="number of processes transcribing input files, or segments of a single long "
+                                 "input file, in parallel (0 for one per CPU core)")
+        parser.add_argument("--batch", type=str, metavar="MANIFEST",
+                            help="convert every score of a JSON or CSV manifest, --workers scores at a time")
+        parser.add_argument("--journal", type=str, metavar="PATH",
+                            help="journal of a batch used to resume it (MANIFEST.journal by default)")
+        parser.add_argument("--restart", action="store_true",
+                            help="convert every score of a batch again instead of resuming it")
+        parser.add_argument("--preset", type=str, metavar="NAME",
+                            help="transcription options of a preset written by autotune.py, given by name or path; "
+                                 "options given on the command line override it")
+        parser.add_argument("--instrument", type=str,
+                            help="instrument preset limiting the pitch search to its range, such as bass or violin")
+        parser.add_argument("--fmin", type=float, help="lowest fundamental frequency searched, in Hz")
+        parser.add_argument("--fmax", type=float, help="highest fundamental frequency searched, in Hz")
+        parser.add_argument("--decimate", action="store_true",
+                            help="downsample the audio to the lowest rate the pitch range allows")
+        parser.add_argument("--estimator", type=str, default="autocorrelation",
+                            help="pitch estimator: autocorrelation (default), yin or hps")
+        parser.add_argument("--min-confidence", type=float, default=0.0,
+                            help="treat frames whose pitch confidence is below this value (0 to 1) as rests")
+        parser.add_argument("--silence-gate", type=str, metavar="DBFS",
+                            help="treat frames quieter than this level (such as -50) as rests without analyzing "
+                                 "them, or auto to estimate it from the noise floor")
+        parser.add_argument("--precision", choices=["float64", "float32"], default="float64",
+                            help="floating point precision of the frame analysis, float32 is faster")
+        parser.add_argument("--fft-workers", type=int, default=1,
+                            help="number of threads of each FFT (0 for one per CPU core)")
+        parser.add_argument("--render-timeout", type=float, default=600,
+                            help="seconds lilypond may take to typeset a pdf before it is stopped (0 for no limit)")
+        parser.add_argument("--daemon", type=str, metavar="ADDRESS", nargs="?", const="",
+                            help="submit the conversion to a daemon started with daemon.py, listening at a Unix "
+                                 "socket path or a localhost [HOST:]PORT ($POLYSCRIBE_DAEMON or 127.0.0.1:8765 by "
+                                 "default), whose workers, cache and render settings are used")
+        parser.add_argument("--priority", type=int, default=0,
+                            help="priority of the conversion in the queue of the daemon, higher values first")
+        parser.add_argument("--no-cache", action="store_true",
+                            help="transcribe every input file and typeset every pdf from scratch")
+        parser.add_argument("--clear-cache", action="store_true",
+                            help="remove every cached transcription and rendered pdf")
+        parser.add_argument("--import-times", action="store_true",
+                            help="report how long importing each module of the conversion pipeline takes")
+        parser.add_argument("--profile", action="store_true",
+                            help="print the time spent in each stage of the conversion of each file")
+        parser.add_argument("--profile-memory", action="store_true",
+                            help="also measure the allocation peak of each stage (slower)")
+        parser.add_argument("--profile-json", type=str, metavar="PATH",
+                            help="write the stage measurements to a JSON file")
+        parser.add_argument("--cprofile", type=str, metavar="PATH",
+                            help="write cProfile statistics of the main process to a file")
 
         args = parser.parse_args(sys.argv[1:])
 
+        if args.import_times:
+            reportImportTimes(PIPELINE_MODULES)
+            sys.exit(0)
+        if args.clear_cache:
+            import cache
+            import render
+            cache.TranscriptionCache().clear()
+            render.RenderCache().clear()
+            if not args.input:
+                sys.exit(0)
+        if args.workers < 0 or args.fft_workers < 0:
+            parser.error("the number of workers cannot be negative")
+        if args.render_timeout < 0:
+            parser.error("the render timeout cannot be negative")
+
+        # Options of the preset are kept unless given on the command line
+        overrides = {}
+        for key, dest in (("instrument", "instrument"), ("fmin", "fmin"), ("fmax", "fmax"), ("decimate", "decimate"),
+                          ("estimator", "estimator"), ("minConfidence", "min_confidence"),
+                          ("precision", "precision"), ("silenceGate", "silence_gate"),
+                          ("fftWorkers", "fft_workers")):
+            if getattr(args, dest) != parser.get_default(dest):
+                overrides[key] = getattr(args, dest)
+
+        if args.daemon is not None:
+            if args.batch:
+                parser.error("batch manifests cannot be submitted to a daemon")
+            sys.exit(submitToDaemon(parser, args, overrides))
+
+        import transcribe
+        settings = {}
+        if args.preset:
+            import presets
+            try:
+                settings = presets.loadPreset(args.preset)
+            except (IOError, OSError, ValueError) as e:
+                parser.error("cannot load the preset: %s" % e)
+        settings.update(overrides)
+        try:
+            options = transcribe.TranscriptionOptions(**settings)
+        except ValueError as e:
+            parser.error(str(e))
+
+        if args.batch:
+            if args.input:
+                parser.error("input files cannot be given along with a batch manifest")
+
+            import batch
+            try:
+                jobs = batch.loadManifest(args.batch, args.format, options)
+            except (IOError, OSError, ValueError) as e:
+                parser.error("cannot read the batch manifest: %s" % e)
+            journal = batch.BatchJournal(args.journal or args.batch + ".journal")
+
+            def reportProgress(result):
+                sys.stderr.write("%s %s\n" % (result["status"], result["output"]))
+            results = batch.runBatch(jobs, journal, args.workers, not args.no_cache, options, resume=not args.restart,
+                                     callback=reportProgress, renderTimeout=args.render_timeout)
+            batch.printReport(results)
+            sys.exit(1 if any(result["status"] == "failed" for result in results) else 0)
+
+        if not args.input:
+            parser.error("at least one input file is required")
+        missing = [filename for filename in args.input if not os.path.isfile(filename)]
+        if missing:
+            parser.error("input file(s) not found: %s" % ", ".join(missing))
+
         # Expand path arguments into absolute paths
-        input = [os.path.abspath(filename) for filename in args.input if os.path.exists(filename)]
+        input = [os.path.abspath(filename) for filename in args.input]
         output = args.output[0] if args.output else "output"
         output = os.path.abspath(output)
 
+        import convert
+        import render
+        import profiling
+
+        profiler = None
+        if args.profile or args.profile_memory or args.profile_json:
+            profiler = profiling.StageProfiler(traceMemory=args.profile_memory)
+        renderer = render.LilyPondRenderer(timeout=args.render_timeout,
+                                           cache=None if args.no_cache else render.RenderCache())
+        converter = convert.AudioToSheetMusicConverter(workers=args.workers, useCache=not args.no_cache,
+                                                       options=options, profiler=profiler, renderer=renderer)
+
+        if args.cprofile:
+            import cProfile
+            functionProfiler = cProfile.Profile()
+            functionProfiler.enable()
+
         # Convert input files and output the result
-        for progress in converter.convert(input, output): continue
-        os.remove(output)
+        for progress in converter.convert(input, output, args.format): continue
+
+        if args.cprofile:
+            functionProfiler.disable()
+            functionProfiler.dump_stats(args.cprofile)
+        if profiler is not None:
+            if args.profile or args.profile_memory:
+                profiler.printSummary()
+            if args.profile_json:
+                profiler.writeJson(args.profile_json)
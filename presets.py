@@ -0,0 +1,92 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import json
+import time
+import errno
+import transcribe
+
+PRESET_EXTENSION = ".json"
+
+# Transcription options a preset may set
+OPTION_KEYS = ("blocksize", "smoothLevels", "smoothingMethod", "minNoteFrames", "minRestFrames", "instrument",
+               "fmin", "fmax", "decimate", "estimator", "minConfidence", "precision", "silenceGate", "durations")
+
+def defaultPresetDirectory():
+    """Return the directory where presets are looked up by name."""
+
+    if os.environ.get("POLYSCRIBE_PRESET_DIR"):
+        return os.environ["POLYSCRIBE_PRESET_DIR"]
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(base, "polyscribe", "presets")
+
+def presetPath(name):
+    """Return the path of a preset given by name or by path."""
+
+    if os.path.exists(name) or os.path.dirname(name) or name.endswith(PRESET_EXTENSION):
+        return name
+    return os.path.join(defaultPresetDirectory(), name + PRESET_EXTENSION)
+
+def loadPreset(name):
+    """Return the dictionary of transcription options of a preset given by
+    name or by path."""
+
+    with open(presetPath(name)) as f:
+        preset = json.load(f)
+    settings = preset.get("options", {})
+    unknown = sorted(set(settings) - set(OPTION_KEYS))
+    if unknown:
+        raise ValueError("Unknown option(s) in preset %s: %s" % (name, ", ".join(unknown)))
+    return settings
+
+def presetOptions(name, **overrides):
+    """Return the TranscriptionOptions of a preset, with some options
+    overridden."""
+
+    settings = loadPreset(name)
+    settings.update(overrides)
+    return transcribe.TranscriptionOptions(**settings)
+
+def savePreset(name, settings, details=None, filename=None):
+    """Write a preset with the given transcription options and details about
+    how it was chosen, to the preset directory or to a file, and return its
+    path."""
+
+    unknown = sorted(set(settings) - set(OPTION_KEYS))
+    if unknown:
+        raise ValueError("Unknown option(s): %s" % ", ".join(unknown))
+    transcribe.TranscriptionOptions(**settings) # Validate the options
+
+    filename = filename or os.path.join(defaultPresetDirectory(), name + PRESET_EXTENSION)
+    directory = os.path.dirname(os.path.abspath(filename))
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    preset = {"name": name, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "options": settings}
+    preset.update(details or {})
+    with open(filename, 'w') as f:
+        json.dump(preset, f, indent=2, sort_keys=True)
+    return filename
@@ -0,0 +1,160 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+import json
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+class StageProfiler(object):
+    """Collect the wall time, frame count, note count and allocation peak of
+    every stage of a conversion.
+
+    Each measurement is a dictionary with the keys file, stage, seconds,
+    frames, notes and peakMemory (None when not measured). It is appended to
+    records and passed to the callback, if any, as soon as the stage ends."""
+
+    def __init__(self, callback=None, traceMemory=False):
+        """Constructor. Allocation peaks are only measured if traceMemory is
+        set, since tracing slows allocations down noticeably."""
+
+        self.callback = callback
+        self.traceMemory = traceMemory and tracemalloc is not None and hasattr(tracemalloc, "reset_peak")
+        self.records = []
+
+    def stage(self, name, filename=None):
+        """Return a context manager measuring a stage. Its frames and notes
+        attributes can be set within the with statement."""
+
+        return _Stage(self, name, filename)
+
+    def add(self, record):
+        """Add a measurement, possibly made by another process."""
+
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def summary(self):
+        """Return the measurements aggregated per stage, in order of first
+        appearance, as (stage, calls, seconds, frames, notes, peakMemory)."""
+
+        order = []
+        totals = {}
+        for record in self.records:
+            if record["stage"] not in totals:
+                order.append(record["stage"])
+                totals[record["stage"]] = [0, 0.0, None, None, None]
+            total = totals[record["stage"]]
+            total[0] += 1
+            total[1] += record["seconds"]
+            if record["frames"] is not None:
+                total[2] = (total[2] or 0) + record["frames"]
+            if record["notes"] is not None:
+                total[3] = (total[3] or 0) + record["notes"]
+            if record["peakMemory"] is not None:
+                total[4] = max(total[4] or 0, record["peakMemory"])
+        return [tuple([stage] + totals[stage]) for stage in order]
+
+    def printSummary(self, out=None):
+        """Print a table of the measurements of every file, followed by the
+        totals of every stage."""
+
+        out = out or sys.stderr
+        row = "%-32s %-14s %10s %10s %8s %10s\n"
+        out.write(row % ("File", "Stage", "Seconds", "Frames", "Notes", "Peak MB"))
+        for record in self.records:
+            out.write(row % (_shorten(record["file"] or "-", 32), record["stage"], "%.4f" % record["seconds"],
+                             _format(record["frames"]), _format(record["notes"]),
+                             _megabytes(record["peakMemory"])))
+        for (stage, calls, seconds, frames, notes, peakMemory) in self.summary():
+            out.write(row % ("total (%i)" % calls, stage, "%.4f" % seconds,
+                             _format(frames), _format(notes), _megabytes(peakMemory)))
+
+    def writeJson(self, filename):
+        """Write the measurements to a JSON file."""
+
+        with open(filename, 'w') as f:
+            json.dump({"records": self.records}, f, indent=2)
+
+class _Stage(object):
+    """Measurement of a single stage, used as a context manager."""
+
+    def __init__(self, profiler, name, filename):
+        self.profiler = profiler
+        self.name = name
+        self.filename = filename
+        self.frames = None
+        self.notes = None
+
+    def __enter__(self):
+        if self.profiler.traceMemory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.baseline = tracemalloc.get_traced_memory()[0]
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.time() - self.start
+        peakMemory = None
+        if self.profiler.traceMemory:
+            peakMemory = tracemalloc.get_traced_memory()[1] - self.baseline
+        self.profiler.add({"file": self.filename, "stage": self.name, "seconds": seconds,
+                           "frames": self.frames, "notes": self.notes, "peakMemory": peakMemory})
+
+class NullProfiler(object):
+    """Profiler doing nothing, used when profiling is disabled."""
+
+    records = []
+
+    def stage(self, name, filename=None):
+        return _NULL_STAGE
+
+    def add(self, record):
+        pass
+
+class _NullStage(object):
+    """Context manager of NullProfiler stages."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NULL_STAGE = _NullStage()
+NULL_PROFILER = NullProfiler()
+
+def _format(value):
+    return "-" if value is None else str(value)
+
+def _megabytes(value):
+    return "-" if value is None else "%.1f" % (value / 1048576.0)
+
+def _shorten(text, width):
+    return text if len(text) <= width else "..." + text[-(width - 3):]
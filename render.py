@@ -0,0 +1,218 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import time
+import errno
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+import multiprocessing.pool
+import cache
+
+DEFAULT_TIMEOUT = 600 # Seconds a single LilyPond run may take
+POLL_INTERVAL = 0.1 # Seconds between checks of a running LilyPond process
+
+class RenderError(Exception):
+    """LilyPond failed to render a score."""
+
+class RenderTimeout(RenderError):
+    """LilyPond took longer than the timeout to render a score."""
+
+class RenderCancelled(Exception):
+    """A render was cancelled before LilyPond was done."""
+
+def lilypondPath():
+    """Return the LilyPond executable music21 is configured with, falling back
+    to the one found in the PATH like music21 does."""
+
+    from music21 import environment
+
+    path = environment.Environment()["lilypondPath"]
+    if path is not None and os.path.exists(str(path)):
+        return str(path)
+    return "lilypond"
+
+def lilypondSource(score, format="pdf"):
+    """Return the LilyPond source music21 generates for a score, the same way
+    Stream.write does for the given format. Parts without an id of their own
+    are numbered."""
+
+    from music21.lily import translate
+
+    # Staves are named after the ids of the parts, which default to their
+    # memory address; numbering them keeps the source of a score stable
+    # between runs, as the render cache needs
+    for index, part in enumerate(score.parts):
+        if isinstance(part.id, int):
+            part.id = "part%i" % (index + 1)
+
+    converter = translate.LilypondConverter()
+    converter.loadFromMusic21Object(score)
+    if format == "pdf":
+        converter.headerScheme.content = "" # As done by LilypondConverter.createPDF
+    return str(converter.topLevelObject)
+
+class RenderCache(cache.TranscriptionCache):
+    """Persistent cache of the documents rendered by LilyPond, keyed by the
+    hash of their source, so that an unchanged score is never typeset twice."""
+
+    def __init__(self, directory=None, maxSize=cache.DEFAULT_MAX_SIZE):
+        """Constructor."""
+
+        cache.TranscriptionCache.__init__(self, directory or os.path.join(cache.defaultCacheDirectory(), "renders"),
+                                          maxSize)
+
+    def key(self, source, signature):
+        """Return the key of the document rendered from a LilyPond source,
+        with the executable and the format described by a signature string."""
+
+        digest = hashlib.sha1(signature.encode("utf-8"))
+        digest.update(source.encode("utf-8"))
+        return digest.hexdigest()
+
+class LilyPondRenderer(object):
+    """Typeset LilyPond sources into documents.
+
+    Every run happens in its own temporary directory, is killed after the
+    timeout and can be cancelled. Renders submitted from several threads run
+    concurrently, at most workers at a time, and identical sources are served
+    from the cache, if any."""
+
+    def __init__(self, workers=1, timeout=DEFAULT_TIMEOUT, cache=None, lilypond=None):
+        """Constructor. LilyPond is run by the given number of threads, or by
+        one thread per CPU core if workers is 0."""
+
+        self.workers = workers or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.cache = cache
+        self.lilypond = lilypond
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def render(self, source, destination, format="pdf", cancel=None):
+        """Typeset a LilyPond source into the destination file and return
+        whether it was served from the cache. Setting the cancel event kills
+        LilyPond and raises RenderCancelled."""
+
+        lilypond = self.lilypond or lilypondPath()
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(source, "%s\n%s" % (lilypond, format))
+            document = self.cache.get(key)
+            if document is not None:
+                _writeAtomically(destination, document)
+                return True
+
+        directory = tempfile.mkdtemp(prefix="polyscribe-render-")
+        try:
+            sourcePath = os.path.join(directory, "score.ly")
+            with open(sourcePath, 'wb') as f:
+                f.write(source.encode("utf-8"))
+            self._run([lilypond, "-f", format, "-dbackend=ps", "-o", "score", sourcePath], directory, cancel)
+
+            outputPath = os.path.join(directory, "score." + format)
+            if not os.path.exists(outputPath):
+                raise RenderError("LilyPond did not write a %s file" % format)
+            with open(outputPath, 'rb') as f:
+                document = f.read()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        _writeAtomically(destination, document)
+        if key is not None:
+            self.cache.put(key, document)
+        return False
+
+    def submit(self, source, destination, format="pdf", cancel=None, callback=None):
+        """Render a source in the background and return its
+        multiprocessing.pool.AsyncResult. The callback, if any, is called
+        with the result of render once it is done."""
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.pool.ThreadPool(self.workers)
+            return self._pool.apply_async(self.render, (source, destination, format, cancel), callback=callback)
+
+    def close(self):
+        """Wait for the submitted renders and stop the threads."""
+
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def _run(self, command, directory, cancel):
+        """Run LilyPond until it exits, the timeout expires or the cancel
+        event is set."""
+
+        log = tempfile.TemporaryFile(dir=directory)
+        try:
+            try:
+                process = subprocess.Popen(command, cwd=directory, stdout=log, stderr=subprocess.STDOUT)
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    raise RenderError("LilyPond was not found at %s" % command[0])
+                raise
+
+            deadline = time.time() + self.timeout if self.timeout else None
+            while process.poll() is None:
+                if cancel is not None and cancel.is_set():
+                    _kill(process)
+                    raise RenderCancelled()
+                if deadline is not None and time.time() > deadline:
+                    _kill(process)
+                    raise RenderTimeout("LilyPond did not finish within %g seconds" % self.timeout)
+                time.sleep(POLL_INTERVAL)
+
+            if process.returncode != 0:
+                log.seek(0)
+                lines = log.read().decode("utf-8", "replace").strip().splitlines()
+                raise RenderError("LilyPond failed with exit status %i: %s"
+                                  % (process.returncode, "\n".join(lines[-10:])))
+        finally:
+            log.close()
+
+def _kill(process):
+    try:
+        process.kill()
+    except OSError:
+        pass # Already exited
+    process.wait()
+
+def _writeAtomically(filename, data):
+    """Write a file so that readers never see it partially written."""
+
+    (fd, temporaryPath) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        if os.name == "nt" and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(temporaryPath, filename)
+    except Exception:
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+        raise
@@ -0,0 +1,117 @@
+# Copyright (c) 2011 Michael Scott Cuthbert and the music21 Project
+# Copyright (c) 2015 Joel Robichaud
+
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of [project] nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import math
+import numpy
+
+STANDARD_LENGTHS = (0.25, 0.5, 1.0, 1.5, 2.0, 4.0)
+DOTTED_LENGTHS = (0.375, 0.75, 3.0)
+TRIPLET_LENGTHS = (1.0 / 6, 1.0 / 3, 2.0 / 3, 4.0 / 3)
+
+def histogram(data, bins):
+    """Partition a list into a number of bins and return the number of elements
+    in each bins and a set of elements where the first element is the start of
+    the first bin, the last element is the end of the last bin, and every remaining
+    element is the dividing point between one bin and another."""
+
+    data = numpy.asarray(data, dtype=numpy.float64)
+    maxValue = data.max()
+    minValue = data.min()
+    lengthEachBin = (maxValue - minValue) / bins
+
+    binsLimits = minValue + numpy.arange(int(bins) + 1) * lengthEachBin
+
+    # Every bin includes its upper limit, the first one also includes its lower limit
+    indices = numpy.searchsorted(binsLimits[1:], data, side='left')
+    indices = numpy.minimum(indices, int(bins) - 1)
+    container = numpy.bincount(indices, minlength=int(bins))
+    return container, binsLimits
+
+def quarterLengthEstimation(durationList, mostRepeatedQuarterLength=1.0):
+    """Take a list of lengths of notes (measured in audio samples) and try to
+    estimate what the length of a quarter note should be in this list."""
+
+    pdf, bins = histogram(numpy.append(durationList, 0), 8.0)
+
+    # Last bin holding the most durations
+    i = len(pdf) - 1 - numpy.argmax(pdf[::-1])
+    qle = (bins[i] + bins[i + 1]) / 2.0
+
+    if mostRepeatedQuarterLength == 0:
+        mostRepeatedQuarterLength = 1.0
+
+    binPosition = 0 - math.log(mostRepeatedQuarterLength, 2)
+    qle = qle * math.pow(2, binPosition) # Normalize the length to a quarter note
+
+    return qle
+
+class DurationTable(object):
+    """Precomputed table of the quarter lengths that durations are snapped to."""
+
+    def __init__(self, lengths=STANDARD_LENGTHS):
+        """Constructor."""
+
+        self.lengths = numpy.array(sorted(set(lengths)), dtype=numpy.float64)
+        self.thresholds = (self.lengths[:-1] + self.lengths[1:]) / 2.0
+
+    def quantize(self, lengths):
+        """Snap an array of approximated quarter lengths to the closest
+        lengths of the table."""
+
+        return self.lengths[numpy.searchsorted(self.thresholds, lengths, side='left')]
+
+_durationTables = {}
+
+def getDurationTable(dotted=False, triplets=False):
+    """Return the cached duration table with standard lengths and optionally
+    dotted and triplet lengths."""
+
+    key = (dotted, triplets)
+    if key not in _durationTables:
+        lengths = STANDARD_LENGTHS
+        if dotted:
+            lengths = lengths + DOTTED_LENGTHS
+        if triplets:
+            lengths = lengths + TRIPLET_LENGTHS
+        _durationTables[key] = DurationTable(lengths)
+    return _durationTables[key]
+
+def quantizeDurations(durationList, qle, table=None):
+    """Convert a list of durations measured in frames into quarter lengths
+    snapped to a duration table, given the length of a quarter note."""
+
+    if table is None:
+        table = getDurationTable()
+    return table.quantize(numpy.asarray(durationList, dtype=numpy.float64) / qle)
+
+def quantizeDuration(length):
+    """Round an approximated quarterLength duration to better one."""
+
+    return float(getDurationTable().quantize(length))
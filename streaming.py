@@ -0,0 +1,390 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+import collections
+import numpy
+import transcribe
+from rhythm import quarterLengthEstimation, quantizeDurations
+
+# numpy sample types of the raw PCM formats accepted on the command line
+PCM_FORMATS = {"u8": "u1", "s16": "<i2", "s32": "<i4", "f32": "<f4", "f64": "<f8"}
+
+class StreamingTranscriber(object):
+    """Incremental transcription of raw PCM audio fed in chunks.
+
+    Chunks of any size are accepted, either as bytes or as arrays of samples.
+    Every call to feed returns the (event, quarterLength) tuples that were
+    finalized by the new samples, so a note is emitted shortly after it ends
+    instead of once the whole recording is available. Internal state is
+    bounded: only the samples of an incomplete block, the frames of a
+    smoothing window, the current run of frames and the lengths of the last
+    tempoWindow events are kept.
+
+    The lookahead, in seconds, is the amount of audio gathered before an
+    analysis pass. Larger values analyze more frames per FFT pass, smaller
+    values emit events sooner. Events are finalized at most lookahead plus
+    half a smoothing window after their last frame was fed.
+
+    The segmentation follows the rules of segmentFrames, with three
+    differences from a batch transcription: the first and last frames are
+    smoothed with repeated edge frames rather than averaged, each run of
+    frames takes its own average octave whereas the batch octave averaging
+    lags by one frame, which can move a boundary by a frame, and the duration
+    of every event is quantized with a tempo estimated from the previous
+    events only. The silence gate needs a fixed level, since the noise floor
+    of a stream is unknown."""
+
+    def __init__(self, srate, channels=1, dtype="<i2", options=None, lookahead=0.25, tempoWindow=64,
+                 durationTable=None):
+        """Constructor. Raw bytes are interpreted as interleaved samples of
+        the given numpy type."""
+
+        self.srate = srate
+        self.channels = channels
+        self.dtype = numpy.dtype(dtype)
+        self.options = options or transcribe.TranscriptionOptions()
+        self.durationTable = durationTable
+        self.table = transcribe.getPitchTable(self.options.useScale)
+        self.batchFrames = max(1, int(lookahead * srate / self.options.blocksize))
+
+        factor = 1
+        if self.options.decimate:
+            factor = transcribe.decimationFactor(srate, self.options.blocksize, self.options.fmax)
+        self._precision = transcribe.PRECISIONS[self.options.precision]
+        self._decimator = transcribe.Decimator(factor, self._precision) if factor > 1 else None
+        self._analysisRate = float(srate) / factor
+        if self.options.silenceGate == "auto":
+            raise ValueError("The silence gate of a stream needs a level in dBFS")
+        self._fullScale = 1.0 if self.dtype.kind == "f" else float(2 ** (8 * self.dtype.itemsize - 1))
+        self.qle = None # Current length of a quarter note, in frames
+
+        self._bytes = b""
+        self._samples = numpy.zeros(0, dtype=self._precision)
+        self._window = None # Detected frequencies of the frames still needed for smoothing
+        self._frames = 0 # Index of the next frame to segment
+        self._run = None # Open run of identical pitch names as [nameId, degree, start, length, octaveSum]
+        self._runs = 0 # Number of runs closed so far
+        self._singleRuns = 0 # Number of consecutive single-frame runs before the open run
+        self._previousSkipped = False
+        self._restStart = None # First frame of the short runs since the last note
+        self._restLength = 0
+        self._noteEmitted = False
+        self._lengths = collections.deque(maxlen=tempoWindow)
+        self._voiced = None if self.options.silenceGate is None else numpy.zeros(0, dtype=bool)
+        self._gatedRest = None # Open rest of unvoiced frames as [start, length]
+
+    def tempo(self):
+        """Return the current tempo estimate in quarter notes per minute, or
+        None before the first event."""
+
+        if not self.qle:
+            return None
+        return 60.0 * self.srate / (self.qle * self.options.blocksize)
+
+    def feed(self, chunk):
+        """Add a chunk of audio and return the list of finalized events."""
+
+        self._samples = numpy.concatenate((self._samples, self._toSamples(chunk)))
+        if len(self._samples) < self.batchFrames * self.options.blocksize:
+            return []
+        return self._process(False)
+
+    def flush(self):
+        """Analyze the remaining audio and return the last events. Trailing
+        samples that do not fill a whole block are dropped."""
+
+        return self._process(True)
+
+    def _toSamples(self, chunk):
+        """Convert a chunk of bytes or samples to a one-dimensional array of
+        mono samples."""
+
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            data = self._bytes + bytes(chunk)
+            frameBytes = self.dtype.itemsize * self.channels
+            usable = len(data) - len(data) % frameBytes
+            self._bytes = data[usable:]
+            chunk = numpy.frombuffer(data[:usable], dtype=self.dtype)
+
+        samples = numpy.asarray(chunk)
+        if self.dtype == numpy.uint8 and samples.dtype == numpy.uint8:
+            # 8-bit PCM is unsigned, center it around zero
+            samples = samples.astype(numpy.int16) - 128
+        samples = samples.reshape(-1, self.channels)
+        if self.channels == 1 or self.options.channel is not None:
+            return samples[:, self.options.channel or 0].astype(self._precision)
+        return samples.mean(axis=1, dtype=self._precision)
+
+    def _process(self, final):
+        """Analyze the complete blocks gathered so far and segment the frames
+        whose smoothing window is complete."""
+
+        blocksize = self.options.blocksize
+        count = len(self._samples) // blocksize
+        blocks = self._samples[:count * blocksize].reshape(count, blocksize)
+        self._samples = self._samples[count * blocksize:]
+
+        freqs = numpy.zeros(0)
+        if count:
+            voiced = None
+            if self.options.silenceGate is not None:
+                voiced = transcribe.gateFrames(transcribe.energy(blocks), self._fullScale, self.options.silenceGate)
+            if self._decimator is not None:
+                blocks = self._decimator.process(blocks)
+            if voiced is not None:
+                self._voiced = numpy.concatenate((self._voiced, voiced))
+                freqs = numpy.full(count, transcribe.REST_FREQUENCY, dtype=self._precision)
+                blocks = blocks[voiced]
+            if voiced is None or len(blocks):
+                (voicedFreqs, unused_confidence) = transcribe.estimateFrames(blocks, self._analysisRate,
+                                                                             self.options.estimator,
+                                                                             self.options.fmin, self.options.fmax,
+                                                                             self.options.minConfidence,
+                                                                             self.options.fftWorkers)
+                if voiced is None:
+                    freqs = voicedFreqs
+                else:
+                    freqs[voiced] = voicedFreqs
+        detected = self.table.frequencies(*self.table.quantize(freqs)) if count else freqs
+
+        events = self._segment(self._smooth(detected, final))
+        if final:
+            if self._run is not None:
+                events.extend(self._closeRun())
+            self._run = None
+            if self._gatedRest is not None:
+                events.extend(self._emit(transcribe.NoteEvent(None, None, None, *self._gatedRest)))
+            self._gatedRest = None
+        return events
+
+    def _smooth(self, detected, final):
+        """Return the smoothed frequencies of the frames whose window is
+        complete, keeping the frames needed by the next windows."""
+
+        smoothLevels = max(1, self.options.smoothLevels)
+        head = smoothLevels // 2
+        tail = smoothLevels - head
+
+        if self._window is None:
+            if len(detected) == 0:
+                return numpy.zeros(0, dtype=int)
+            # The stream starts by repeating its first frame, like edges="nearest"
+            self._window = numpy.repeat(detected[:1], head)
+        window = numpy.concatenate((self._window, detected))
+        if final and len(window):
+            window = numpy.concatenate((window, numpy.repeat(window[-1:], tail - 1)))
+
+        ready = len(window) - (smoothLevels - 1)
+        if ready <= 0:
+            self._window = window
+            return numpy.zeros(0, dtype=int)
+
+        smoothed = transcribe.smoothFrequencies(window, smoothLevels, inPlace=False,
+                                                method=self.options.smoothingMethod, edges="nearest")
+        self._window = window[ready:]
+        return smoothed[head:head + ready]
+
+    def _segment(self, smoothed):
+        """Segment the next smoothed frames and return the events finalized
+        by the runs that ended. Stretches of unvoiced frames are rests, like
+        in segmentFrames."""
+
+        events = []
+        if len(smoothed) == 0:
+            return events
+
+        if self._voiced is None:
+            events = self._extendRuns(smoothed, self._frames)
+        else:
+            voiced = self._voiced[:len(smoothed)]
+            self._voiced = self._voiced[len(smoothed):]
+            (starts, lengths) = transcribe.runLengths(voiced)
+            for start, length in zip(starts, lengths):
+                if voiced[start]:
+                    events.extend(self._extendRuns(smoothed[start:start + length], self._frames + int(start)))
+                else:
+                    events.extend(self._extendGatedRest(self._frames + int(start), int(length)))
+
+        self._frames += len(smoothed)
+        return events
+
+    def _extendRuns(self, smoothed, first):
+        """Extend the open run of pitch names with smoothed frames starting at
+        the given frame and return the events finalized by the runs that
+        ended."""
+
+        events = []
+        (degrees, octaves) = self.table.quantize(smoothed)
+        names = self.table.nameIds[degrees]
+        (starts, lengths) = transcribe.runLengths(names)
+        for start, length in zip(starts, lengths):
+            octaveSum = int(octaves[start:start + length].sum())
+            if self._run is not None and self._run[0] == names[start]:
+                self._run[3] += int(length)
+                self._run[4] += octaveSum
+                continue
+            if self._run is not None:
+                events.extend(self._closeRun())
+            self._run = [names[start], degrees[start], first + int(start), int(length), octaveSum]
+        return events
+
+    def _extendGatedRest(self, start, length):
+        """Close the voiced stretch, if any, and extend the rest of unvoiced
+        frames. The next voiced stretch is segmented on its own."""
+
+        events = []
+        if self._run is not None:
+            events.extend(self._closeRun())
+            self._run = None
+        if self._gatedRest is None:
+            self._gatedRest = [start, 0]
+            self._runs = 0
+            self._singleRuns = 0
+            self._previousSkipped = False
+            self._restStart = None
+            self._restLength = 0
+        self._gatedRest[1] += length
+        return events
+
+    def _closeRun(self):
+        """Segment the open run and return the finalized events. The first
+        frame of the signal forms a run of its own."""
+
+        (unused_nameId, degree, start, length, octaveSum) = self._run
+
+        # Every frame of the run takes the average octave of the run
+        octave = octaveSum // length
+        if self._runs == 0 and length > 1:
+            return self._countRun(degree, octave, start, 1) + self._countRun(degree, octave, start + 1, length - 1)
+        return self._countRun(degree, octave, start, length)
+
+    def _countRun(self, degree, octave, start, length):
+        """Apply the rules of segmentFrames to a run of identical pitches:
+        turn it into a note, preceded by a rest when enough frames of short
+        runs came before it, or add its frames to the following rest."""
+
+        index = self._runs
+        self._runs += 1
+        position = self._singleRuns
+        self._singleRuns = self._singleRuns + 1 if length == 1 else 0
+
+        # A single-frame run right after a counted run is skipped entirely
+        if length == 1 and (position + (index == position)) % 2 == 0:
+            self._previousSkipped = True
+            return []
+
+        # Counted runs lose their first frame unless the previous run was skipped
+        if index > 0 and not self._previousSkipped:
+            start += 1
+            length -= 1
+        self._previousSkipped = False
+
+        if length < self.options.minNoteFrames:
+            if self._restStart is None:
+                self._restStart = start
+            self._restLength += length
+            return []
+
+        events = []
+        restLength = self._restLength if self._restLength >= self.options.minRestFrames else 0
+        if self._gatedRest is not None:
+            # Short runs following unvoiced frames join their rest
+            events.extend(self._emit(transcribe.NoteEvent(None, None, None, self._gatedRest[0],
+                                                          self._gatedRest[1] + restLength)))
+        elif restLength:
+            events.extend(self._emit(transcribe.NoteEvent(None, None, None, self._restStart, restLength)))
+        self._gatedRest = None
+        self._restStart = None
+        self._restLength = 0
+
+        midi = float(self.table.midi(degree, octave))
+        events.extend(self._emit(transcribe.NoteEvent(self.table.names[degree], int(octave), midi,
+                                                      start, length)))
+        return events
+
+    def _emit(self, event):
+        """Quantize the duration of an event with the current tempo estimate.
+        Rests before the first note are dropped."""
+
+        if event.name is None and not self._noteEmitted:
+            return []
+        self._noteEmitted = True
+
+        self._lengths.append(event.length)
+        self.qle = quarterLengthEstimation(list(self._lengths))
+        quarterLength = quantizeDurations([event.length], self.qle, self.durationTable)[0]
+        return [(event, float(quarterLength))]
+
+def transcribeStream(stream, srate, channels=1, dtype="<i2", options=None, lookahead=0.25, chunkSize=4096):
+    """Read raw PCM audio from a binary file object, such as a pipe or
+    standard input, and yield (event, quarterLength) tuples as soon as they
+    are finalized."""
+
+    transcriber = StreamingTranscriber(srate, channels, dtype, options, lookahead)
+
+    # read1 returns whatever is available instead of waiting for a full chunk
+    read = getattr(stream, "read1", stream.read)
+    while True:
+        chunk = read(chunkSize)
+        if not chunk:
+            break
+        for result in transcriber.feed(chunk):
+            yield result
+    for result in transcriber.flush():
+        yield result
+
+if __name__ == "__main__":
+    import argparse
+    import estimators
+
+    parser = argparse.ArgumentParser(description="transcribe raw PCM audio read from a file or a pipe as it arrives")
+    parser.add_argument("input", metavar="INPUT", type=str, nargs="?", default="-",
+                        help="raw PCM file path, standard input by default")
+    parser.add_argument("--srate", type=int, default=44100, help="sample rate in Hz")
+    parser.add_argument("--channels", type=int, default=1, help="number of interleaved channels")
+    parser.add_argument("--format", choices=sorted(PCM_FORMATS), default="s16", help="sample format")
+    parser.add_argument("--lookahead", type=float, default=0.25,
+                        help="seconds of audio gathered before each analysis pass")
+    parser.add_argument("--instrument", choices=sorted(transcribe.INSTRUMENT_PRESETS),
+                        help="limit the pitch search to the range of an instrument")
+    parser.add_argument("--decimate", action="store_true",
+                        help="downsample the audio to the lowest rate the pitch range allows")
+    parser.add_argument("--estimator", choices=estimators.estimatorNames(), default="autocorrelation",
+                        help="pitch estimator")
+    parser.add_argument("--silence-gate", type=float, metavar="DBFS",
+                        help="skip the analysis of frames quieter than this level, such as -50")
+    args = parser.parse_args()
+
+    stream = open(args.input, 'rb') if args.input != "-" else getattr(sys.stdin, "buffer", sys.stdin)
+    options = transcribe.TranscriptionOptions(instrument=args.instrument, decimate=args.decimate,
+                                              estimator=args.estimator, silenceGate=args.silence_gate)
+    secondsPerFrame = float(options.blocksize) / args.srate
+    try:
+        for event, quarterLength in transcribeStream(stream, args.srate, args.channels, PCM_FORMATS[args.format],
+                                                     options, args.lookahead):
+            name = "rest" if event.name is None else "%s%i" % (event.name, event.octave)
+            sys.stdout.write("%8.3f %-5s %s\n" % (event.start * secondsPerFrame, name, quarterLength))
+            sys.stdout.flush()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+# The modules of polyscribe live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def melodyFile(tmpdir):
+    """Path of a short synthetic melody interrupted by rests."""
+
+    import benchmark
+
+    filename = str(tmpdir.join("melody.wav"))
+    benchmark.writeWave(filename, benchmark.synthesizeMelody(4, harmonics=3, restProbability=0.2))
+    return filename
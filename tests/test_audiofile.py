@@ -0,0 +1,65 @@
+import wave
+import numpy
+import pytest
+import scipy.io.wavfile
+import audiofile
+
+def samples(sampwidth, channels=2, count=1000, seed=0):
+    """Random integer samples spanning the whole range of a sample width."""
+
+    high = 2 ** (8 * sampwidth - 1)
+    return numpy.random.RandomState(seed).randint(-high, high, size=(count, channels)).astype(numpy.int64)
+
+def writePcm(filename, data, sampwidth):
+    """Write integer samples with the wave module."""
+
+    if sampwidth == 1:
+        raw = (data + 128).astype(numpy.uint8).tobytes()
+    else:
+        # Little-endian bytes of every sample, truncated to the sample width
+        raw = data.astype("<i8").view(numpy.uint8).reshape(data.shape + (8,))[..., :sampwidth].tobytes()
+    wv = wave.open(filename, 'w')
+    wv.setnchannels(data.shape[1])
+    wv.setsampwidth(sampwidth)
+    wv.setframerate(44100)
+    wv.writeframes(raw)
+    wv.close()
+
+def readBlocks(filename, blocksize, channel=None):
+    wv = audiofile.WaveFile(filename)
+    try:
+        return numpy.concatenate(list(wv.blocks(blocksize, 3, channel)))
+    finally:
+        wv.close()
+
+@pytest.mark.parametrize("sampwidth", [1, 2, 3, 4])
+def testPcmBlocks(tmpdir, sampwidth):
+    filename = str(tmpdir.join("pcm.wav"))
+    data = samples(sampwidth)
+    writePcm(filename, data, sampwidth)
+
+    # Incomplete trailing blocks are dropped
+    blocks = readBlocks(filename, 64)
+    assert blocks.shape == (15, 64)
+    numpy.testing.assert_array_equal(blocks.ravel(), data[:960].mean(axis=1))
+    for channel in (0, 1):
+        numpy.testing.assert_array_equal(readBlocks(filename, 64, channel).ravel(), data[:960, channel])
+
+@pytest.mark.parametrize("sampwidth", [1, 2])
+def testPcmMatchesScipy(tmpdir, sampwidth):
+    filename = str(tmpdir.join("pcm.wav"))
+    writePcm(filename, samples(sampwidth, channels=1, count=1024), sampwidth)
+    expected = scipy.io.wavfile.read(filename)[1].astype(numpy.int64)
+    if sampwidth == 1:
+        expected -= 128
+    numpy.testing.assert_array_equal(readBlocks(filename, 256).ravel(), expected)
+
+@pytest.mark.parametrize("dtype", [numpy.float32, numpy.float64])
+def testFloatBlocks(tmpdir, dtype):
+    filename = str(tmpdir.join("float.wav"))
+    data = numpy.random.RandomState(1).uniform(-1, 1, size=(1000, 2)).astype(dtype)
+    scipy.io.wavfile.write(filename, 44100, data)
+
+    # Single precision files are mixed down in single precision
+    numpy.testing.assert_allclose(readBlocks(filename, 100).ravel(), data.mean(axis=1), rtol=1e-6)
+    numpy.testing.assert_array_equal(readBlocks(filename, 100, 1).ravel(), data[:, 1])
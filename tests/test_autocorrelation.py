@@ -0,0 +1,45 @@
+import numpy
+import scipy.signal
+import transcribe
+
+def referenceAutocorrelation(signal, srate):
+    """The original autocorrelation of a single frame, through a full
+    convolution with the reversed frame."""
+
+    signal = numpy.array(signal)
+    correlation = scipy.signal.fftconvolve(signal, signal[::-1], mode='full')
+    correlation = correlation[len(correlation) // 2:]
+    positiveDifferences, = numpy.nonzero(numpy.ravel(numpy.diff(correlation) > 0))
+    if len(positiveDifferences) == 0:
+        return 10 # Rest
+    beginning = positiveDifferences[0]
+    peak = numpy.argmax(correlation[beginning:]) + beginning
+    curr = correlation[peak]
+    prev = correlation[peak - 1] if peak - 1 >= 0 else curr
+    next = correlation[peak + 1] if peak + 1 < len(correlation) else curr
+    return srate / ((prev - next) / (prev - 2.0 * curr + next) * 0.5 + peak)
+
+def frames(blocksize, count=40, seed=0):
+    """Frames of harmonic tones, noise and silence."""
+
+    rng = numpy.random.RandomState(seed)
+    t = numpy.arange(blocksize) / 44100.0
+    rows = []
+    for i in range(count):
+        frequency = 440.0 * 2 ** ((rng.randint(36, 96) - 69) / 12.0)
+        rows.append(sum(numpy.sin(2 * numpy.pi * frequency * harmonic * t + rng.rand()) / harmonic
+                        for harmonic in (1, 2, 3)) + rng.randn(blocksize) * 0.01)
+    rows.append(rng.randn(blocksize))
+    rows.append(numpy.zeros(blocksize))
+    return numpy.array(rows) * 16384
+
+def testBatchedAutocorrelationMatchesOneFrameAtATime():
+    for blocksize in (256, 512, 1024):
+        batch = frames(blocksize, seed=blocksize)
+        expected = [referenceAutocorrelation(frame, 44100.0) for frame in batch]
+        numpy.testing.assert_allclose(transcribe.autocorrelationFrames(batch, 44100.0), expected, rtol=1e-9)
+
+def testSingleFrameFunction():
+    frame = frames(512)[0]
+    numpy.testing.assert_allclose(transcribe.autocorrelationFunction(frame, 44100.0),
+                                  referenceAutocorrelation(frame, 44100.0), rtol=1e-9)
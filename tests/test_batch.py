@@ -0,0 +1,19 @@
+import batch
+
+def writeManifest(tmpdir, header, row):
+    tmpdir.join("melody.wav").write("")
+    manifest = tmpdir.join("manifest.csv")
+    manifest.write("output,inputs,%s\nscore,melody.wav,%s\n" % (header, row))
+    return str(manifest)
+
+def testCsvSilenceGate(tmpdir):
+    (job,) = batch.loadManifest(writeManifest(tmpdir, "silenceGate", "auto"))
+    assert job.options[0].silenceGate == "auto"
+    (job,) = batch.loadManifest(writeManifest(tmpdir, "silenceGate", "-50"))
+    assert job.options[0].silenceGate == -50.0
+
+def testCsvDecimate(tmpdir):
+    (job,) = batch.loadManifest(writeManifest(tmpdir, "decimate", "true"))
+    assert job.options[0].decimate is True
+    (job,) = batch.loadManifest(writeManifest(tmpdir, "decimate", "false"))
+    assert job.options[0].decimate is False
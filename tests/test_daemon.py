@@ -0,0 +1,103 @@
+import os
+import stat
+import json
+import time
+import pytest
+import threading
+import daemon
+
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+
+def testLoopbackAddresses():
+    assert daemon.parseAddress("8765") == ("tcp", ("127.0.0.1", 8765))
+    assert daemon.parseAddress("localhost:8000") == ("tcp", ("localhost", 8000))
+    assert daemon.parseAddress("/tmp/polyscribe.sock") == ("unix", "/tmp/polyscribe.sock")
+
+@pytest.mark.parametrize("address", ["0.0.0.0:8765", "192.168.1.10:8765", "example.com:80"])
+def testNetworkAddressesAreRejected(address):
+    with pytest.raises(ValueError):
+        daemon.parseAddress(address)
+
+def testUnixSocketIsPrivate(tmpdir):
+    path = str(tmpdir.join("daemon.sock"))
+    server = daemon.createServer(None, path)
+    try:
+        assert stat.S_IMODE(os.stat(path).st_mode) & 0o077 == 0
+    finally:
+        server.server_close()
+
+class FakeConversions(object):
+    def metrics(self):
+        return {"queueDepth": 0}
+
+    def submit(self, inputs, output, format, options, preset, priority):
+        return {"id": "1", "inputs": inputs}
+
+@pytest.fixture
+def tcpServer(tmpdir, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmpdir))
+    server = daemon.createServer(FakeConversions(), "127.0.0.1:0")
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05})
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+def request(server, method, path, body=None, headers=None):
+    connection = httplib.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+    try:
+        connection.request(method, path, body, headers or {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode("utf-8"))
+    finally:
+        connection.close()
+
+def testTokenIsPrivate(tcpServer):
+    path = daemon.tokenPath(tcpServer.server_address[1])
+    assert stat.S_IMODE(os.stat(path).st_mode) & 0o077 == 0
+    assert daemon.readToken(tcpServer.server_address[1]) == tcpServer.token
+
+def testClientSendsTheToken(tcpServer):
+    client = daemon.DaemonClient("127.0.0.1:%i" % tcpServer.server_address[1], timeout=10)
+    assert client.metrics() == {"queueDepth": 0}
+    assert client.submit(["/melody.wav"], "/melody", "midi")["id"] == "1"
+
+def testRequestsWithoutTokenAreRejected(tcpServer):
+    assert request(tcpServer, "GET", "/metrics")[0] == 401
+    assert request(tcpServer, "GET", "/metrics", headers={"Authorization": "Bearer guess"})[0] == 401
+    body = json.dumps({"inputs": ["/melody.wav"], "output": "/melody"})
+    assert request(tcpServer, "POST", "/jobs", body, {"Content-Type": "application/json"})[0] == 401
+
+def testForeignHostsAndBodiesAreRejected(tcpServer):
+    authorization = "Bearer %s" % tcpServer.token
+    assert request(tcpServer, "GET", "/metrics", headers={"Authorization": authorization,
+                                                          "Host": "rebound.example.com"})[0] == 403
+    body = json.dumps({"inputs": ["/melody.wav"], "output": "/melody"})
+    assert request(tcpServer, "POST", "/jobs", body, {"Authorization": authorization,
+                                                      "Content-Type": "text/plain"})[0] == 415
+    assert request(tcpServer, "POST", "/jobs", body, {"Authorization": authorization,
+                                                      "Content-Type": "application/json"})[0] == 202
+
+def dieBeforeReporting(args):
+    os._exit(1)
+
+def testTimeoutFailsJobsThatNeverReported(melodyFile, monkeypatch):
+    # The workers are forked with the patched module
+    monkeypatch.setattr(daemon, "_runJob", dieBeforeReporting)
+    monkeypatch.setattr(daemon, "WATCH_INTERVAL", 0.1)
+    monkeypatch.setattr(daemon, "KILL_GRACE", 0)
+    conversions = daemon.ConversionDaemon(workers=1, useCache=False, jobTimeout=0.5)
+    try:
+        job = conversions.submit([melodyFile], os.path.splitext(melodyFile)[0], "midi")
+        deadline = time.time() + 30
+        while conversions.job(job["id"])["status"] not in daemon.FINISHED_STATUSES and time.time() < deadline:
+            time.sleep(0.1)
+        snapshot = conversions.job(job["id"])
+        assert snapshot["status"] == "failed"
+        assert "Timed out" in snapshot["error"]
+    finally:
+        conversions.close()
@@ -0,0 +1,47 @@
+import numpy
+import pytest
+import estimators
+import transcribe
+
+def frames(dtype):
+    t = numpy.arange(1024) / 44100.0
+    rows = [numpy.sin(2 * numpy.pi * frequency * t) for frequency in (110.0, 220.0, 440.0, 880.0)]
+    return numpy.array(rows + [numpy.zeros(1024)], dtype=dtype)
+
+@pytest.mark.parametrize("name", estimators.estimatorNames())
+@pytest.mark.parametrize("dtype", [numpy.float32, numpy.float64])
+def testEstimatorsKeepThePrecision(name, dtype):
+    (freqs, confidence) = estimators.getEstimator(name)(frames(dtype), 44100.0)
+    assert freqs.dtype == dtype
+    assert confidence.dtype == dtype
+
+@pytest.mark.parametrize("silenceGate", [None, "auto"])
+def testFloat32TrackStaysSinglePrecision(melodyFile, silenceGate):
+    options = transcribe.TranscriptionOptions(precision="float32", silenceGate=silenceGate)
+    track = transcribe.analyzeAudioFile(melodyFile, options)
+    assert track.frequency.dtype == numpy.float32
+    assert track.confidence.dtype == numpy.float32
+
+def tone(frequency, length, harmonics=1, seed=0):
+    """A tone with harmonics falling off as 1/n, starting at a random phase."""
+
+    rng = numpy.random.RandomState(seed)
+    t = numpy.arange(length) / 44100.0
+    return sum(numpy.sin(2 * numpy.pi * frequency * harmonic * t + rng.rand() * 2 * numpy.pi) / harmonic
+               for harmonic in range(1, harmonics + 1))
+
+@pytest.mark.parametrize("name", ["hps", "yin"])
+@pytest.mark.parametrize("frequency, length, harmonics", [(440.0, 256, 1), (880.0, 256, 1), (1760.0, 256, 1),
+                                                          (3000.0, 256, 1), (622.25, 256, 3), (110.0, 1024, 5),
+                                                          (155.56, 1024, 3), (82.41, 2048, 1)])
+def testEstimatorsFindKnownTones(name, frequency, length, harmonics):
+    rows = numpy.array([tone(frequency, length, harmonics, seed) for seed in range(8)])
+    (freqs, confidence) = estimators.getEstimator(name)(rows, 44100.0)
+    numpy.testing.assert_allclose(freqs, frequency, rtol=0.01)
+    assert (confidence > 0.9).all()
+
+@pytest.mark.parametrize("name", ["hps", "yin"])
+def testNoiseHasLowConfidence(name):
+    rows = numpy.random.RandomState(0).randn(20, 1024)
+    (freqs, confidence) = estimators.getEstimator(name)(rows, 44100.0)
+    assert (confidence < 0.5).all()
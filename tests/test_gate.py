@@ -0,0 +1,47 @@
+import numpy
+import benchmark
+import transcribe
+
+def frameEnergy(samples, blocksize=256):
+    count = len(samples) // blocksize
+    return transcribe.energy(samples[:count * blocksize].reshape(count, blocksize).astype(numpy.float64))
+
+def withNoise(samples, level):
+    rng = numpy.random.RandomState(1)
+    return samples + rng.randn(len(samples)) * 32768 * 10 ** (level / 20.0)
+
+def testAutoGateFindsRoomNoiseFloor():
+    samples = benchmark.synthesizeMelody(10, harmonics=3, restProbability=0.3, seed=3).astype(numpy.float64)
+    notes = frameEnergy(samples) > 32768 * 1e-3
+    # Notes peak about 31 dB above the noise
+    voiced = transcribe.gateFrames(frameEnergy(withNoise(samples, -40)), 32768.0)
+    assert numpy.mean(voiced != notes) < 0.02
+
+def testAutoGateKeepsStemsWithoutSilence():
+    samples = benchmark.synthesizeMelody(10, harmonics=3, seed=3).astype(numpy.float64)
+    assert transcribe.gateFrames(frameEnergy(withNoise(samples, -40)), 32768.0).all()
+
+def sparseStem(share, noiseLevel=None):
+    """A tone filling the given share of ten seconds of noise or of digital
+    silence."""
+
+    samples = numpy.zeros(10 * benchmark.SAMPLE_RATE)
+    length = int(len(samples) * share)
+    start = len(samples) // 2
+    t = numpy.arange(length) / float(benchmark.SAMPLE_RATE)
+    samples[start:start + length] = 0.5 * 32767 * numpy.sin(2 * numpy.pi * 440.0 * t)
+    if noiseLevel is not None:
+        samples = withNoise(samples, noiseLevel)
+    return samples
+
+def testAutoGateFindsSparseNotes():
+    for share in (0.02, 0.04):
+        for noiseLevel in (-60, None):
+            samples = sparseStem(share, noiseLevel)
+            voiced = transcribe.gateFrames(frameEnergy(samples), 32768.0)
+            assert numpy.mean(voiced != (frameEnergy(samples) > 32768 * 1e-2)) < 0.002
+
+def testDigitalSilenceIsNeverVoiced():
+    silence = numpy.zeros(10 * benchmark.SAMPLE_RATE)
+    assert not transcribe.gateFrames(frameEnergy(silence), 32768.0).any()
+    assert not transcribe.gateFrames(frameEnergy(silence), 32768.0, -250.0).any()
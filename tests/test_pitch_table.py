@@ -0,0 +1,32 @@
+import numpy
+import pytest
+import transcribe
+from music21 import scale
+
+def frequencies(seed=0):
+    """Frequencies spread over the audible range, including the rest
+    frequency and both sides of the thresholds between pitches."""
+
+    rng = numpy.random.RandomState(seed)
+    spread = 440.0 * 2 ** ((rng.uniform(-60, 60, 500)) / 12.0)
+    edges = 440.0 * 2 ** ((numpy.arange(-48, 48) + 0.5) / 12.0)
+    return numpy.concatenate([[transcribe.REST_FREQUENCY], spread, edges * (1 - 1e-9), edges * (1 + 1e-9)])
+
+@pytest.mark.parametrize("useScale", [None, scale.ChromaticScale('C4'), scale.MajorScale('C4')])
+def testTableMatchesNormalizeInputFrequency(useScale):
+    (thresholds, pitches) = transcribe.prepareThresholds(useScale)
+    table = transcribe.getPitchTable(useScale)
+    freqs = frequencies()
+    (degrees, octaves) = table.quantize(freqs)
+    midi = table.midi(degrees, octaves)
+    for i, frequency in enumerate(freqs):
+        (unused_frequency, expected) = transcribe.normalizeInputFrequency(frequency, thresholds, pitches)
+        assert table.pitches[degrees[i]].name == expected.name
+        assert octaves[i] == expected.octave
+        assert midi[i] == expected.ps
+
+def testDetectPitchFrequencies():
+    (thresholds, pitches) = transcribe.prepareThresholds()
+    freqs = frequencies(1)
+    expected = [transcribe.normalizeInputFrequency(frequency, thresholds, pitches)[1].frequency for frequency in freqs]
+    numpy.testing.assert_allclose(transcribe.detectPitchFrequencies(freqs), expected, rtol=1e-12)
@@ -0,0 +1,69 @@
+import numpy
+import pytest
+import benchmark
+import transcribe
+
+def tone(frequency, amplitudes=(1.0, 0.5, 0.33), seconds=1.0):
+    """16-bit samples of a steady tone with harmonics of the given amplitudes."""
+
+    t = numpy.arange(int(seconds * benchmark.SAMPLE_RATE)) / float(benchmark.SAMPLE_RATE)
+    samples = sum(amplitude * numpy.sin(2 * numpy.pi * frequency * harmonic * t)
+                  for harmonic, amplitude in enumerate(amplitudes, 1))
+    return (samples / numpy.abs(samples).max() * 0.5 * 32767).astype(numpy.int16)
+
+def frequencies(filename, blocksize, options):
+    return transcribe.getFrequenciesFromAudioFile(filename, blocksize, None, options.fmin, options.fmax,
+                                                  options.decimate)
+
+# The lowest notes need blocks holding a few of their periods
+@pytest.mark.parametrize("instrument, frequency, blocksize", [
+    ("bass", 41.2, 4096), ("bass", 55.0, 2048), ("bass", 110.0, 2048), ("cello", 196.0, 1024),
+    ("guitar", 329.63, 1024), ("violin", 880.0, 256), ("flute", 1500.0, 256)])
+def testKnownTonesWithAndWithoutDecimation(tmpdir, instrument, frequency, blocksize):
+    filename = str(tmpdir.join("tone.wav"))
+    benchmark.writeWave(filename, tone(frequency))
+    full = frequencies(filename, blocksize, transcribe.TranscriptionOptions(instrument=instrument))
+    decimated = frequencies(filename, blocksize, transcribe.TranscriptionOptions(instrument=instrument, decimate=True))
+
+    # Frame count and timing are unchanged by the decimation
+    assert len(decimated) == len(full) == len(tone(frequency)) // blocksize
+    # Well within the half semitone that would change the note
+    numpy.testing.assert_allclose(full[1:-1], frequency, rtol=0.02)
+    numpy.testing.assert_allclose(decimated[1:-1], frequency, rtol=0.02)
+
+@pytest.mark.parametrize("decimate", [False, True])
+def testRangeAvoidsOctaveErrors(tmpdir, decimate):
+    # A weak fundamental makes the unbounded search pick the second harmonic
+    filename = str(tmpdir.join("tone.wav"))
+    for frequency, blocksize in ((110.0, 2048), (220.0, 1024), (440.0, 512)):
+        benchmark.writeWave(filename, tone(frequency, (0.05, 1.0, 0.2, 0.5)))
+        full = transcribe.getFrequenciesFromAudioFile(filename, blocksize)
+        assert numpy.median(full) == pytest.approx(2 * frequency, rel=0.01)
+        bounded = transcribe.getFrequenciesFromAudioFile(filename, blocksize, None, frequency / 1.5, frequency * 1.5,
+                                                         decimate)
+        numpy.testing.assert_allclose(bounded[1:-1], frequency, rtol=0.01)
+
+def testDecimationFactor():
+    assert transcribe.decimationFactor(44100, 2048, None) == 1
+    assert transcribe.decimationFactor(44100, 2048, 400.0) == 16
+    assert transcribe.decimationFactor(44100, 1024, 400.0) == 16
+    assert transcribe.decimationFactor(44100, 512, 400.0) == 8
+    assert transcribe.decimationFactor(44100, 256, 3500.0) == 2
+    assert transcribe.decimationFactor(44100, 256, 8000.0) == 1
+    assert transcribe.decimationFactor(44100, 96, 100.0) == 1
+
+def testDecimatorJoinsBatches():
+    frames = numpy.random.RandomState(0).randn(12, 256)
+    whole = transcribe.Decimator(4).process(frames)
+    decimator = transcribe.Decimator(4)
+    batches = numpy.concatenate([decimator.process(frames[:5]), decimator.process(frames[5:])])
+    assert whole.shape == (12, 64)
+    numpy.testing.assert_allclose(batches, whole, rtol=1e-9, atol=1e-12)
+
+def testInstrumentPresets():
+    options = transcribe.TranscriptionOptions(instrument="bass", fmax=300.0)
+    assert (options.fmin, options.fmax) == (transcribe.INSTRUMENT_PRESETS["bass"][0], 300.0)
+    with pytest.raises(ValueError):
+        transcribe.TranscriptionOptions(instrument="kazoo")
+    with pytest.raises(ValueError):
+        transcribe.TranscriptionOptions(fmin=500.0, fmax=400.0)
@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+import threading
+import pytest
+import render
+
+# Stands in for LilyPond: writes the source as the document, logs every run,
+# and sleeps or fails when the source asks for it
+FAKE_LILYPOND = """#!%s
+import sys, time
+arguments = sys.argv[1:]
+format = arguments[arguments.index("-f") + 1]
+output = arguments[arguments.index("-o") + 1]
+with open(arguments[-1]) as f:
+    source = f.read()
+with open(%r, "a") as f:
+    f.write(source + "\\n")
+if "sleep" in source:
+    time.sleep(30)
+if "fail" in source:
+    sys.stderr.write("error: %%s\\n" %% source)
+    sys.exit(1)
+with open(output + "." + format, "w") as f:
+    f.write(format + ":" + source)
+"""
+
+@pytest.fixture
+def lilypond(tmpdir):
+    """Path of a fake LilyPond executable and the list of sources it ran on."""
+
+    log = str(tmpdir.join("runs.log"))
+    path = str(tmpdir.join("lilypond"))
+    with open(path, 'w') as f:
+        f.write(FAKE_LILYPOND % (sys.executable, log))
+    os.chmod(path, 0o755)
+
+    def runs():
+        if not os.path.exists(log):
+            return []
+        with open(log) as f:
+            return f.read().splitlines()
+    return path, runs
+
+def read(filename):
+    with open(filename) as f:
+        return f.read()
+
+def testCacheHitsAndMisses(tmpdir, lilypond):
+    (path, runs) = lilypond
+    renderer = render.LilyPondRenderer(cache=render.RenderCache(str(tmpdir.join("cache"))), lilypond=path)
+    destination = str(tmpdir.join("score.pdf"))
+    assert renderer.render("first", destination) is False
+    assert read(destination) == "pdf:first"
+    os.remove(destination)
+    assert renderer.render("first", destination) is True
+    assert read(destination) == "pdf:first"
+    assert runs() == ["first"]
+
+    # Another source or format is typeset again
+    assert renderer.render("second", destination) is False
+    assert renderer.render("first", str(tmpdir.join("score.png")), "png") is False
+    assert read(str(tmpdir.join("score.png"))) == "png:first"
+    assert runs() == ["first", "second", "first"]
+
+    # Nothing is left in the temporary or destination directories
+    assert sorted(os.listdir(str(tmpdir))) == ["cache", "lilypond", "runs.log", "score.pdf", "score.png"]
+
+def testWithoutCache(tmpdir, lilypond):
+    (path, runs) = lilypond
+    renderer = render.LilyPondRenderer(lilypond=path)
+    for unused in range(2):
+        assert renderer.render("score", str(tmpdir.join("score.pdf"))) is False
+    assert runs() == ["score", "score"]
+
+def testFailuresAreReportedAndNotCached(tmpdir, lilypond):
+    (path, runs) = lilypond
+    renderer = render.LilyPondRenderer(cache=render.RenderCache(str(tmpdir.join("cache"))), lilypond=path)
+    destination = str(tmpdir.join("score.pdf"))
+    for unused in range(2):
+        with pytest.raises(render.RenderError) as info:
+            renderer.render("fail", destination)
+        assert "exit status 1" in str(info.value) and "error: fail" in str(info.value)
+    assert runs() == ["fail", "fail"]
+    assert not os.path.exists(destination)
+
+    with pytest.raises(render.RenderError):
+        render.LilyPondRenderer(lilypond=str(tmpdir.join("missing"))).render("score", destination)
+
+def testThreadPool(tmpdir, lilypond):
+    (path, runs) = lilypond
+    renderer = render.LilyPondRenderer(workers=2, cache=render.RenderCache(str(tmpdir.join("cache"))), lilypond=path)
+    done = []
+    results = [renderer.submit("score %i" % i, str(tmpdir.join("score%i.pdf" % i)), callback=done.append)
+               for i in range(6)]
+    assert [result.get(30) for result in results] == [False] * 6
+    renderer.close()
+    assert done == [False] * 6
+    assert sorted(runs()) == ["score %i" % i for i in range(6)]
+    for i in range(6):
+        assert read(str(tmpdir.join("score%i.pdf" % i))) == "pdf:score %i" % i
+
+    # The pool is started again by the next submission
+    assert renderer.submit("score 0", str(tmpdir.join("again.pdf"))).get(30) is True
+    renderer.close()
+
+def testCancellation(tmpdir, lilypond):
+    (path, runs) = lilypond
+    renderer = render.LilyPondRenderer(cache=render.RenderCache(str(tmpdir.join("cache"))), lilypond=path)
+    cancel = threading.Event()
+    start = time.time()
+    result = renderer.submit("sleep", str(tmpdir.join("score.pdf")), cancel=cancel)
+    while not runs():
+        time.sleep(0.05)
+    cancel.set()
+    with pytest.raises(render.RenderCancelled):
+        result.get(30)
+    renderer.close()
+    assert time.time() - start < 10
+    assert not os.path.exists(str(tmpdir.join("score.pdf")))
+
+def testTimeout(tmpdir, lilypond):
+    (path, unused_runs) = lilypond
+    renderer = render.LilyPondRenderer(timeout=0.5, lilypond=path)
+    start = time.time()
+    with pytest.raises(render.RenderTimeout):
+        renderer.render("sleep", str(tmpdir.join("score.pdf")))
+    assert time.time() - start < 10
@@ -0,0 +1,80 @@
+import math
+import numpy
+import pytest
+import rhythm
+
+def referenceHistogram(data, bins):
+    """The original histogram."""
+
+    maxValue = max(data)
+    minValue = min(data)
+    lengthEachBin = (maxValue - minValue) / bins
+    container = [0] * int(bins)
+    for i in data:
+        count = 1
+        while i > minValue + count * lengthEachBin:
+            count += 1
+        container[count - 1] += 1
+    return container, [minValue + count * lengthEachBin for count in range(int(bins) + 1)]
+
+def referenceQuarterLengthEstimation(durationList, mostRepeatedQuarterLength=1.0):
+    """The original quarterLengthEstimation."""
+
+    pdf, bins = referenceHistogram(list(durationList) + [0], 8.0)
+    i = len(pdf) - 1
+    while pdf[i] != max(pdf):
+        i = i - 1
+    qle = (bins[i] + bins[i + 1]) / 2.0
+    if mostRepeatedQuarterLength == 0:
+        mostRepeatedQuarterLength = 1.0
+    return qle * math.pow(2, 0 - math.log(mostRepeatedQuarterLength, 2))
+
+def referenceQuantizeDuration(length, typicalLengths=(25.00, 50.00, 100.00, 150.00, 200.00, 400.00)):
+    """The original quantizeDuration, for any typical lengths in hundredths."""
+
+    length = length * 100
+    finalLength = typicalLengths[0]
+    for i in range(len(typicalLengths) - 1):
+        if length > (typicalLengths[i] + typicalLengths[i + 1]) / 2:
+            finalLength = typicalLengths[i + 1]
+    return finalLength / 100
+
+def durations(seed, count=200):
+    """Note lengths in frames, with ties between bins."""
+
+    rng = numpy.random.RandomState(seed)
+    return list(rng.choice([6, 7, 12, 13, 24, 25, 36, 48, 96], count) + rng.randint(0, 3, count))
+
+def testHistogramMatchesTheOriginal():
+    for seed in range(20):
+        data = durations(seed) + [0]
+        (container, limits) = rhythm.histogram(data, 8.0)
+        (expectedContainer, expectedLimits) = referenceHistogram(data, 8.0)
+        assert list(container) == expectedContainer
+        numpy.testing.assert_allclose(limits, expectedLimits, rtol=1e-12)
+    assert list(rhythm.histogram([5, 5, 5], 4.0)[0]) == referenceHistogram([5, 5, 5], 4.0)[0]
+
+@pytest.mark.parametrize("mostRepeatedQuarterLength", [0, 0.5, 1.0, 2.0])
+def testQuarterLengthEstimationMatchesTheOriginal(mostRepeatedQuarterLength):
+    for seed in range(20):
+        data = durations(seed, count=5 + seed * 10)
+        assert rhythm.quarterLengthEstimation(data, mostRepeatedQuarterLength) == pytest.approx(
+            referenceQuarterLengthEstimation(data, mostRepeatedQuarterLength), rel=1e-12)
+
+def testQuantizeDurationMatchesTheOriginal():
+    lengths = numpy.concatenate([numpy.random.RandomState(0).uniform(0, 6, 1000),
+                                 [0.0, 0.375, 0.75, 1.25, 1.75, 3.0, 10.0]])
+    for length in lengths:
+        assert rhythm.quantizeDuration(length) == referenceQuantizeDuration(length)
+
+@pytest.mark.parametrize("dotted", [False, True])
+@pytest.mark.parametrize("triplets", [False, True])
+def testDurationTables(dotted, triplets):
+    table = rhythm.getDurationTable(dotted, triplets)
+    typicalLengths = sorted(set(100 * length for length in table.lengths))
+    frames = numpy.random.RandomState(1).randint(1, 200, 500)
+    quantized = rhythm.quantizeDurations(frames, 24.0, table)
+    for length, expected in zip(quantized, frames / 24.0):
+        assert length == pytest.approx(referenceQuantizeDuration(expected, typicalLengths), rel=1e-12)
+    assert (0.75 in table.lengths) == dotted
+    assert (1.0 / 3 in table.lengths) == triplets
@@ -0,0 +1,80 @@
+import numpy
+import pytest
+import transcribe
+
+def referenceObjects(detectedPitchesFreq):
+    """The original pitchFrequenciesToObjects."""
+
+    (thresholds, pitches) = transcribe.prepareThresholds()
+    detectedPitchObjects = [transcribe.normalizeInputFrequency(frequency, thresholds, pitches)[1]
+                            for frequency in detectedPitchesFreq]
+
+    i = 0
+    while i < len(detectedPitchObjects) - 1:
+        name = detectedPitchObjects[i].name
+        hold = i
+        tot_octave = 0
+        while i < len(detectedPitchObjects) - 1 and detectedPitchObjects[i].name == name:
+            tot_octave = tot_octave + detectedPitchObjects[i].octave
+            i = i + 1
+        # Integer division, as in the Python 2 original
+        tot_octave = tot_octave // (i - hold)
+        for j in range(i - hold):
+            detectedPitchObjects[hold + j - 1].octave = tot_octave
+    return detectedPitchObjects
+
+def referenceSegments(detectedPitchObjects, minNoteFrames=6, minRestFrames=15):
+    """The original joinConsecutiveIdenticalPitches, returning (MIDI pitch or
+    None for rests, length) tuples."""
+
+    detectedPitchObjects[0].frequency = transcribe.REST_FREQUENCY
+    segments = []
+    j = 0
+    good = 0
+    bad = 0
+    valid_note = False
+    while j < len(detectedPitchObjects):
+        fr = detectedPitchObjects[j].frequency
+        while j < len(detectedPitchObjects) and fr == detectedPitchObjects[j].frequency:
+            good = good + 1
+            if good >= minNoteFrames:
+                valid_note = True
+                if bad >= minRestFrames:
+                    segments.append((None, bad))
+                bad = 0
+            j = j + 1
+        if valid_note:
+            segments.append((detectedPitchObjects[j - 1].ps, good))
+        else:
+            bad = bad + good
+        good = 0
+        valid_note = False
+        j = j + 1
+    return segments
+
+def smoothedFrequencies(seed, count=1500):
+    """Integer frequencies of notes of random lengths, including very short
+    ones, with octave errors and rests."""
+
+    rng = numpy.random.RandomState(seed)
+    freqs = []
+    while len(freqs) < count:
+        midi = rng.randint(36, 90)
+        frequency = transcribe.REST_FREQUENCY if rng.rand() < 0.15 else 440.0 * 2 ** ((midi - 69) / 12.0)
+        if rng.rand() < 0.1:
+            frequency *= 2
+        freqs.extend([int(round(frequency))] * rng.choice([1, 1, 2, 3, 5, 6, 8, 15, 20, 40]))
+    return freqs[:count]
+
+@pytest.mark.parametrize("seed", range(5))
+def testEventsMatchTheOriginalSegmentation(seed):
+    freqs = smoothedFrequencies(seed)
+    expected = referenceSegments(referenceObjects(freqs))
+    events = transcribe.pitchFrequenciesToEvents(freqs)
+    assert [(event.midi, event.length) for event in events] == expected
+
+@pytest.mark.parametrize("seed", range(3))
+def testObjectsMatchTheOriginal(seed):
+    freqs = smoothedFrequencies(seed)
+    expected = [p.nameWithOctave for p in referenceObjects(freqs)]
+    assert [p.nameWithOctave for p in transcribe.pitchFrequenciesToObjects(freqs)] == expected
@@ -0,0 +1,33 @@
+import numpy
+import pytest
+import benchmark
+import transcribe
+
+@pytest.fixture
+def longerMelody(tmpdir, monkeypatch):
+    """Path of a melody split into 9 segments by shorter segments."""
+
+    monkeypatch.setattr(transcribe, "SEGMENT_LENGTH", 200)
+    filename = str(tmpdir.join("long.wav"))
+    benchmark.writeWave(filename, benchmark.synthesizeMelody(10, harmonics=3, restProbability=0.2, seed=2))
+    return filename
+
+@pytest.mark.parametrize("settings", [{}, {"precision": "float32"}, {"silenceGate": "auto"},
+                                      {"blocksize": 512, "instrument": "bass"}])
+def testSegmentedAnalysisMatchesSinglePass(longerMelody, settings):
+    options = transcribe.TranscriptionOptions(**settings)
+    single = transcribe.analyzeAudioFile(longerMelody, options)
+    segmented = transcribe.analyzeAudioFile(longerMelody, options, workers=2)
+    for name in ("frequency", "confidence", "energy", "voiced"):
+        numpy.testing.assert_array_equal(getattr(segmented, name), getattr(single, name))
+
+def testDecimatedSegmentsMatchClosely(longerMelody):
+    options = transcribe.TranscriptionOptions(blocksize=512, instrument="bass", decimate=True)
+    single = transcribe.analyzeAudioFile(longerMelody, options)
+    segmented = transcribe.analyzeAudioFile(longerMelody, options, workers=2)
+    numpy.testing.assert_allclose(segmented.frequency, single.frequency, rtol=1e-6)
+
+def testSegmentedEventsMatchSinglePass(longerMelody):
+    options = transcribe.TranscriptionOptions()
+    assert (transcribe.monophonicEventsFromFile(longerMelody, options, workers=2)
+            == transcribe.monophonicEventsFromFile(longerMelody, options))
@@ -0,0 +1,50 @@
+import math
+import numpy
+import pytest
+import transcribe
+
+def referenceSmoothing(freqs, smoothLevels, statistic=numpy.mean, edges="average"):
+    """The loops of the original smoothFrequencies, reading from the input
+    frames rather than from the frames they already smoothed."""
+
+    freqs = list(freqs)
+    count = len(freqs)
+    head = int(math.floor(smoothLevels / 2.0))
+    padded = [freqs[0]] * head + freqs + [freqs[-1]] * smoothLevels
+    smoothed = []
+    for i in range(count):
+        if edges == "average" and i < head:
+            smoothed.append(statistic(freqs[:smoothLevels]))
+        elif edges == "average" and i > count - int(math.ceil(smoothLevels / 2.0)) - 1:
+            smoothed.append(statistic(freqs[count - smoothLevels:]))
+        else:
+            smoothed.append(statistic(padded[i:i + smoothLevels]))
+    return numpy.array(smoothed)
+
+def track(count, seed):
+    """Frequencies with notes, octave errors and rests."""
+
+    rng = numpy.random.RandomState(seed)
+    freqs = numpy.repeat(rng.uniform(50, 2000, count // 10 + 1), 10)[:count]
+    errors = rng.rand(count) < 0.1
+    freqs[errors] *= rng.choice([0.5, 2.0], errors.sum())
+    freqs[rng.rand(count) < 0.05] = transcribe.REST_FREQUENCY
+    return freqs
+
+@pytest.mark.parametrize("method, statistic", [("mean", numpy.mean), ("median", numpy.median)])
+@pytest.mark.parametrize("edges", ["average", "nearest"])
+@pytest.mark.parametrize("smoothLevels", [1, 2, 5, 7, 8, 31])
+def testSmoothingMatchesTheOriginalLoops(method, statistic, edges, smoothLevels):
+    for seed, count in enumerate((31, 32, 100, 1001)):
+        freqs = track(count, seed)
+        expected = referenceSmoothing(freqs, smoothLevels, statistic, edges)
+        smoothed = freqs.copy()
+        rounded = transcribe.smoothFrequencies(smoothed, smoothLevels, method=method, edges=edges)
+        numpy.testing.assert_allclose(smoothed, expected, rtol=1e-12)
+        numpy.testing.assert_array_equal(rounded, [int(math.floor(value + 0.5)) for value in expected])
+
+def testSmoothingIsNotRecursive():
+    freqs = numpy.array([100.0] * 10 + [200.0] * 10)
+    smoothed = transcribe.smoothFrequencies(freqs, 3, inPlace=False)
+    assert list(smoothed[8:12]) == [100, 133, 167, 200]
+    assert freqs[10] == 200.0
@@ -0,0 +1,49 @@
+import numpy
+import pytest
+import benchmark
+import streaming
+import transcribe
+
+def melody(seed, seconds=8):
+    """16-bit samples of notes of the fourth octave, whose runs of frames
+    mostly have the same average octave."""
+
+    rng = numpy.random.RandomState(seed)
+    notes = []
+    while sum(len(note) for note in notes) < seconds * benchmark.SAMPLE_RATE:
+        t = numpy.arange(int(rng.choice([0.25, 0.5, 1.0]) * benchmark.SAMPLE_RATE)) / float(benchmark.SAMPLE_RATE)
+        frequency = 440.0 * 2 ** ((rng.randint(60, 72) - 69) / 12.0)
+        envelope = numpy.minimum(1.0, numpy.minimum(t, t[::-1]) * 200)
+        notes.append(sum(envelope / harmonic * numpy.sin(2 * numpy.pi * frequency * harmonic * t)
+                         for harmonic in (1, 2, 3)))
+    samples = numpy.concatenate(notes) + rng.randn(sum(len(note) for note in notes)) * 0.001
+    return (samples / numpy.abs(samples).max() * 0.5 * 32767).astype(numpy.int16)
+
+@pytest.mark.parametrize("seed", range(10))
+def testStreamMatchesBatchTranscription(tmpdir, seed):
+    filename = str(tmpdir.join("melody.wav"))
+    samples = melody(seed)
+    benchmark.writeWave(filename, samples)
+    ((unused_index, expected),) = list(transcribe.transcribeFiles([filename]))
+
+    transcriber = streaming.StreamingTranscriber(benchmark.SAMPLE_RATE)
+    rng = numpy.random.RandomState(seed)
+    finalized = []
+    position = 0
+    while position < len(samples):
+        size = rng.randint(1, 20000)
+        finalized.extend(transcriber.feed(samples[position:position + size].tobytes()))
+        position += size
+    finalized.extend(transcriber.flush())
+    events = [event for event, unused_quarterLength in finalized]
+
+    # Batch transcriptions give the last frame of a run the octave of the
+    # next run, which can move a boundary by a frame, and smooth the first
+    # and last frames differently
+    assert len(events) == len(expected)
+    for i, (event, batchEvent) in enumerate(zip(events, expected)):
+        assert (event.name, event.octave, event.midi) == (batchEvent.name, batchEvent.octave, batchEvent.midi)
+        tolerance = 1 if 0 < i < len(events) - 1 else transcribe.TranscriptionOptions().smoothLevels
+        assert abs(event.start - batchEvent.start) <= tolerance
+        assert abs(event.start + event.length - batchEvent.start - batchEvent.length) <= tolerance
+    assert numpy.mean([event == batchEvent for event, batchEvent in zip(events, expected)]) > 0.9
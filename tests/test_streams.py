@@ -0,0 +1,30 @@
+import transcribe
+from transcribe import NoteEvent
+
+def events():
+    """Note events of every pitch class, including octave -1, which long
+    stretches of silence are transcribed to, separated by rests."""
+
+    names = ["C", "C#", "D", "E-", "E", "F", "F#", "G", "G#", "A", "B-", "B"]
+    result = []
+    start = 0
+    for midi in list(range(0, 14)) + list(range(40, 80, 5)):
+        length = 10 + (midi * 7) % 30
+        result.append(NoteEvent(names[midi % 12], midi // 12 - 1, midi, start, length))
+        start += length
+        if midi % 3 == 0:
+            result.append(NoteEvent(None, None, None, start, 12))
+            start += 12
+    return result
+
+def describe(part):
+    return [(element.pitch.midi if element.isNote else None, element.offset, element.quarterLength)
+            for element in part.notesAndRests]
+
+def testBulkPartMatchesElementByElementPart():
+    reference = transcribe.notesAndDurationsToStream(*transcribe.eventsToNotes(events()))
+    assert describe(transcribe.eventsToStream(events())) == describe(reference)
+
+def testNegativeOctavesKeepTheirPitch():
+    part = transcribe.eventsToStream([NoteEvent("E-", -1, 3, 0, 10), NoteEvent("C", -1, 0, 10, 10)])
+    assert [element.pitch.midi for element in part.notes] == [3, 0]
@@ -0,0 +1,56 @@
+import pytest
+import writers
+import transcribe
+from fractions import Fraction
+from music21 import converter, pitch
+
+# Quarter lengths of a melody with dotted and triplet values, notes crossing
+# barlines and rests, starting from a sharp, a flat and a low note
+LENGTHS = [1.0, 0.5, 0.5, 1.5, 0.5, 1.0 / 3, 1.0 / 3, 1.0 / 3, 3.0, 0.75, 0.25, 2.0 / 3, 2.0 / 3, 2.0 / 3, 4.0, 0.25,
+           4.0 / 3, 4.0 / 3, 4.0 / 3, 6.0]
+NAMES = ["C#5", "E-4", "G2", "A4", None, "B-3", "F#4", "D5", "E5", None, "C4", "G#3", "A-3", "F4", "B4", "D3",
+         "C5", None, "E-5", "A3"]
+
+def melody():
+    part = []
+    for name, length in zip(NAMES, LENGTHS):
+        if name is None:
+            part.append((transcribe.NoteEvent(None, None, None, 0, 0), length))
+        else:
+            p = pitch.Pitch(name)
+            part.append((transcribe.NoteEvent(p.name, p.octave, p.ps, 0, 0), length))
+    return part
+
+def expectedNotes():
+    """(midi, offset, quarter length) of every note of the melody."""
+
+    notes = []
+    offset = Fraction(0)
+    for name, length in zip(NAMES, LENGTHS):
+        length = Fraction(length).limit_denominator(12)
+        if name is not None:
+            notes.append((pitch.Pitch(name).ps, offset, length))
+        offset += length
+    return notes
+
+def readNotes(filename, **keywords):
+    score = converter.parse(filename, forceSource=True, **keywords)
+    return [(n.pitch.ps, Fraction(n.offset).limit_denominator(12), Fraction(n.quarterLength).limit_denominator(12))
+            for n in score.parts[0].stripTies().flatten().notes]
+
+def testMusicXml(tmpdir):
+    filename = str(tmpdir.join("melody.xml"))
+    writers.writeMusicXml([melody(), melody()[:3]], filename)
+    assert readNotes(filename) == expectedNotes()
+    score = converter.parse(filename, forceSource=True)
+    assert len(score.parts) == 2
+    names = [n.pitch.nameWithOctave for n in score.parts[0].stripTies().flatten().notes]
+    assert names == [name for name in NAMES if name is not None]
+
+def testMidi(tmpdir):
+    filename = str(tmpdir.join("melody.mid"))
+    writers.writeMidi([melody(), melody()[:3]], filename, tempo=90)
+    assert readNotes(filename, quantizePost=False) == expectedNotes()
+    score = converter.parse(filename, forceSource=True)
+    assert len(score.parts) == 2
+    assert score.metronomeMarkBoundaries()[0][2].number == pytest.approx(90)
@@ -28,12 +28,155 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import gc
 import copy
 import math
-import wave
+import contextlib
+import collections
+import multiprocessing
 import numpy
-import scipy.signal
-from music21 import stream, note, pitch, scale
+import audiofile
+import estimators
+import profiling
+from estimators import REST_FREQUENCY
+from rhythm import histogram, quarterLengthEstimation, quantizeDuration, quantizeDurations, getDurationTable
+
+# music21 and scipy are slow to import, so they are only imported by the
+# functions that use them
+
+FRAMES_PER_BATCH = 256 # Number of frames analyzed by a single FFT pass
+SEGMENT_LENGTH = 32 * FRAMES_PER_BATCH # Number of frames of a segment of a long file analyzed in parallel
+SEGMENT_OVERLAP = 64 # Frames preceding a segment that settle the state of the decimation filter
+
+# A note (or a rest, when name is None) lasting length frames from frame start.
+# The name of the pitch does not include its octave, since names such as E-1
+# would be ambiguous.
+NoteEvent = collections.namedtuple("NoteEvent", ["name", "octave", "midi", "start", "length"])
+
+ANALYSIS_VERSION = 6 # Bump whenever a change alters the transcription of a file
+
+# Plausible range of fundamental frequencies (fmin, fmax) of each instrument, in Hz
+INSTRUMENT_PRESETS = {
+    "bass": (30.0, 400.0),
+    "cello": (60.0, 1000.0),
+    "guitar": (75.0, 1400.0),
+    "piano": (27.0, 4200.0),
+    "violin": (190.0, 3500.0),
+    "flute": (250.0, 2700.0),
+    "voice": (80.0, 1100.0),
+}
+
+# Decimated signals keep a sample rate of at least this many times fmax, and
+# frames of at least this many samples
+DECIMATION_MARGIN = 4
+MIN_DECIMATED_LENGTH = 64
+
+# Sample types of the precisions of the analysis. In single precision, 99.9%
+# of the frames are within 0.05 cent of their double precision frequency;
+# about one frame in 10000, where two candidate periods are within rounding
+# error of each other, may pick the other period.
+PRECISIONS = {"float64": numpy.float64, "float32": numpy.float32}
+
+# Durations of notes are snapped to standard lengths and optionally to dotted
+# and triplet lengths, given by (dotted, triplets)
+DURATION_TABLES = {"standard": (False, False), "dotted": (True, False), "triplets": (False, True),
+                   "all": (True, True)}
+
+# With the automatic silence gate, frames are unvoiced when their level is
+# less than AUTO_GATE_MARGIN dB above the noise floor (the level of the
+# quietest frames). The floor is only trusted when the quietest frames form
+# a cluster of their own, with fewer than AUTO_GATE_VALLEY times as many
+# frames in the valley above it. Otherwise, frames less than AUTO_GATE_RANGE
+# dB below the loud frames (those more than AUTO_GATE_MARGIN dB above the
+# floor) are never gated, so recordings without any silence are not gated.
+# Frames of digital silence are always unvoiced
+AUTO_GATE_MARGIN = 12.0
+AUTO_GATE_RANGE = 30.0
+AUTO_GATE_VALLEY = 0.25
+GATE_HOLD_FRAMES = 3 # Shorter dips below the gate do not interrupt a note
+MIN_LEVEL = -200.0 # Level of digital silence, in dBFS
+
+# Pitches of music21's ChromaticScale('C4'), which is used by default
+CHROMATIC_NAMES = ["C", "C#", "D", "E-", "E", "F", "F#", "G", "A-", "A", "B-", "B", "C"]
+
+class TranscriptionCancelled(Exception):
+    """Raised when a transcription is cancelled before its end."""
+
+class TranscriptionOptions(object):
+    """Parameters of the analysis of a single audio file."""
+
+    def __init__(self, blocksize=256, smoothLevels=7, smoothingMethod="mean", useScale=None,
+                 channel=None, minNoteFrames=6, minRestFrames=15, instrument=None, fmin=None, fmax=None,
+                 decimate=False, estimator="autocorrelation", minConfidence=0.0, precision="float64",
+                 fftWorkers=1, silenceGate=None, durations="standard"):
+        """Constructor. The pitch search is limited to fmin through fmax Hz,
+        which default to the range of the instrument preset, if any. Pitches
+        whose period is longer than blocksize samples cannot be found, so low
+        instruments need larger blocks. With decimate set, the signal is
+        low-pass filtered and downsampled to the lowest sample rate fmax
+        allows before it is analyzed. Frames are analyzed by the pitch
+        estimator registered under the given name, and those whose confidence
+        is below minConfidence become rests. Frames are analyzed in the given
+        floating point precision, by FFTs using fftWorkers threads (or one
+        per CPU core if 0). When silenceGate is set to a level in dBFS, or to
+        "auto" to estimate one from the noise floor, quieter frames are
+        rests that are not analyzed at all. Durations are quantized to the
+        lengths of the named table of DURATION_TABLES."""
+
+        estimators.getEstimator(estimator)
+        if precision not in PRECISIONS:
+            raise ValueError("Unknown precision: %s" % precision)
+        if durations not in DURATION_TABLES:
+            raise ValueError("Unknown duration table: %s" % durations)
+        if silenceGate is not None and silenceGate != "auto":
+            try:
+                silenceGate = float(silenceGate)
+            except (TypeError, ValueError):
+                raise ValueError("The silence gate must be a level in dBFS or auto: %s" % silenceGate)
+
+        if instrument is not None:
+            if instrument not in INSTRUMENT_PRESETS:
+                raise ValueError("Unknown instrument preset: %s" % instrument)
+            (presetMin, presetMax) = INSTRUMENT_PRESETS[instrument]
+            fmin = presetMin if fmin is None else fmin
+            fmax = presetMax if fmax is None else fmax
+        if fmin is not None and fmax is not None and fmin >= fmax:
+            raise ValueError("fmin must be lower than fmax")
+
+        self.blocksize = blocksize
+        self.smoothLevels = smoothLevels
+        self.smoothingMethod = smoothingMethod
+        self.useScale = useScale
+        self.channel = channel
+        self.minNoteFrames = minNoteFrames
+        self.minRestFrames = minRestFrames
+        self.fmin = fmin
+        self.fmax = fmax
+        self.decimate = decimate
+        self.estimator = estimator
+        self.minConfidence = minConfidence
+        self.precision = precision
+        self.fftWorkers = fftWorkers
+        self.silenceGate = silenceGate
+        self.durations = durations
+
+    def durationTable(self):
+        """Return the rhythm.DurationTable durations are quantized to."""
+
+        return getDurationTable(*DURATION_TABLES[self.durations])
+
+    def signature(self):
+        """Return a string uniquely describing the parameters and the version
+        of the analysis code."""
+
+        values = dict(vars(self))
+        # The number of threads does not change the results, and durations
+        # are quantized after the results are cached
+        del values["fftWorkers"]
+        del values["durations"]
+        if self.useScale is not None:
+            values["useScale"] = [p.nameWithOctave for p in self.useScale.pitches]
+        return repr((ANALYSIS_VERSION, sorted(values.items())))
 
 def interpolation(correlation, peak):
     """Interpolation for estimating the true position of an inter-sample
@@ -47,65 +190,329 @@ def interpolation(correlation, peak):
     vertex = vertex * 0.5 + peak
     return vertex
 
-def getFrequenciesFromAudioFile(filename, blocksize=512):
-    """Retrieve a list of frequencies from an audio file."""
-
-    wv = wave.open(filename, 'r')
-    srate = wv.getframerate()
-    blocks = []
-    for i in range(int(wv.getnframes() / blocksize)):
-        data = wv.readframes(blocksize)
-        blocks.append(data)
-    wv.close()
+class FrameTrack(object):
+    """Per-frame analysis of a signal held in contiguous arrays: the
+    estimated frequency, the confidence of the estimator and the RMS energy
+    of every frame, whether it passed the silence gate, if any, and, once
+    assigned, its scale degree, octave and MIDI pitch."""
+
+    __slots__ = ("srate", "blocksize", "frequency", "confidence", "energy", "voiced", "degree", "octave", "midi")
+
+    def __init__(self, srate, blocksize, frequency, confidence, energy, voiced=None):
+        """Constructor."""
+
+        self.srate = srate
+        self.blocksize = blocksize
+        self.frequency = frequency
+        self.confidence = confidence
+        self.energy = energy
+        self.voiced = voiced
+        self.degree = None
+        self.octave = None
+        self.midi = None
+
+    def __len__(self):
+        return len(self.frequency)
+
+    def frameDuration(self):
+        """Return the duration of a frame in seconds."""
+
+        return float(self.blocksize) / self.srate
+
+    def nbytes(self):
+        """Return the number of bytes held by the arrays of the track."""
+
+        return sum(getattr(self, name).nbytes for name in self.__slots__[2:] if getattr(self, name) is not None)
+
+def analyzeAudioFile(filename, options=None, progress=None, cancel=None, workers=1):
+    """Return the FrameTrack of an audio file, analyzed with the given
+    transcription options. Samples are converted to the precision of the
+    options as they are read, and never held in memory all at once.
+
+    After every batch of frames, progress is called with the fraction of the
+    file analyzed so far, and TranscriptionCancelled is raised if the cancel
+    event (such as a threading.Event) is set.
+
+    With a silence gate, the energy of every frame is measured by a first
+    pass over the file, and the pitch of unvoiced frames is never
+    estimated.
+
+    Files longer than two segments of SEGMENT_LENGTH frames are split into
+    segments analyzed in parallel when more than one worker process is
+    requested (or one per CPU core if workers is 0). Every worker only reads
+    its own segment, and the results are identical to those of a single
+    pass, except for negligible differences at the beginning of the
+    segments of decimated signals."""
+
+    if options is None:
+        options = TranscriptionOptions()
+    if workers is None or workers < 1:
+        workers = multiprocessing.cpu_count()
+
+    dtype = PRECISIONS[options.precision]
+    with audiofile.WaveFile(filename) as wv:
+        srate = wv.srate
+        count = wv.nframes // options.blocksize
+        voiced = None
+        if options.silenceGate is not None:
+            frameEnergy = numpy.concatenate([energy(frames) for frames in
+                                             wv.blocks(options.blocksize, FRAMES_PER_BATCH, options.channel, dtype)]
+                                            + [numpy.zeros(0, dtype=dtype)])
+            voiced = gateFrames(frameEnergy, wv.fullScale(), options.silenceGate)
+
+        if workers > 1 and count > 2 * SEGMENT_LENGTH:
+            (freqs, confidence, energies) = _analyzeSegments(filename, options, count, voiced, workers,
+                                                             progress, cancel)
+        else:
+            (freqs, confidence, energies) = analyzeFrames(wv, options, 0, count, voiced, progress, cancel)
+    return FrameTrack(srate, options.blocksize, freqs, confidence, energies, voiced)
+
+def analyzeFrames(wv, options, first, count, voiced=None, progress=None, cancel=None):
+    """Return a tuple of three arrays consisting of the frequency, the
+    confidence and the RMS energy of count frames of an open WaveFile,
+    starting at frame first. voiced is the silence gate of these frames, if
+    any. Progress and cancellation work as in analyzeAudioFile."""
+
+    dtype = PRECISIONS[options.precision]
+    factor = decimationFactor(wv.srate, options.blocksize, options.fmax) if options.decimate else 1
+    decimator = Decimator(factor, dtype) if factor > 1 else None
+    if decimator is not None and first > 0:
+        # Settle the state of the low-pass filter on the preceding frames
+        overlap = min(first, SEGMENT_OVERLAP)
+        for frames in wv.blocks(options.blocksize, FRAMES_PER_BATCH, options.channel, dtype, first - overlap,
+                                overlap):
+            decimator.process(frames)
 
     freqs = []
-    for data in blocks:
-        samples = numpy.fromstring(data, dtype=numpy.int16)
-        freqs.append(autocorrelationFunction(samples, srate))
+    confidence = []
+    energies = []
+    total = max(1, count)
+    done = 0
+    for frames in wv.blocks(options.blocksize, FRAMES_PER_BATCH, options.channel, dtype, first, count):
+        if cancel is not None and cancel.is_set():
+            raise TranscriptionCancelled(wv.filename)
+        energies.append(energy(frames))
+        if decimator is not None:
+            frames = decimator.process(frames)
+        if voiced is None:
+            (batchFreqs, batchConfidence) = estimateFrames(frames, float(wv.srate) / factor, options.estimator,
+                                                           options.fmin, options.fmax, options.minConfidence,
+                                                           options.fftWorkers)
+        else:
+            batchVoiced = voiced[done:done + len(frames)]
+            batchFreqs = numpy.full(len(frames), REST_FREQUENCY, dtype=dtype)
+            batchConfidence = numpy.zeros(len(frames), dtype=dtype)
+            if batchVoiced.any():
+                (batchFreqs[batchVoiced], batchConfidence[batchVoiced]) = estimateFrames(
+                    frames[batchVoiced], float(wv.srate) / factor, options.estimator, options.fmin,
+                    options.fmax, options.minConfidence, options.fftWorkers)
+        freqs.append(batchFreqs)
+        confidence.append(batchConfidence)
+        done += len(batchFreqs)
+        if progress is not None:
+            progress(float(done) / total)
+
+    def join(arrays):
+        return numpy.concatenate(arrays) if arrays else numpy.zeros(0, dtype=dtype)
+    return join(freqs), join(confidence), join(energies)
+
+def _analyzeSegments(filename, options, count, voiced, workers, progress=None, cancel=None):
+    """Analyze the frames of a file in segments distributed over a pool of
+    worker processes and join their results."""
+
+    segments = []
+    for first in range(0, count, SEGMENT_LENGTH):
+        length = min(SEGMENT_LENGTH, count - first)
+        segments.append((filename, options, first, length,
+                         None if voiced is None else voiced[first:first + length]))
+
+    pool = multiprocessing.Pool(min(workers, len(segments)))
+    try:
+        results = pool.imap(_analyzeSegment, segments)
+        arrays = []
+        done = 0
+        for segment in segments:
+            arrays.append(_nextResult(results, cancel))
+            done += segment[3]
+            if progress is not None:
+                progress(float(done) / count)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return tuple(numpy.concatenate([segmentArrays[i] for segmentArrays in arrays]) for i in range(3))
+
+def _analyzeSegment(args):
+    """Worker entry point of analyzeAudioFile."""
+
+    (filename, options, first, count, voiced) = args
+    with audiofile.WaveFile(filename) as wv:
+        return analyzeFrames(wv, options, first, count, voiced)
+
+def _nextResult(results, cancel):
+    """Return the next result of a pool iterator, raising
+    TranscriptionCancelled within a tenth of a second of the cancel event
+    being set."""
+
+    while True:
+        if cancel is not None and cancel.is_set():
+            raise TranscriptionCancelled()
+        try:
+            # Wake up regularly to check whether to cancel
+            return results.next(0.1 if cancel is not None else None)
+        except multiprocessing.TimeoutError:
+            continue
+
+def energy(frames):
+    """Return the RMS energy of every row of an array of frames."""
+
+    return numpy.sqrt(numpy.mean(frames * frames, axis=1))
+
+def gateFrames(energy, fullScale, threshold="auto", holdFrames=GATE_HOLD_FRAMES):
+    """Return a boolean array telling which frames are loud enough to hold a
+    note, given their RMS energy, the full scale of the samples and a gate
+    level in dBFS or "auto" to estimate it. Quieter stretches shorter than
+    holdFrames in between louder frames are not gated."""
+
+    levels = 20 * numpy.log10(numpy.maximum(numpy.asarray(energy, dtype=numpy.float64) / fullScale,
+                                            10 ** (MIN_LEVEL / 20)))
+    if threshold == "auto":
+        threshold = noiseGateLevel(levels)
+    voiced = levels >= threshold
+
+    (starts, lengths) = runLengths(voiced)
+    dips = ~voiced[starts] & (lengths < holdFrames) & (starts > 0) & (starts + lengths < len(voiced))
+    voiced[numpy.repeat(dips, lengths)] = True
+    voiced[levels <= MIN_LEVEL] = False
+    return voiced
+
+def noiseGateLevel(levels):
+    """Estimate the gate level in dBFS of frames with the given levels.
+
+    Silences are recognized by the narrow band of levels of their noise,
+    well apart from the loud frames, however few. Quiet passages played at
+    the level of the floor of a recording with few silences cannot be told
+    apart from it, and are gated as well. Frames of digital silence are
+    left out of the estimate."""
+
+    levels = levels[levels > MIN_LEVEL]
+    if len(levels) == 0:
+        return MIN_LEVEL
+    floor = numpy.percentile(levels, 5)
+    above = levels[levels >= floor + AUTO_GATE_MARGIN]
+    loud = numpy.percentile(above, 95) if len(above) > 0 else floor
+    quiet = numpy.count_nonzero(levels < floor + AUTO_GATE_MARGIN / 2)
+    valley = numpy.count_nonzero((levels >= floor + AUTO_GATE_MARGIN / 2) & (levels < floor + AUTO_GATE_MARGIN))
+    if loud - floor > 2 * AUTO_GATE_MARGIN and valley < quiet * AUTO_GATE_VALLEY:
+        return floor + AUTO_GATE_MARGIN
+    return min(floor + AUTO_GATE_MARGIN, loud - AUTO_GATE_RANGE)
+
+def getFrequenciesFromAudioFile(filename, blocksize=512, channel=None, fmin=None, fmax=None, decimate=False,
+                                estimator="autocorrelation", minConfidence=0.0, withConfidence=False,
+                                precision="float64", workers=1):
+    """Retrieve an array of frequencies from an audio file. Multi-channel files
+    are mixed down to mono unless a channel index is given. Frequencies are
+    searched between fmin and fmax Hz, if given, and the signal is decimated
+    beforehand if decimate is set and fmax allows it. With withConfidence
+    set, a tuple of the frequencies and their confidence is returned.
+    Samples are converted to the given precision as they are read, and FFTs
+    use the given number of threads."""
+
+    options = TranscriptionOptions(blocksize=blocksize, channel=channel, fmin=fmin, fmax=fmax, decimate=decimate,
+                                   estimator=estimator, minConfidence=minConfidence, precision=precision,
+                                   fftWorkers=workers)
+    track = analyzeAudioFile(filename, options)
+    if withConfidence:
+        return track.frequency, track.confidence
+    return track.frequency
+
+def decimationFactor(srate, blocksize, fmax):
+    """Return the largest power of two dividing blocksize by which a signal
+    can be downsampled while keeping a sample rate of DECIMATION_MARGIN times
+    fmax and frames of MIN_DECIMATED_LENGTH samples."""
+
+    factor = 1
+    if fmax is None:
+        return factor
+    while (blocksize % (factor * 2) == 0 and blocksize // (factor * 2) >= MIN_DECIMATED_LENGTH and
+           float(srate) / (factor * 2) >= DECIMATION_MARGIN * fmax):
+        factor *= 2
+    return factor
+
+class Decimator(object):
+    """Anti-aliased downsampling of a signal processed in consecutive
+    batches of frames. The state of the low-pass filter is carried from one
+    batch to the next, so batches join without discontinuities."""
+
+    def __init__(self, factor, dtype=numpy.float64):
+        """Constructor. Frames are filtered in the precision of dtype."""
+
+        import scipy.signal
+
+        self.factor = factor
+        self.dtype = dtype
+        # Cut off below the Nyquist frequency of the downsampled signal
+        self.sos = scipy.signal.butter(8, 0.8 / factor, output='sos').astype(dtype)
+        self.state = None
+
+    def process(self, frames):
+        """Filter and downsample a two-dimensional array of consecutive frames,
+        returning frames factor times shorter."""
+
+        import scipy.signal
+
+        frames = numpy.asarray(frames, dtype=self.dtype)
+        (count, length) = frames.shape
+        samples = frames.ravel()
+        if self.state is None:
+            initial = samples[0] if len(samples) else 0.0
+            self.state = (scipy.signal.sosfilt_zi(self.sos) * initial).astype(self.dtype)
+        (filtered, self.state) = scipy.signal.sosfilt(self.sos, samples, zi=self.state)
+        return filtered.reshape(count, length)[:, ::self.factor]
+
+def autocorrelationFunction(signal, srate, fmin=None, fmax=None):
+    """Convert a signal from the time domain into the frequency domain."""
 
-    return freqs
+    return autocorrelationFrames(numpy.atleast_2d(signal), srate, fmin, fmax)[0]
 
-def autocorrelationFunction(signal, srate):
-    """Convert a signal from the time domain into the frequency domain."""
+def autocorrelationFrames(frames, srate, fmin=None, fmax=None):
+    """Estimate the fundamental frequency of every row of a two-dimensional
+    array of frames using a single real FFT pass over all of them. Only the
+    lags matching frequencies between fmin and fmax Hz are searched, if
+    given, and frames with no peak in that range are unvoiced."""
 
-    signal = numpy.array(signal)
-    correlation = scipy.signal.fftconvolve(signal, signal[::-1], mode='full')
-    lengthCorrelation = len(correlation) / 2
-    correlation = correlation[lengthCorrelation:]
-    difference = numpy.diff(correlation) # Calculate the difference between slots
-    positiveDifferences, = numpy.nonzero(numpy.ravel(difference > 0))
-    if len(positiveDifferences) == 0:
-        finalResult = 10 # Rest
-    else:
-        beginning = positiveDifferences[0]
-        peak = numpy.argmax(correlation[beginning:]) + beginning
-        vertex = interpolation(correlation, peak)
-        finalResult = srate / vertex
-    return finalResult
+    return estimators.autocorrelation(frames, srate, fmin, fmax)[0]
 
-def detectPitchFrequencies(freqFromAQList, useScale=None):
-    """Detect the pitches of the notes from a list of frequencies."""
+def estimateFrames(frames, srate, estimator="autocorrelation", fmin=None, fmax=None, minConfidence=0.0, workers=1):
+    """Return a tuple of two arrays consisting of the frequency and the
+    confidence of every row of an array of frames, using the pitch estimator
+    registered under the given name and FFTs using the given number of
+    threads. Frames whose confidence is below minConfidence are treated as
+    rests."""
 
-    if useScale is None:
-        useScale = scale.ChromaticScale()
-    (thresholds, pitches) = prepareThresholds(useScale)
+    (freqs, confidence) = estimators.getEstimator(estimator)(frames, srate, fmin, fmax, workers)
+    if minConfidence > 0:
+        freqs[confidence < minConfidence] = REST_FREQUENCY
+    return freqs, confidence
 
-    detectedPitchesFreq = []
+def detectPitchFrequencies(freqFromAQList, useScale=None):
+    """Detect the pitches of the notes from a list of frequencies."""
 
-    for i in range(len(freqFromAQList)): # Find thresholds and frequencies
-        inputPitchFrequency = freqFromAQList[i]
-        unused_freq, pitch_name = normalizeInputFrequency(inputPitchFrequency, thresholds, pitches)
-        detectedPitchesFreq.append(pitch_name.frequency)
-    return detectedPitchesFreq
+    table = getPitchTable(useScale)
+    (degrees, octaves) = table.quantize(freqFromAQList)
+    return table.frequencies(degrees, octaves)
 
 def normalizeInputFrequency(inputPitchFrequency, thresholds=None, pitches=None):
     """Return a tuple of the normalized frequency and the pitch detected."""
 
+    from music21 import pitch
+
     if ((thresholds is None and pitches is not None)
          or (thresholds is not None and pitches is None)):
         raise AudioSearchException("Cannot normalize input frequency if both thresholds and pitches are not given.")
-    elif thresholds == None:
-        (thresholds, pitches) = prepareThresholds()
+    elif thresholds is None:
+        table = getPitchTable()
+        (thresholds, pitches) = (table.thresholds, table.pitches)
 
     inputPitchLog2 = math.log(inputPitchFrequency, 2)
     (remainder, octave) = math.modf(inputPitchLog2)
@@ -129,14 +536,22 @@ def prepareThresholds(useScale=None):
     """Return a tuple of two lists consisting of the threshold values and the
     pitches of a scale."""
 
+    from music21 import scale
+
     if useScale is None:
         useScale = scale.ChromaticScale('C4')
 
     scPitches = useScale.pitches
+    return scaleThresholds([p.frequency for p in scPitches]), scPitches
+
+def scaleThresholds(frequencies):
+    """Return the list of threshold values halfway between the fractional parts
+    of the base 2 logarithm of consecutive frequencies of a scale."""
+
     scPitchesRemainder = []
 
-    for p in scPitches:
-        pLog2 = math.log(p.frequency, 2)
+    for frequency in frequencies:
+        pLog2 = math.log(frequency, 2)
         scPitchesRemainder.append(math.modf(pLog2)[0])
     scPitchesRemainder[-1] += 1
 
@@ -144,218 +559,583 @@ def prepareThresholds(useScale=None):
     for i in range(len(scPitchesRemainder) - 1):
         scPitchesThreshold.append((scPitchesRemainder[i] + scPitchesRemainder[i + 1]) / 2)
 
-    return scPitchesThreshold, scPitches
+    return scPitchesThreshold
+
+class PitchTable(object):
+    """Precomputed lookup table mapping frequencies onto the pitches of a scale."""
+
+    def __init__(self, useScale=None):
+        """Constructor. The default chromatic table is built without music21."""
+
+        if useScale is None:
+            self._pitches = None
+            self.names = list(CHROMATIC_NAMES)
+            ps = numpy.arange(60.0, 73.0)
+            frequencies = 440.0 * numpy.power(2.0, (ps - 69) / 12.0)
+            octaves = ps // 12 - 1
+        else:
+            self._pitches = useScale.pitches
+            self.names = [p.name for p in self._pitches]
+            ps = numpy.array([p.ps for p in self._pitches])
+            frequencies = [p.frequency for p in self._pitches]
+            octaves = numpy.array([p.implicitOctave for p in self._pitches])
+
+        self.thresholds = numpy.array(scaleThresholds(frequencies))
+
+        # Degrees spelled with the same name (e.g. both ends of a chromatic
+        # scale) share the same identifier
+        self.nameIds = numpy.array([self.names.index(name) for name in self.names])
+
+        # Pitch space of each degree relative to the octave it is spelled in
+        self.offsets = ps - 12 * (octaves + 1)
+
+    @property
+    def pitches(self):
+        """The music21 pitches of the scale."""
+
+        if self._pitches is None:
+            from music21 import scale
+            self._pitches = scale.ChromaticScale('C4').pitches
+        return self._pitches
+
+    def quantize(self, freqs):
+        """Return a tuple of two arrays consisting of the scale degree and the
+        octave best matching each frequency."""
+
+        freqs = numpy.asarray(freqs, dtype=numpy.float64)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            # Frequencies that cannot be analyzed are treated as rests
+            freqs = numpy.where(freqs > 0, freqs, REST_FREQUENCY)
+            freqs[~numpy.isfinite(freqs)] = REST_FREQUENCY
+            (remainders, octaves) = numpy.modf(numpy.log2(freqs))
+
+        degrees = numpy.searchsorted(self.thresholds, remainders, side='right')
+        octaves = octaves.astype(int) - 4
+        octaves[degrees == len(self.thresholds)] += 1
+        return degrees, octaves
+
+    def midi(self, degrees, octaves):
+        """Return the pitch space values of scale degrees in given octaves."""
+
+        return 12 * (numpy.asarray(octaves) + 1) + self.offsets[degrees]
+
+    def frequencies(self, degrees, octaves):
+        """Return the frequencies of scale degrees in given octaves."""
+
+        return 440.0 * numpy.power(2.0, (self.midi(degrees, octaves) - 69) / 12.0)
+
+    def pitch(self, degree, octave):
+        """Create the music21 pitch of a scale degree in a given octave."""
+
+        returnPitch = copy.deepcopy(self.pitches[degree])
+        returnPitch.octave = int(octave)
+        return returnPitch
+
+_pitchTables = {}
+
+def getPitchTable(useScale=None):
+    """Return the cached pitch table of a scale, building it on first use."""
 
-def smoothFrequencies(detectedPitchesFreq, smoothLevels=7, inPlace=True):
+    key = None if useScale is None else tuple(p.nameWithOctave for p in useScale.pitches)
+    if key not in _pitchTables:
+        _pitchTables[key] = PitchTable(useScale)
+    return _pitchTables[key]
+
+def smoothFrequencies(detectedPitchesFreq, smoothLevels=7, inPlace=True, method="mean", edges="average"):
     """Smooth the shape of the signal in order to avoid false detections of
-    the fundamental frequency."""
+    the fundamental frequency.
+
+    Every frame i is replaced by the mean (or the median) of the input frames
+    i - smoothLevels // 2 through i + (smoothLevels - 1) // 2, so the result
+    does not depend on the order in which frames are visited. The "mean"
+    method uses cumulative sums and runs in linear time regardless of
+    smoothLevels, while the "median" method is better at removing isolated
+    octave errors. With edges="average", the frames for which the window is
+    incomplete are set to the statistic of the first or last smoothLevels
+    frames; with edges="nearest", the signal is padded by repeating its first
+    and last frames."""
+
+    if method not in ("mean", "median"):
+        raise ValueError("Unknown smoothing method: %s" % method)
+    if edges not in ("average", "nearest"):
+        raise ValueError("Unknown edge handling mode: %s" % edges)
+
+    freqs = numpy.asarray(detectedPitchesFreq, dtype=numpy.float64)
+    count = len(freqs)
+    head = smoothLevels // 2
+    tail = smoothLevels - head
+    statistic = numpy.mean if method == "mean" else numpy.median
+
+    if smoothLevels <= 1 or count == 0:
+        smoothed = freqs.copy()
+    elif method == "median":
+        import scipy.ndimage
+
+        # Even windows average their two middle values, like numpy.median
+        lower = scipy.ndimage.rank_filter(freqs, (smoothLevels - 1) // 2, size=smoothLevels, mode="nearest")
+        upper = scipy.ndimage.rank_filter(freqs, smoothLevels // 2, size=smoothLevels, mode="nearest")
+        smoothed = (lower + upper) / 2.0
+    else:
+        padded = numpy.concatenate((numpy.repeat(freqs[:1], head), freqs,
+                                    numpy.repeat(freqs[-1:], tail - 1)))
+        sums = numpy.concatenate(([0.0], numpy.cumsum(padded)))
+        smoothed = (sums[smoothLevels:] - sums[:-smoothLevels]) / smoothLevels
+
+    if edges == "average" and smoothLevels > 1 and count > 0:
+        smoothed[:head] = statistic(freqs[:smoothLevels])
+        smoothed[max(0, count - tail):] = statistic(freqs[-smoothLevels:])
 
-    dpf = detectedPitchesFreq
     if inPlace == True:
-        detectedPitchesFreq = dpf
-    else:
-        detectedPitchesFreq = copy.copy(dpf)
-
-    beginning = 0.0
-    ends = 0.0
-
-    for i in range(smoothLevels):
-        beginning = beginning + float(detectedPitchesFreq[i])
-        ends = ends + detectedPitchesFreq[len(detectedPitchesFreq) - 1 - i]
-    beginning = beginning / smoothLevels
-    ends = ends / smoothLevels
-
-    for i in range(len(detectedPitchesFreq)):
-        if i < int(math.floor(smoothLevels / 2.0)):
-            detectedPitchesFreq[i] = beginning
-        elif i > len(detectedPitchesFreq) - int(math.ceil(smoothLevels / 2.0)) - 1:
-            detectedPitchesFreq[i] = ends
-        else:
-            t = 0
-            for j in range(smoothLevels):
-                t = t + detectedPitchesFreq[i + j - int(math.floor(smoothLevels / 2.0))]
-            detectedPitchesFreq[i] = t / smoothLevels
+        detectedPitchesFreq[:] = smoothed
 
-    return [int(round(fq)) for fq in detectedPitchesFreq]
+    return numpy.floor(smoothed + 0.5).astype(int)
 
 def pitchFrequenciesToObjects(detectedPitchesFreq, useScale=None):
     """Return a list of the pitches that best match the input frequencies."""
 
-    if useScale is None:
-        useScale = scale.ChromaticScale()
+    table = getPitchTable(useScale)
+    (degrees, octaves) = table.quantize(detectedPitchesFreq)
+    octaves = averageOctaves(table.nameIds[degrees], octaves)
+
+    # Frames of a run of identical pitches share a single pitch object
+    (starts, lengths) = runLengths(table.midi(degrees, octaves))
 
     detectedPitchObjects = []
-    (thresholds, pitches) = prepareThresholds(useScale)
-
-    for i in range(len(detectedPitchesFreq)):
-        inputPitchFrequency = detectedPitchesFreq[i]
-        unused_freq, pitch_name = normalizeInputFrequency(inputPitchFrequency, thresholds, pitches)
-        detectedPitchObjects.append(pitch_name)
-
-    i = 0
-    while i < len(detectedPitchObjects) - 1:
-        name = detectedPitchObjects[i].name
-        hold = i
-        tot_octave = 0
-        while i < len(detectedPitchObjects) - 1 and detectedPitchObjects[i].name == name:
-            tot_octave = tot_octave + detectedPitchObjects[i].octave
-            i = i + 1
-        tot_octave = round(tot_octave / (i - hold))
-        for j in range(i - hold):
-            detectedPitchObjects[hold + j - 1].octave = tot_octave
+    for start, length in zip(starts, lengths):
+        detectedPitchObjects.extend([table.pitch(degrees[start], octaves[start])] * length)
     return detectedPitchObjects
 
+def pitchFrequenciesToEvents(detectedPitchesFreq, useScale=None, minNoteFrames=6, minRestFrames=15):
+    """Return a list of note events segmented from the input frequencies.
+    Rests are events without a name."""
+
+    table = getPitchTable(useScale)
+    (degrees, octaves, midi) = framePitches(detectedPitchesFreq, table)
+    return pitchesToEvents(degrees, octaves, midi, table, minNoteFrames, minRestFrames)
+
+def framePitches(detectedPitchesFreq, table):
+    """Return a tuple of three arrays consisting of the scale degree, the
+    octave (averaged over runs of identical names) and the MIDI pitch of
+    every frame."""
+
+    (degrees, octaves) = table.quantize(detectedPitchesFreq)
+    octaves = averageOctaves(table.nameIds[degrees], octaves)
+    return degrees, octaves, table.midi(degrees, octaves)
+
+def pitchesToEvents(degrees, octaves, midi, table, minNoteFrames=6, minRestFrames=15, voiced=None):
+    """Return the list of note events segmented from per-frame pitches, and
+    from the silence gate of every frame, if any."""
+
+    events = []
+    for start, length, isNote in zip(*segmentFrames(midi, minNoteFrames, minRestFrames, voiced)):
+        if isNote:
+            events.append(NoteEvent(table.names[degrees[start]], int(octaves[start]),
+                                    float(midi[start]), int(start), int(length)))
+        else:
+            events.append(NoteEvent(None, None, None, int(start), int(length)))
+    return events
+
+def assignPitches(track, smoothedFrequencies, useScale=None):
+    """Set the scale degree, octave and MIDI pitch of every frame of a track
+    from its smoothed frequencies, and return the track."""
+
+    table = getPitchTable(useScale)
+    (degrees, octaves, midi) = framePitches(smoothedFrequencies, table)
+    track.degree = degrees.astype(numpy.int16)
+    track.octave = octaves.astype(numpy.int16)
+    track.midi = midi.astype(numpy.float32)
+    return track
+
+def trackToEvents(track, useScale=None, minNoteFrames=6, minRestFrames=15):
+    """Return the list of note events segmented from the assigned pitches of
+    a track."""
+
+    return pitchesToEvents(track.degree, track.octave, track.midi, getPitchTable(useScale),
+                           minNoteFrames, minRestFrames, track.voiced)
+
+def runLengths(values):
+    """Return a tuple of two arrays consisting of the start and the length of
+    each run of identical consecutive values."""
+
+    values = numpy.asarray(values)
+    starts = numpy.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = numpy.concatenate(([0], starts)) if len(values) else starts
+    lengths = numpy.diff(numpy.append(starts, len(values)))
+    return starts, lengths
+
+def averageOctaves(names, octaves):
+    """Replace the octave of the frames in each run of identical pitch names
+    by the average octave of the run.
+
+    Every frame takes the average of the run its successor belongs to, the
+    next to last frame keeps its octave and the last frame takes the average
+    of the first run."""
+
+    octaves = numpy.array(octaves, dtype=int)
+    count = len(octaves)
+    if count < 2:
+        return octaves
+
+    (starts, lengths) = runLengths(names[:-1])
+    averages = numpy.add.reduceat(octaves[:-1], starts) // lengths
+    runs = numpy.repeat(numpy.arange(len(starts)), lengths)
+
+    octaves[:count - 2] = averages[runs[1:]]
+    octaves[-1] = averages[0]
+    return octaves
+
+def segmentFrames(values, minNoteFrames=6, minRestFrames=15, voiced=None):
+    """Segment an array of per-frame pitch values into notes and rests.
+
+    Runs of identical values lasting at least minNoteFrames frames become
+    notes. Frames from shorter runs in between two notes become a rest when
+    there are at least minRestFrames of them, and are dropped otherwise. The
+    first frame of every run that follows a counted run is not counted and
+    the first frame of the signal is never part of a note.
+
+    When a boolean array of voiced frames is given, every stretch of
+    unvoiced frames is a rest, whatever its length, and the voiced stretches
+    in between are segmented on their own. Consecutive rests are joined.
+
+    Return a tuple of three arrays consisting of the first frame, the number
+    of frames and whether each event is a note or a rest."""
+
+    values = numpy.asarray(values)
+    if len(values) == 0:
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=bool)
+    if voiced is not None:
+        return _segmentGatedFrames(values, voiced, minNoteFrames, minRestFrames)
+
+    (starts, lengths) = runLengths(values)
+    if lengths[0] > 1:
+        starts = numpy.insert(starts, 1, 1)
+        lengths = numpy.insert(lengths, 0, 1)
+        lengths[1] -= 1
+
+    # A single-frame run right after a counted run is skipped entirely, so
+    # within a streak of single-frame runs every other run is counted
+    index = numpy.arange(len(lengths))
+    single = lengths == 1
+    streakStarts = single & numpy.append(True, ~single[:-1])
+    streak = numpy.maximum.accumulate(numpy.where(streakStarts, index, 0))
+    skipped = single & ((index - streak + (streak == 0)) % 2 == 0)
+
+    # Counted runs lose their first frame unless the previous run was skipped
+    offsets = numpy.append(0, numpy.where(skipped[:-1], 0, 1))
+    counted = numpy.flatnonzero(~skipped)
+    segmentStarts = (starts + offsets)[counted]
+    segmentLengths = (lengths - offsets)[counted]
+
+    # Accumulate the frames of short segments in between notes
+    notes = numpy.flatnonzero(segmentLengths >= minNoteFrames)
+    shortFrames = numpy.cumsum(numpy.where(segmentLengths >= minNoteFrames, 0, segmentLengths))
+    restLengths = numpy.diff(numpy.append(0, shortFrames[notes]))
+    firstShort = numpy.append(0, notes[:-1] + 1)[:len(notes)]
+    restStarts = segmentStarts[numpy.minimum(firstShort, len(segmentStarts) - 1)]
+
+    # Interleave the rests in front of the notes they precede
+    eventStarts = numpy.column_stack((restStarts, segmentStarts[notes])).ravel()
+    eventLengths = numpy.column_stack((restLengths, segmentLengths[notes])).ravel()
+    isNote = numpy.tile([False, True], len(notes))
+    keep = numpy.column_stack((restLengths >= minRestFrames, numpy.ones(len(notes), dtype=bool))).ravel()
+    return eventStarts[keep], eventLengths[keep], isNote[keep]
+
+def _segmentGatedFrames(values, voiced, minNoteFrames, minRestFrames):
+    eventStarts = []
+    eventLengths = []
+    isNote = []
+    (starts, lengths) = runLengths(voiced)
+    for start, length in zip(starts, lengths):
+        if voiced[start]:
+            (stretchStarts, stretchLengths, stretchIsNote) = segmentFrames(values[start:start + length],
+                                                                          minNoteFrames, minRestFrames)
+            eventStarts.append(stretchStarts + start)
+            eventLengths.append(stretchLengths)
+            isNote.append(stretchIsNote)
+        else:
+            eventStarts.append([start])
+            eventLengths.append([length])
+            isNote.append([False])
+    eventStarts = numpy.concatenate(eventStarts).astype(int)
+    eventLengths = numpy.concatenate(eventLengths).astype(int)
+    isNote = numpy.concatenate(isNote).astype(bool)
+
+    # A rest following another rest is merged into it
+    first = isNote | numpy.append(True, isNote[:-1])
+    groups = numpy.flatnonzero(first)
+    return eventStarts[groups], numpy.add.reduceat(eventLengths, groups), isNote[groups]
+
 def joinConsecutiveIdenticalPitches(detectedPitchObjects):
     """Return a tuple of two lists consisting of a list of note and rest
     objects (each of quarterLength 1.0) and a list of how many pitches were
     joined together to make that object."""
 
-    REST_FREQUENCY = 10
-    detectedPitchObjects[0].frequency = REST_FREQUENCY
+    from music21 import note
 
-    j = 0
-    good = 0
-    bad = 0
-    valid_note = False
-
-    total_notes = 0
-    total_rests = 0
+    frequencies = [p.frequency for p in detectedPitchObjects]
     notesList = []
     durationList = []
 
-    while j < len(detectedPitchObjects):
-        fr = detectedPitchObjects[j].frequency
-
-        # Detect consecutive instances of the same frequency
-        while j < len(detectedPitchObjects) and fr == detectedPitchObjects[j].frequency:
-            good = good + 1
-
-            # If more than 6 consecutive identical samples, it might be a note
-            if good >= 6:
-                valid_note = True
-
-                # If we've gone 15 or more samples without getting something constant, assume it's a rest
-                if bad >= 15:
-                    durationList.append(bad)
-                    total_rests = total_rests + 1
-                    notesList.append(note.Rest())
-                bad = 0
-            j = j + 1
-        if valid_note == True:
-            durationList.append(good)
-            total_notes = total_notes + 1
+    for start, length, isNote in zip(*segmentFrames(frequencies)):
+        if isNote:
             n = note.Note()
-            n.pitch = detectedPitchObjects[j - 1]
+            n.pitch = detectedPitchObjects[start + length - 1]
             notesList.append(n)
         else:
-            bad = bad + good
-        good = 0
-        valid_note = False
-        j = j + 1
+            notesList.append(note.Rest())
+        durationList.append(int(length))
     return notesList, durationList
 
-def notesAndDurationsToStream(notesList, durationList, removeRestsAtBeginning=True):
-    """Take a list of objects or rests and an equally long list of how long
-    each ones lasts in terms of samples and return a Stream using the information
-    from quarterLengthEstimation and quantizeDurations."""
+def eventsToNotes(events):
+    """Return a tuple of two lists consisting of a list of note and rest
+    objects and a list of how many frames each of them lasts."""
 
-    qle = quarterLengthEstimation(durationList)
-    part = stream.Part()
+    from music21 import note
 
-    for i in range(len(durationList)):
-        actualDuration = quantizeDuration(durationList[i] / qle)
-        notesList[i].quarterLength = actualDuration
-        if removeRestsAtBeginning and notesList[i].name == "rest":
-            pass
+    notesList = []
+    for event in events:
+        if event.name is None:
+            notesList.append(note.Rest())
         else:
-            part.append(notesList[i])
-            removeRestsAtBeginning = False
-
-    return part
-
-def quarterLengthEstimation(durationList, mostRepeatedQuarterLength=1.0):
-    """Take a list of lengths of notes (measured in audio samples) and try to
-    estimate what the length of a quarter note should be in this list."""
-
-    dl = copy.copy(durationList)
-    dl.append(0)
-
-    pdf, bins = histogram(dl,8.0)
-    i = len(pdf) - 1
-    while pdf[i] != max(pdf):
-        i = i - 1
-
-    qle = (bins[i] + bins[i + 1]) / 2.0
-
-    if mostRepeatedQuarterLength == 0:
-        mostRepeatedQuarterLength = 1.0
-
-    binPosition = 0 - math.log(mostRepeatedQuarterLength, 2)
-    qle = qle * math.pow(2, binPosition) # Normalize the length to a quarter note
-
-    return qle
-
-def histogram(data, bins):
-    """Partition a list into a number of bins and return the number of elements
-    in each bins and a set of elements where the first element is the start of
-    the first bin, the last element is the end of the last bin, and every remaining
-    element is the dividing point between one bin and another."""
-
-    maxValue = max(data)
-    minValue = min(data)
-    lengthEachBin = (maxValue-minValue) / bins
-
-    container = []
-    for i in range(int(bins)):
-        container.append(0)
-    for i in data:
-        count = 1
-        while i > minValue + count*lengthEachBin:
-            count += 1
-        container[count - 1] += 1
-
-    binsLimits = []
-    binsLimits.append(minValue)
-    count = 1
-    for i in range(int(bins)):
-        binsLimits.append(minValue+count*lengthEachBin)
-        count +=1
-    return container, binsLimits
-
-def quantizeDuration(length):
-    """Round an approximated quarterLength duration to better one."""
-
-    length = length * 100
-    typicalLengths = [25.00, 50.00, 100.00, 150.00, 200.00, 400.00]
-    thresholds = []
-    for i in range(len(typicalLengths) - 1):
-        thresholds.append((typicalLengths[i] + typicalLengths[i + 1]) / 2)
-
-    finalLength = typicalLengths[0]
-    for i in range(len(thresholds)):
-        threshold = thresholds[i]
-        if length > threshold:
-            finalLength = typicalLengths[i + 1]
-    return finalLength / 100
+            n = note.Note(event.name)
+            n.pitch.octave = event.octave
+            notesList.append(n)
+    durationList = [event.length for event in events]
+    return notesList, durationList
 
-def polyphonicStreamFromFiles(filenames):
-    """Generate a multi-part score using each file as a part."""
+def quantizeEvents(events, removeRestsAtBeginning=True, durationTable=None):
+    """Return a list of tuples of note events and their duration quantized to a
+    quarterLength, the same way notesAndDurationsToStream does."""
+
+    durationList = [event.length for event in events]
+    qle = quarterLengthEstimation(durationList)
+    quarterLengths = quantizeDurations(durationList, qle, durationTable)
 
-    parts = [monophonicStreamFromFile(filename) for filename in filenames]
-    score = stream.Score()
-    for part in parts:
-        score.append(part)
-    return score
+    first = 0
+    if removeRestsAtBeginning:
+        while first < len(events) and events[first].name is None:
+            first += 1
+    return [(events[i], float(quarterLengths[i])) for i in range(first, len(events))]
 
-def monophonicStreamFromFile(filename):
-    """Generate a score part from a wav file."""
+def notesAndDurationsToStream(notesList, durationList, removeRestsAtBeginning=True, durationTable=None):
+    """Take a list of objects or rests and an equally long list of how long
+    each ones lasts in terms of samples and return a Stream using the information
+    from quarterLengthEstimation and quantizeDurations."""
 
-    freqFromAQList = getFrequenciesFromAudioFile(filename, 256)
+    from music21 import stream
 
-    detectedPitchesFreq = detectPitchFrequencies(freqFromAQList)
-    detectedPitchesFreq = smoothFrequencies(detectedPitchesFreq)
+    qle = quarterLengthEstimation(durationList)
+    quarterLengths = quantizeDurations(durationList, qle, durationTable)
+
+    first = 0
+    if removeRestsAtBeginning:
+        while first < len(notesList) and notesList[first].name == "rest":
+            first += 1
+    for i in range(first, len(durationList)):
+        notesList[i].quarterLength = float(quarterLengths[i])
+
+    with collectorPaused():
+        return appendElements(stream.Part(), notesList[first:])
+
+@contextlib.contextmanager
+def collectorPaused():
+    """Pause the cyclic garbage collector. The music21 objects of a score
+    reference each other and all stay alive, so the collections triggered
+    while building it would scan them over and over without freeing any."""
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def appendElements(container, elements):
+    """Append elements to a stream one after another, like Stream.append, in a
+    single pass. Offsets are computed from the durations of the elements and
+    music21's sorting and cache updates are deferred until every element is
+    inserted, instead of being done after each of them."""
+
+    # Stream.coreInsert was named _insertCore before music21 3
+    insert = getattr(container, "coreInsert", None) or container._insertCore
+    elementsChanged = getattr(container, "coreElementsChanged", None) or container._elementsChanged
+
+    # Offsets are accumulated exactly as Stream.append does, so that triplet
+    # durations end up at identical offsets
+    offset = container.highestTime
+    for element in elements:
+        insert(offset, element, ignoreSort=True)
+        if element.duration.quarterLength != 0:
+            offset += element.duration.quarterLength
+    elementsChanged()
+    return container
+
+def polyphonicStreamFromFiles(filenames, workers=1, options=None, cache=None):
+    """Generate a multi-part score using each file as a part."""
 
-    detectedPitchObjects = pitchFrequenciesToObjects(detectedPitchesFreq)
-    (notesList, durationList) = joinConsecutiveIdenticalPitches(detectedPitchObjects)
-    part = notesAndDurationsToStream(notesList, durationList, removeRestsAtBeginning=True)
-    return part
+    from music21 import stream
+
+    events = [None] * len(filenames)
+    for index, fileEvents in transcribeFiles(filenames, workers, options, cache):
+        events[index] = fileEvents
+
+    with collectorPaused():
+        return appendElements(stream.Score(), [eventsToStream(fileEvents) for fileEvents in events])
+
+def transcribeFiles(filenames, workers=1, options=None, cache=None, profiler=None, progress=None, cancel=None):
+    """Yield a tuple of the index and the note events of each file as soon as
+    it is transcribed. Files are distributed over a pool of worker processes
+    when more than one worker is requested. Results are looked up in and
+    stored to a TranscriptionCache when one is given. Stage measurements,
+    including those of worker processes, are added to the profiler. The
+    options may be a list giving the options of each file.
+
+    progress is called with the index of a file and the fraction of it that
+    is transcribed, after every batch of frames when files are transcribed
+    in this process and once they are done otherwise. Setting the cancel
+    event raises TranscriptionCancelled within a batch of frames, or within
+    a tenth of a second when worker processes are used, which are then
+    terminated mid-file."""
+
+    if not isinstance(options, list):
+        options = [options or TranscriptionOptions()] * len(filenames)
+    if profiler is None:
+        profiler = profiling.NULL_PROFILER
+    # Worker processes only profile when traceMemory is not None
+    traceMemory = profiler.traceMemory if profiler is not profiling.NULL_PROFILER else None
+
+    keys = {}
+    pending = []
+    for index, filename in enumerate(filenames):
+        if cache is not None:
+            with profiler.stage("cache", filename) as stage:
+                keys[index] = cache.key(filename, options[index].signature())
+                cached = cache.get(keys[index])
+                stage.notes = None if cached is None else len(cached)
+            if cached is not None:
+                if progress is not None:
+                    progress(index, 1.0)
+                yield index, [NoteEvent(*event) for event in cached]
+                continue
+        pending.append((index, filename, options[index], traceMemory))
+
+    for index, events, records in _transcribePending(pending, workers, profiler, progress, cancel):
+        for record in records:
+            profiler.add(record)
+        if cache is not None:
+            cache.put(keys[index], [tuple(event) for event in events])
+        yield index, events
+
+def _transcribePending(pending, workers, profiler, progress=None, cancel=None):
+    """Transcribe (index, filename, options, traceMemory) tuples, in parallel
+    if needed. Yield (index, events, records) tuples, where records are the
+    stage measurements of worker processes."""
+
+    if workers is None or workers < 1:
+        workers = multiprocessing.cpu_count()
+    # The workers of a single file analyze segments of it instead
+    analysisWorkers = workers if len(pending) == 1 else 1
+    workers = min(workers, len(pending))
+
+    if workers <= 1:
+        for (index, filename, options, unused_traceMemory) in pending:
+            fileProgress = None
+            if progress is not None:
+                fileProgress = lambda fraction, index=index: progress(index, fraction)
+            yield index, monophonicEventsFromFile(filename, options, profiler, fileProgress, cancel,
+                                                  analysisWorkers), []
+        return
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = pool.imap_unordered(_indexedEventsFromFile, pending)
+        for unused_file in pending:
+            result = _nextResult(results, cancel)
+            if progress is not None:
+                progress(result[0], 1.0)
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def _indexedEventsFromFile(args):
+    """Worker entry point of transcribeFiles."""
+
+    (index, filename, options, traceMemory) = args
+    if traceMemory is None:
+        return index, monophonicEventsFromFile(filename, options), []
+    profiler = profiling.StageProfiler(traceMemory=traceMemory)
+    return index, monophonicEventsFromFile(filename, options, profiler), profiler.records
+
+def monophonicStreamFromFile(filename, options=None, workers=1):
+    """Generate a score part from a wav file, analyzed in segments by the
+    given number of worker processes if it is long."""
+
+    return eventsToStream(monophonicEventsFromFile(filename, options, workers=workers))
+
+def monophonicEventsFromFile(filename, options=None, profiler=None, progress=None, cancel=None, workers=1):
+    """Return the list of note events transcribed from a wav file. The time
+    spent in every stage is measured when a StageProfiler is given. Progress,
+    cancellation and the worker processes analyzing segments of long files
+    work as in analyzeAudioFile. Notes spanning segments are segmented from
+    the frames of the whole file, along with octaves and tempo."""
+
+    if options is None:
+        options = TranscriptionOptions()
+    if profiler is None:
+        profiler = profiling.NULL_PROFILER
+
+    with profiler.stage("frequencies", filename) as stage:
+        track = analyzeAudioFile(filename, options, progress, cancel, workers)
+        stage.frames = len(track)
+
+    return eventsFromTrack(track, options, profiler, filename)
+
+def eventsFromTrack(track, options=None, profiler=None, filename=None):
+    """Return the list of note events segmented from the FrameTrack of a
+    file, which is given its pitches. The time spent in every stage is
+    measured when a StageProfiler is given."""
+
+    if options is None:
+        options = TranscriptionOptions()
+    if profiler is None:
+        profiler = profiling.NULL_PROFILER
+
+    with profiler.stage("pitches", filename) as stage:
+        detectedPitchesFreq = detectPitchFrequencies(track.frequency, options.useScale)
+        stage.frames = len(track)
+
+    with profiler.stage("smoothing", filename) as stage:
+        detectedPitchesFreq = smoothFrequencies(detectedPitchesFreq, options.smoothLevels,
+                                                method=options.smoothingMethod)
+        stage.frames = len(track)
+
+    with profiler.stage("segmentation", filename) as stage:
+        assignPitches(track, detectedPitchesFreq, options.useScale)
+        events = trackToEvents(track, options.useScale, options.minNoteFrames, options.minRestFrames)
+        stage.frames = len(track)
+        stage.notes = sum(1 for event in events if event.midi is not None)
+
+    return events
+
+def eventsToStream(events, durationTable=None):
+    """Generate a score part from a list of note events. Durations are
+    quantized before the notes are created, so each note gets its duration
+    once, and the part is built in bulk."""
+
+    from music21 import note, stream
+
+    with collectorPaused():
+        elements = []
+        for event, quarterLength in quantizeEvents(events, True, durationTable):
+            if event.name is None:
+                elements.append(note.Rest(quarterLength=quarterLength))
+            else:
+                # The octave is set separately, since names such as E-
+                # followed by a negative octave cannot be parsed back
+                n = note.Note(event.name, quarterLength=quarterLength)
+                n.pitch.octave = event.octave
+                elements.append(n)
+        return appendElements(stream.Part(), elements)
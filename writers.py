@@ -0,0 +1,219 @@
+# The MIT License (MIT)
+
+# Copyright (c) 2015 Joel Robichaud
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import struct
+from xml.etree import ElementTree
+
+# Writers serializing transcribed parts without building a music21 score. A
+# part is a list of (event, quarterLength) tuples as returned by
+# transcribe.quantizeEvents, where rests are events whose name is None.
+
+TICKS_PER_QUARTER = 480
+DIVISIONS = 48 # Divisions of a quarter note, dotted and triplet values fit exactly
+MEASURE_DIVISIONS = 4 * DIVISIONS # Parts are written in 4/4
+
+# Note values in divisions, with their type, number of dots and whether they
+# are triplets, from the longest to the shortest
+NOTE_VALUES = [(192, "whole", 0, False), (144, "half", 1, False), (96, "half", 0, False),
+               (72, "quarter", 1, False), (64, "half", 0, True), (48, "quarter", 0, False),
+               (36, "eighth", 1, False), (32, "quarter", 0, True), (24, "eighth", 0, False),
+               (18, "16th", 1, False), (16, "eighth", 0, True), (12, "16th", 0, False),
+               (8, "16th", 0, True), (6, "32nd", 0, False), (4, "32nd", 0, True),
+               (2, "64th", 0, True)]
+
+STEP_SEMITONES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+ACCIDENTAL_ALTERS = {"#": 1, "-": -1, "~": 0.5, "`": -0.5}
+
+def _variableLength(value):
+    """Encode a value as a MIDI variable-length quantity."""
+
+    encoded = [value & 0x7F]
+    value >>= 7
+    while value:
+        encoded.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return struct.pack("%iB" % len(encoded), *encoded)
+
+def _metaEvent(kind, data):
+    return b"\x00\xff" + struct.pack("B", kind) + _variableLength(len(data)) + data
+
+def _tempoTrack(tempo):
+    """Return the MIDI track holding the tempo and the time signature."""
+
+    microseconds = int(round(60000000.0 / tempo))
+    return (_metaEvent(0x51, struct.pack(">I", microseconds)[1:])
+            + _metaEvent(0x58, struct.pack("4B", 4, 2, 24, 8))
+            + _metaEvent(0x2F, b""))
+
+def _noteTrack(part, name, channel):
+    """Return the MIDI track of a part."""
+
+    messages = []
+    offset = 0.0
+    for event, quarterLength in part:
+        if event.name is not None:
+            key = min(127, max(0, int(round(event.midi))))
+            messages.append((int(round(offset * TICKS_PER_QUARTER)), 1, 0x90 | channel, key, 90))
+            messages.append((int(round((offset + quarterLength) * TICKS_PER_QUARTER)), 0, 0x80 | channel, key, 0))
+        offset += quarterLength
+
+    # Note offs sort before note ons happening at the same tick
+    messages.sort()
+    data = [_metaEvent(0x03, name.encode("utf-8"))]
+    tick = 0
+    for time, unused_order, status, key, velocity in messages:
+        data.append(_variableLength(time - tick) + struct.pack("3B", status, key, velocity))
+        tick = time
+    data.append(_metaEvent(0x2F, b""))
+    return b"".join(data)
+
+def writeMidi(parts, filename, tempo=120):
+    """Write parts to a Standard MIDI File with one track per part."""
+
+    channels = [channel for channel in range(16) if channel != 9] # Skip percussion
+    tracks = [_tempoTrack(tempo)]
+    for i, part in enumerate(parts):
+        tracks.append(_noteTrack(part, "Part %i" % (i + 1), channels[i % len(channels)]))
+
+    with open(filename, 'wb') as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), TICKS_PER_QUARTER))
+        for track in tracks:
+            f.write(b"MTrk" + struct.pack(">I", len(track)) + track)
+
+def _noteValues(duration):
+    """Split a duration in divisions into a list of note values."""
+
+    values = []
+    while duration > 0:
+        fitting = [value for value in NOTE_VALUES if value[0] <= duration]
+        # Durations that are not a multiple of the shortest value keep it as type
+        value = fitting[0] if fitting else (duration,) + NOTE_VALUES[-1][1:]
+        values.append(value)
+        duration -= value[0]
+    return values
+
+def _noteElement(event, value, tieStart, tieStop):
+    """Create the MusicXML note element of (part of) an event."""
+
+    (duration, noteType, dots, triplet) = value
+    element = ElementTree.Element("note")
+    if event.name is None:
+        ElementTree.SubElement(element, "rest")
+    else:
+        pitch = ElementTree.SubElement(element, "pitch")
+        ElementTree.SubElement(pitch, "step").text = event.name[0]
+        alter = sum(ACCIDENTAL_ALTERS.get(c, 0) for c in event.name[1:])
+        if alter:
+            ElementTree.SubElement(pitch, "alter").text = "%g" % alter
+        ElementTree.SubElement(pitch, "octave").text = str(event.octave)
+    ElementTree.SubElement(element, "duration").text = str(duration)
+    for tieType, tied in (("stop", tieStop), ("start", tieStart)):
+        if tied:
+            ElementTree.SubElement(element, "tie", type=tieType)
+    ElementTree.SubElement(element, "voice").text = "1"
+    ElementTree.SubElement(element, "type").text = noteType
+    for i in range(dots):
+        ElementTree.SubElement(element, "dot")
+    if triplet:
+        modification = ElementTree.SubElement(element, "time-modification")
+        ElementTree.SubElement(modification, "actual-notes").text = "3"
+        ElementTree.SubElement(modification, "normal-notes").text = "2"
+    if tieStart or tieStop:
+        notations = ElementTree.SubElement(element, "notations")
+        for tieType, tied in (("stop", tieStop), ("start", tieStart)):
+            if tied:
+                ElementTree.SubElement(notations, "tied", type=tieType)
+    return element
+
+def _attributesElement(part):
+    """Create the attributes of the first measure of a part."""
+
+    attributes = ElementTree.Element("attributes")
+    ElementTree.SubElement(attributes, "divisions").text = str(DIVISIONS)
+    key = ElementTree.SubElement(attributes, "key")
+    ElementTree.SubElement(key, "fifths").text = "0"
+    time = ElementTree.SubElement(attributes, "time")
+    ElementTree.SubElement(time, "beats").text = "4"
+    ElementTree.SubElement(time, "beat-type").text = "4"
+
+    # Use a bass clef for parts lying mostly below middle C
+    pitches = [event.midi for event, unused_length in part if event.name is not None]
+    low = pitches and sum(pitches) / len(pitches) < 60
+    clef = ElementTree.SubElement(attributes, "clef")
+    ElementTree.SubElement(clef, "sign").text = "F" if low else "G"
+    ElementTree.SubElement(clef, "line").text = "4" if low else "2"
+    return attributes
+
+def _partElement(part, partId):
+    """Create the MusicXML part element of a part, splitting notes across
+    barlines with ties."""
+
+    element = ElementTree.Element("part", id=partId)
+    measure = ElementTree.SubElement(element, "measure", number="1")
+    measure.append(_attributesElement(part))
+    position = 0
+
+    for event, quarterLength in part:
+        remaining = int(round(quarterLength * DIVISIONS))
+        first = True
+        while remaining > 0:
+            if position == MEASURE_DIVISIONS:
+                measure = ElementTree.SubElement(element, "measure", number=str(len(element) + 1))
+                position = 0
+            chunk = min(remaining, MEASURE_DIVISIONS - position)
+            values = _noteValues(chunk)
+            for i, value in enumerate(values):
+                last = remaining == chunk and i == len(values) - 1
+                tied = event.name is not None
+                measure.append(_noteElement(event, value, tied and not last, tied and not first))
+                first = False
+            position += chunk
+            remaining -= chunk
+
+    if position == 0:
+        rest = ElementTree.SubElement(measure, "note")
+        ElementTree.SubElement(rest, "rest", measure="yes")
+        ElementTree.SubElement(rest, "duration").text = str(MEASURE_DIVISIONS)
+    return element
+
+def writeMusicXml(parts, filename, composer="Polyscribe"):
+    """Write parts to an uncompressed MusicXML (score-partwise) file."""
+
+    score = ElementTree.Element("score-partwise", version="3.0")
+    identification = ElementTree.SubElement(score, "identification")
+    ElementTree.SubElement(identification, "creator", type="composer").text = composer
+
+    partList = ElementTree.SubElement(score, "part-list")
+    for i in range(len(parts)):
+        scorePart = ElementTree.SubElement(partList, "score-part", id="P%i" % (i + 1))
+        ElementTree.SubElement(scorePart, "part-name").text = "Part %i" % (i + 1)
+    for i, part in enumerate(parts):
+        score.append(_partElement(part, "P%i" % (i + 1)))
+
+    with open(filename, 'wb') as f:
+        f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                b'<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 3.0 Partwise//EN" '
+                b'"http://www.musicxml.org/dtds/partwise.dtd">\n')
+        content = ElementTree.tostring(score, encoding="utf-8")
+        if content.startswith(b"<?xml"):
+            content = content.split(b"?>", 1)[1].lstrip()
+        f.write(content)